@@ -139,6 +139,19 @@ DATABASES = {
 #     }
 
 
+# Cache
+# File-based so all waitress/gunicorn workers on the host share the same entries
+# (finance settings/chart of accounts, report caches). Tests use a private in-memory cache.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': RUNTIME_DIR / 'cache',
+    }
+}
+if 'test' in sys.argv:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -311,11 +311,11 @@ class ValunshyAI:
 
     def _handle_predictive(self, query):
         # Brain logic for prediction
-        week_ago = self.today - datetime.timedelta(days=7)
-        two_weeks_ago = self.today - datetime.timedelta(days=14)
-        
-        last_week = Invoice.objects.filter(created_at__date__gte=week_ago).aggregate(Sum('grand_total'))['grand_total__sum'] or 0
-        prev_week = Invoice.objects.filter(created_at__date__gte=two_weeks_ago, created_at__date__lt=week_ago).aggregate(Sum('grand_total'))['grand_total__sum'] or 0
+        # Last 14 days in one grouped query (shared with the dashboards)
+        from sales.services import daily_sales_trend
+        trend = daily_sales_trend(days=14, end_date=self.today)
+        prev_week = sum(row['sales'] for row in trend[:7])
+        last_week = sum(row['sales'] for row in trend[7:])
         
         html = "🔮 <b>التحليل التوقعي الذكي:</b><br>"
         
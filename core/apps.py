@@ -36,3 +36,6 @@ class CoreConfig(AppConfig):
             if hasattr(v, 'regex') and (isinstance(v, validators.UnicodeUsernameValidator) or isinstance(v, validators.ASCIIUsernameValidator)):
                 v.regex = compiled_regex
                 v.message = relaxed_message
+
+        # 3. Cache invalidation signals
+        import core.signals
@@ -1,46 +1,60 @@
 from core.models import GoldPrice, Carat
+from core.services import GoldPriceService
 from manufacturing.models import ManufacturingOrder
+from django.core.cache import cache
 from django.db.models import Sum, Count, Q
 from django.db.models.functions import Coalesce as DbCoalesce
+from django.utils.functional import SimpleLazyObject
 from decimal import Decimal
 
+# Cache keys - cleared by core/signals.py on GoldPrice / ManufacturingOrder changes
+GOLD_PRICES_CACHE_KEY = 'core:live_gold_prices'
+MFG_STATS_CACHE_KEY = 'core:global_mfg_stats'
+CACHE_TIMEOUT = 300
+
+
+def get_live_gold_prices():
+    """آخر سعر لكل عيار نشط (استعلام واحد عبر Subquery بدل مسح جدول الأسعار)"""
+    prices = cache.get(GOLD_PRICES_CACHE_KEY)
+    if prices is None:
+        latest_ids = Carat.objects.filter(is_active=True).annotate(
+            latest_id=GoldPriceService.latest_price_subquery()
+        ).values('latest_id')
+        prices = list(
+            GoldPrice.objects.filter(pk__in=latest_ids).select_related('carat').order_by('carat__name')
+        )
+        cache.set(GOLD_PRICES_CACHE_KEY, prices, CACHE_TIMEOUT)
+    return prices
+
+
+def get_global_mfg_stats():
+    """إحصائيات التصنيع الجارية (تجميع واحد)"""
+    mfg_stats = cache.get(MFG_STATS_CACHE_KEY)
+    if mfg_stats is None:
+        # Exclude completed and cancelled
+        mfg_stats_aggr = ManufacturingOrder.objects.exclude(
+            status__in=['completed', 'cancelled', 'draft']
+        ).aggregate(
+            total_count=Count('id'),
+            casting_count=Count('id', filter=Q(status='casting')),
+            crafting_count=Count('id', filter=Q(status='crafting')),
+            polishing_count=Count('id', filter=Q(status='polishing')),
+            total_weight=DbCoalesce(Sum('input_weight'), Decimal('0'))
+        )
+        mfg_stats = {
+            'count': mfg_stats_aggr['total_count'],
+            'casting': mfg_stats_aggr['casting_count'],
+            'crafting': mfg_stats_aggr['crafting_count'],
+            'polishing': mfg_stats_aggr['polishing_count'],
+            'weight': mfg_stats_aggr['total_weight'],
+        }
+        cache.set(MFG_STATS_CACHE_KEY, mfg_stats, CACHE_TIMEOUT)
+    return mfg_stats
+
+
 def gold_prices(request):
-    # 1. Get latest price per carat (SQLite Compatible)
-    # Fetch all prices ordered by updated_at desc
-    all_prices = GoldPrice.objects.filter(carat__is_active=True).select_related('carat').order_by('-updated_at')
-    
-    # Deduplicate in Python (keep first occurrence per carat)
-    seen_carats = set()
-    prices = []
-    for p in all_prices:
-        if p.carat_id not in seen_carats:
-            prices.append(p)
-            seen_carats.add(p.carat_id)
-    
-    # Sort by name for consistency
-    prices.sort(key=lambda x: x.carat.name)
-    
-    # 2. Consolidated Manufacturing Stats in ONE aggregation
-    # Exclude completed and cancelled
-    mfg_stats_aggr = ManufacturingOrder.objects.exclude(
-        status__in=['completed', 'cancelled', 'draft']
-    ).aggregate(
-        total_count=Count('id'),
-        casting_count=Count('id', filter=Q(status='casting')),
-        crafting_count=Count('id', filter=Q(status='crafting')),
-        polishing_count=Count('id', filter=Q(status='polishing')),
-        total_weight=DbCoalesce(Sum('input_weight'), Decimal('0'))
-    )
-    
-    mfg_stats = {
-        'count': mfg_stats_aggr['total_count'],
-        'casting': mfg_stats_aggr['casting_count'],
-        'crafting': mfg_stats_aggr['crafting_count'],
-        'polishing': mfg_stats_aggr['polishing_count'],
-        'weight': mfg_stats_aggr['total_weight'],
-    }
-    
+    # Lazy: nothing is queried unless the template actually uses the variable
     return {
-        'live_gold_prices': prices,
-        'global_mfg_stats': mfg_stats
+        'live_gold_prices': SimpleLazyObject(get_live_gold_prices),
+        'global_mfg_stats': SimpleLazyObject(get_global_mfg_stats),
     }
@@ -13,7 +13,7 @@ def gm_dashboard(request):
     from finance.treasury_models import Treasury
     from manufacturing.models import ManufacturingOrder
     from core.user_management import ActivityLog
-    from core.models import GoldPrice
+    from inventory.services import inventory_valuation
     
     today = timezone.now().date()
     
@@ -29,12 +29,9 @@ def gm_dashboard(request):
     available_items = Item.objects.filter(status='available')
     inventory_count = available_items.count()
     
-    # Calculate inventory value (simplified)
-    inventory_value = 0
-    for item in available_items.select_related('carat'):
-        price = GoldPrice.objects.filter(carat=item.carat).first()
-        if price:
-            inventory_value += float(item.net_gold_weight) * float(price.price_per_gram)
+    # Inventory value (gold at latest price per carat) - computed in the database
+    valuation = inventory_valuation(request=request)
+    inventory_value = valuation['gold_value']
     
     # Treasury Balance
     treasury_balance = Treasury.objects.aggregate(total=Sum('cash_balance'))['total'] or 0
@@ -125,16 +122,10 @@ def gm_dashboard(request):
             })
 
     # Historical Sales for Chart (Last 7 days)
-    sales_chart_labels = []
-    sales_chart_data = []
-    for i in range(6, -1, -1):
-        date = today - timedelta(days=i)
-        day_total = Invoice.objects.filter(
-            created_at__date=date,
-            status='confirmed'
-        ).aggregate(total=Sum('grand_total'))['total'] or 0
-        sales_chart_labels.append(date.strftime('%Y-%m-%d'))
-        sales_chart_data.append(float(day_total))
+    from sales.services import daily_sales_trend
+    trend = daily_sales_trend(days=7, end_date=today)
+    sales_chart_labels = [row['date'].strftime('%Y-%m-%d') for row in trend]
+    sales_chart_data = [float(row['sales']) for row in trend]
 
     # Top Selling Items
     from django.db.models import Count
@@ -152,6 +143,7 @@ def gm_dashboard(request):
         'today_sales': today_sales,
         'today_invoices_count': today_invoices_count,
         'inventory_value': inventory_value,
+        'inventory_valuation': valuation,
         'inventory_count': inventory_count,
         'treasury_balance': treasury_balance,
         'pending_orders': pending_orders,
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.services import BalanceService
+
+class Command(BaseCommand):
+    help = 'Rebuild the unified HoldingBalance rows from the legacy *_18/_21/_24 balance columns'
+
+    def handle(self, *args, **options):
+        self.stdout.write("Rebuilding holding balances...")
+        count = BalanceService.rebuild_holdings()
+        self.stdout.write(self.style.SUCCESS(f"Created {count} holding balance rows."))
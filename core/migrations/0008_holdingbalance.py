@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:44
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+HOLDERS = [
+    ('manufacturing', 'Workshop', 'workshop'),
+    ('finance', 'Treasury', 'treasury'),
+    ('crm', 'Customer', 'customer'),
+    ('crm', 'Supplier', 'supplier'),
+]
+BUCKET_COLUMNS = {'gold': 'gold_balance', 'filings': 'filings_balance', 'scrap': 'scrap_balance'}
+
+
+def backfill_holdings(apps, schema_editor):
+    Carat = apps.get_model('core', 'Carat')
+    HoldingBalance = apps.get_model('core', 'HoldingBalance')
+
+    # Legacy columns are attributed to the first carat whose purity matches (0.750 -> 18)
+    canonical = {}
+    for carat in Carat.objects.order_by('id'):
+        canonical.setdefault(str(int(round((carat.purity or 0) * 24))), carat.id)
+
+    rows = []
+    for app_label, model_name, holder_type in HOLDERS:
+        model = apps.get_model(app_label, model_name)
+        columns = {f.attname for f in model._meta.concrete_fields}
+        for holder in model.objects.all():
+            for bucket, prefix in BUCKET_COLUMNS.items():
+                for suffix in ('18', '21', '24'):
+                    column = f'{prefix}_{suffix}'
+                    weight = getattr(holder, column, None) if column in columns else None
+                    if weight and canonical.get(suffix):
+                        rows.append(HoldingBalance(holder_type=holder_type, holder_id=holder.pk,
+                                                   carat_id=canonical[suffix], bucket=bucket, weight=weight))
+            if 'gold_casting_balance' in columns and holder.gold_casting_balance:
+                rows.append(HoldingBalance(holder_type=holder_type, holder_id=holder.pk,
+                                           bucket='casting', weight=holder.gold_casting_balance))
+    HoldingBalance.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_carat_base_weight'),
+        ('crm', '0009_suppliertransaction'),
+        ('finance', '0032_accountdailybalance'),
+        ('manufacturing', '0047_manufacturingorder_item_category'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HoldingBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('holder_type', models.CharField(choices=[('workshop', 'ورشة'), ('treasury', 'خزينة'), ('customer', 'عميل'), ('supplier', 'مورد')], max_length=20, verbose_name='نوع الجهة')),
+                ('holder_id', models.PositiveIntegerField(verbose_name='رقم الجهة')),
+                ('bucket', models.CharField(choices=[('gold', 'ذهب'), ('filings', 'برادة'), ('scrap', 'خسية'), ('casting', 'ذهب للسبك')], default='gold', max_length=10, verbose_name='نوع الرصيد')),
+                ('weight', models.DecimalField(decimal_places=3, default=0, max_digits=15, verbose_name='الوزن (جرام)')),
+                ('carat', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='holdings', to='core.carat', verbose_name='العيار')),
+            ],
+            options={
+                'verbose_name': 'رصيد ذهب موحد',
+                'verbose_name_plural': 'أرصدة الذهب الموحدة',
+                'indexes': [models.Index(fields=['bucket', 'holder_type', 'carat'], name='core_holding_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('holder_type', 'holder_id', 'carat', 'bucket'), name='core_holding_unique'), models.UniqueConstraint(condition=models.Q(('carat__isnull', True)), fields=('holder_type', 'holder_id', 'bucket'), name='core_holding_unique_nocarat')],
+            },
+        ),
+        migrations.RunPython(backfill_holdings, migrations.RunPython.noop),
+    ]
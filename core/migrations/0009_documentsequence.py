@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_holdingbalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=50, unique=True, verbose_name='البادئة')),
+                ('last_value', models.PositiveBigIntegerField(default=0, verbose_name='آخر رقم مستخدم')),
+            ],
+            options={
+                'verbose_name': 'تسلسل ترقيم',
+                'verbose_name_plural': 'إعدادات - تسلسلات الترقيم',
+            },
+        ),
+    ]
@@ -10,6 +10,11 @@ class Carat(models.Model):
     def __str__(self):
         return self.name
 
+    @property
+    def karat(self):
+        """العيار بالقيراط محسوباً من نسبة النقاء (0.750 → 18، 0.875 → 21)"""
+        return int(round((self.purity or 0) * 24))
+
     class Meta:
         verbose_name = "عيار"
         verbose_name_plural = "إعدادات - العيارات"
@@ -80,3 +85,57 @@ class Notification(models.Model):
 
     def __str__(self):
         return self.title
+
+class HoldingBalance(models.Model):
+    """
+    رصيد موحد لكل (جهة، عيار، نوع رصيد).
+    يحل محل أعمدة _18/_21/_24 في الورش والخزائن والعملاء والموردين، والتي تبقى
+    كنسخة متوافقة يتم تحديثها مع كل حركة (core.services.BalanceService).
+    """
+    HOLDER_CHOICES = [
+        ('workshop', 'ورشة'),
+        ('treasury', 'خزينة'),
+        ('customer', 'عميل'),
+        ('supplier', 'مورد'),
+    ]
+    BUCKET_CHOICES = [
+        ('gold', 'ذهب'),
+        ('filings', 'برادة'),
+        ('scrap', 'خسية'),
+        ('casting', 'ذهب للسبك'),
+    ]
+    holder_type = models.CharField("نوع الجهة", max_length=20, choices=HOLDER_CHOICES)
+    holder_id = models.PositiveIntegerField("رقم الجهة")
+    carat = models.ForeignKey(Carat, on_delete=models.PROTECT, null=True, blank=True, related_name='holdings', verbose_name="العيار")
+    bucket = models.CharField("نوع الرصيد", max_length=10, choices=BUCKET_CHOICES, default='gold')
+    weight = models.DecimalField("الوزن (جرام)", max_digits=15, decimal_places=3, default=0)
+
+    class Meta:
+        verbose_name = "رصيد ذهب موحد"
+        verbose_name_plural = "أرصدة الذهب الموحدة"
+        constraints = [
+            models.UniqueConstraint(fields=['holder_type', 'holder_id', 'carat', 'bucket'], name='core_holding_unique'),
+            # Carat-less buckets (casting) - NULLs are distinct in a plain unique index
+            models.UniqueConstraint(fields=['holder_type', 'holder_id', 'bucket'], condition=models.Q(carat__isnull=True), name='core_holding_unique_nocarat'),
+        ]
+        indexes = [
+            models.Index(fields=['bucket', 'holder_type', 'carat'], name='core_holding_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_holder_type_display()} #{self.holder_id} - {self.carat or '-'} ({self.get_bucket_display()}): {self.weight}"
+
+class DocumentSequence(models.Model):
+    """
+    عداد ترقيم المستندات (فواتير، أوامر، باركود) - صف واحد لكل بادئة.
+    يتم الحجز عبر core.services.SequenceService بتحديث ذري على الصف.
+    """
+    prefix = models.CharField("البادئة", max_length=50, unique=True)
+    last_value = models.PositiveBigIntegerField("آخر رقم مستخدم", default=0)
+
+    class Meta:
+        verbose_name = "تسلسل ترقيم"
+        verbose_name_plural = "إعدادات - تسلسلات الترقيم"
+
+    def __str__(self):
+        return f"{self.prefix}: {self.last_value}"
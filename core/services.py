@@ -0,0 +1,311 @@
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Greatest
+from .models import GoldPrice, Carat, HoldingBalance, DocumentSequence
+
+class GoldPriceService:
+    """
+    Latest gold price per carat.
+    The {carat_id: price_per_gram} map is kept in Django's cache (cleared by
+    core/signals.py on GoldPrice/Carat changes) and memoized on the request.
+    """
+    CACHE_KEY = 'core:gold_price_map'
+    CACHE_TIMEOUT = 300
+    REQUEST_ATTR = '_gold_price_map'
+
+    @staticmethod
+    def latest_price_subquery(field='pk', as_of=None):
+        """Subquery returning `field` of the newest GoldPrice for OuterRef('pk') (a Carat)"""
+        prices = GoldPrice.objects.filter(carat=OuterRef('pk'))
+        if as_of is not None:
+            prices = prices.filter(updated_at__date__lte=as_of)
+        return Subquery(prices.order_by('-updated_at', '-id').values(field)[:1])
+
+    @staticmethod
+    def price_map(request=None):
+        """{carat_id: latest price_per_gram} for every carat that has a price"""
+        if request is not None and hasattr(request, GoldPriceService.REQUEST_ATTR):
+            return getattr(request, GoldPriceService.REQUEST_ATTR)
+
+        prices = cache.get(GoldPriceService.CACHE_KEY)
+        if prices is None:
+            prices = GoldPriceService.price_map_as_of(None)
+            cache.set(GoldPriceService.CACHE_KEY, prices, GoldPriceService.CACHE_TIMEOUT)
+
+        if request is not None:
+            setattr(request, GoldPriceService.REQUEST_ATTR, prices)
+        return prices
+
+    @staticmethod
+    def price_map_as_of(as_of):
+        """Uncached {carat_id: price} using the last price recorded on or before `as_of` (None = now)"""
+        rows = Carat.objects.annotate(
+            latest_price=GoldPriceService.latest_price_subquery('price_per_gram', as_of=as_of)
+        ).values_list('id', 'latest_price')
+        return {carat_id: price for carat_id, price in rows if price is not None}
+
+    @staticmethod
+    def price_for(carat, request=None):
+        """Latest price per gram for a Carat (instance or id), or None if not set"""
+        carat_id = getattr(carat, 'pk', carat)
+        return GoldPriceService.price_map(request).get(carat_id)
+
+    @staticmethod
+    def invalidate():
+        cache.delete(GoldPriceService.CACHE_KEY)
+
+
+class BalanceService:
+    """
+    Atomic balance mutations for Workshop / Treasury / RawMaterial style rows.
+    Deltas are applied in the database with F() expressions on the touched
+    columns only, so concurrent postings never overwrite each other.
+
+    Per-carat gold is kept in HoldingBalance (holder, carat, bucket); the old
+    *_18/_21/_24 columns are mirrored by apply_holding() for compatibility.
+    """
+    CARAT_SUFFIXES = ('18', '21', '24')
+    BUCKET_COLUMNS = {'gold': 'gold_balance', 'filings': 'filings_balance', 'scrap': 'scrap_balance'}
+    CASTING_COLUMN = 'gold_casting_balance'
+    HOLDER_MODELS = ('manufacturing.Workshop', 'finance.Treasury', 'crm.Customer', 'crm.Supplier')
+    SUFFIX_CACHE_KEY = 'core:carat_suffix_map'
+    CACHE_TIMEOUT = 3600
+
+    @staticmethod
+    def carat_suffix_map():
+        """{carat_id: '18' / '21' / '24'} resolved from Carat.purity (cached, cleared on Carat changes)"""
+        suffixes = cache.get(BalanceService.SUFFIX_CACHE_KEY)
+        if suffixes is None:
+            suffixes = {}
+            for carat in Carat.objects.only('id', 'purity').order_by('id'):
+                if str(carat.karat) in BalanceService.CARAT_SUFFIXES:
+                    suffixes[carat.id] = str(carat.karat)
+            cache.set(BalanceService.SUFFIX_CACHE_KEY, suffixes, BalanceService.CACHE_TIMEOUT)
+        return suffixes
+
+    @staticmethod
+    def canonical_carats():
+        """{'18': carat_id, ...} - the carat (lowest id) that legacy column balances are attributed to"""
+        canonical = {}
+        for carat_id, suffix in sorted(BalanceService.carat_suffix_map().items()):
+            canonical.setdefault(suffix, carat_id)
+        return canonical
+
+    @staticmethod
+    def carat_suffix(carat):
+        """'18' / '21' / '24' for a Carat (instance or id) based on its purity, or None"""
+        if carat is None:
+            return None
+        if isinstance(carat, Carat):
+            suffix = str(carat.karat)
+            return suffix if suffix in BalanceService.CARAT_SUFFIXES else None
+        return BalanceService.carat_suffix_map().get(carat)
+
+    @staticmethod
+    def carat_field(prefix, carat):
+        """e.g. carat_field('gold_balance', carat) -> 'gold_balance_21', or None for unsupported carats"""
+        suffix = BalanceService.carat_suffix(carat)
+        return f'{prefix}_{suffix}' if suffix else None
+
+    @staticmethod
+    def _has_column(model, name):
+        return any(f.attname == name for f in model._meta.concrete_fields)
+
+    @staticmethod
+    def legacy_column(holder, bucket, carat):
+        """Legacy column mirroring (bucket, carat) on this holder, or None if it has none"""
+        if bucket == 'casting':
+            name = BalanceService.CASTING_COLUMN
+        else:
+            name = BalanceService.carat_field(BalanceService.BUCKET_COLUMNS[bucket], carat)
+        return name if name and BalanceService._has_column(type(holder), name) else None
+
+    @staticmethod
+    def lock(instance, fields=None):
+        """SELECT ... FOR UPDATE the row and reload `fields` on the instance (must run inside atomic())"""
+        row = type(instance).objects.select_for_update().filter(pk=instance.pk)
+        values = row.values(*fields).get() if fields else row.values().get()
+        for field, value in values.items():
+            setattr(instance, field, value)
+        return instance
+
+    @staticmethod
+    def apply(instance, deltas, lock=False, floor_zero=(), refresh=True):
+        """
+        Add `deltas` ({field: amount}) to the row of `instance` in one UPDATE.
+        - lock: take a row lock first (for callers that read-then-write).
+        - floor_zero: fields that must not go below zero after the change.
+        - refresh: reload the changed fields on the instance afterwards.
+        """
+        deltas = {field: amount for field, amount in deltas.items() if amount}
+        if not deltas or instance is None:
+            return instance
+
+        updates = {}
+        for field, amount in deltas.items():
+            expr = F(field) + amount
+            if field in floor_zero:
+                expr = Greatest(expr, Value(Decimal('0')))
+            updates[field] = expr
+
+        model = type(instance)
+        with transaction.atomic():
+            if lock:
+                BalanceService.lock(instance, fields=list(deltas))
+            model.objects.filter(pk=instance.pk).update(**updates)
+            if refresh:
+                values = model.objects.filter(pk=instance.pk).values(*deltas).get()
+                for field, value in values.items():
+                    setattr(instance, field, value)
+        return instance
+
+    @staticmethod
+    def _post_holding(holder_type, holder_id, carat_id, bucket, amount, floor_zero=False):
+        row, _ = HoldingBalance.objects.get_or_create(
+            holder_type=holder_type, holder_id=holder_id, carat_id=carat_id, bucket=bucket
+        )
+        expr = F('weight') + amount
+        if floor_zero:
+            expr = Greatest(expr, Value(Decimal('0')))
+        HoldingBalance.objects.filter(pk=row.pk).update(weight=expr)
+
+    @staticmethod
+    def apply_holding(holder, carat, buckets, lock=False, floor_zero=()):
+        """
+        Add {bucket: amount} of one carat to `holder` (Workshop / Treasury / Customer / Supplier).
+        Updates the HoldingBalance rows and mirrors the change onto the legacy per-carat columns.
+        'casting' is carat-less and ignores `carat`.
+        """
+        buckets = {bucket: amount for bucket, amount in buckets.items() if amount}
+        if not buckets or holder is None:
+            return holder
+
+        carat_id = getattr(carat, 'pk', carat)
+        columns = {}
+        floor_columns = []
+        for bucket, amount in buckets.items():
+            column = BalanceService.legacy_column(holder, bucket, carat)
+            if column:
+                columns[column] = amount
+                if bucket in floor_zero:
+                    floor_columns.append(column)
+
+        with transaction.atomic():
+            BalanceService.apply(holder, columns, lock=lock, floor_zero=floor_columns)
+            for bucket, amount in buckets.items():
+                BalanceService._post_holding(
+                    holder._meta.model_name, holder.pk, None if bucket == 'casting' else carat_id,
+                    bucket, amount, floor_zero=bucket in floor_zero,
+                )
+        return holder
+
+    @staticmethod
+    def sync_from_columns(holder):
+        """
+        Bring this holder's HoldingBalance rows in line with values written straight to
+        the legacy columns (admin edits, objects.create, Customer.update_balances ...).
+        Differences are attributed to the canonical carat of each column.
+        """
+        holder_type = holder._meta.model_name
+        suffixes = BalanceService.carat_suffix_map()
+        canonical = BalanceService.canonical_carats()
+
+        held = {}
+        for carat_id, bucket, weight in HoldingBalance.objects.filter(
+            holder_type=holder_type, holder_id=holder.pk
+        ).values_list('carat_id', 'bucket', 'weight'):
+            key = (bucket, None if bucket == 'casting' else suffixes.get(carat_id))
+            held[key] = held.get(key, Decimal('0')) + weight
+
+        targets = [(bucket, suffix, f'{prefix}_{suffix}', canonical.get(suffix))
+                   for bucket, prefix in BalanceService.BUCKET_COLUMNS.items()
+                   for suffix in BalanceService.CARAT_SUFFIXES]
+        targets.append(('casting', None, BalanceService.CASTING_COLUMN, None))
+
+        for bucket, suffix, column, carat_id in targets:
+            if not BalanceService._has_column(type(holder), column):
+                continue
+            if bucket != 'casting' and carat_id is None:
+                continue
+            diff = Decimal(str(getattr(holder, column) or 0)) - held.get((bucket, suffix), Decimal('0'))
+            if diff:
+                BalanceService._post_holding(holder_type, holder.pk, carat_id, bucket, diff)
+
+    @staticmethod
+    def rebuild_holdings():
+        """Recreate every HoldingBalance row from the legacy columns; returns the row count"""
+        from django.apps import apps
+        with transaction.atomic():
+            HoldingBalance.objects.all().delete()
+            for label in BalanceService.HOLDER_MODELS:
+                for holder in apps.get_model(label).objects.all():
+                    BalanceService.sync_from_columns(holder)
+            return HoldingBalance.objects.count()
+
+    @staticmethod
+    def totals_by_carat(bucket='gold', holder_type=None, queryset=None):
+        """{carat_id: total weight} across holders in one GROUP BY"""
+        rows = HoldingBalance.objects.all() if queryset is None else queryset
+        rows = rows.filter(bucket=bucket)
+        if holder_type:
+            rows = rows.filter(holder_type=holder_type)
+        return dict(rows.values('carat_id').annotate(w=Sum('weight')).order_by().values_list('carat_id', 'w'))
+
+    @staticmethod
+    def totals_by_karat(bucket='gold', holder_type=None, queryset=None):
+        """{'18': w, '21': w, '24': w} (other carats are ignored) for the legacy dashboard cards"""
+        suffixes = BalanceService.carat_suffix_map()
+        totals = {suffix: Decimal('0') for suffix in BalanceService.CARAT_SUFFIXES}
+        for carat_id, weight in BalanceService.totals_by_carat(bucket, holder_type, queryset).items():
+            if carat_id in suffixes:
+                totals[suffixes[carat_id]] += weight or 0
+        return totals
+
+    @staticmethod
+    def invalidate():
+        cache.delete(BalanceService.SUFFIX_CACHE_KEY)
+
+
+class SequenceService:
+    """
+    Gap-tolerant, collision-free document numbers from one DocumentSequence row per prefix.
+    A reservation is a single UPDATE last_value = last_value + n; the row stays locked by that
+    UPDATE until the surrounding transaction commits, so concurrent callers queue on the row
+    instead of racing on the target table.
+    """
+
+    @staticmethod
+    def reserve(prefix, count=1, seed=None):
+        """
+        Reserve `count` consecutive numbers for `prefix` and return them as a range.
+        `seed` (int or callable) gives the last number already used when the counter row
+        is first created, so sequences continue after numbers issued before the counter existed.
+        """
+        with transaction.atomic():
+            updated = DocumentSequence.objects.filter(prefix=prefix).update(last_value=F('last_value') + count)
+            if not updated:
+                start = (seed() if callable(seed) else seed) or 0
+                try:
+                    with transaction.atomic():
+                        DocumentSequence.objects.create(prefix=prefix, last_value=start + count)
+                except IntegrityError:
+                    # Another transaction created the row first - take the next block from it
+                    DocumentSequence.objects.filter(prefix=prefix).update(last_value=F('last_value') + count)
+            last = DocumentSequence.objects.filter(prefix=prefix).values_list('last_value', flat=True).get()
+        return range(last - count + 1, last + 1)
+
+    @staticmethod
+    def next_value(prefix, seed=None):
+        return SequenceService.reserve(prefix, 1, seed)[0]
+
+    @staticmethod
+    def next_code(prefix, width=6, separator='-', seed=None):
+        """e.g. next_code('INV-MOB') -> 'INV-MOB-000042'"""
+        return f"{prefix}{separator}{SequenceService.next_value(prefix, seed):0{width}d}"
+
+    @staticmethod
+    def reserve_codes(prefix, count, width=6, separator='-', seed=None):
+        """A block of `count` codes for bulk creation"""
+        return [f"{prefix}{separator}{n:0{width}d}" for n in SequenceService.reserve(prefix, count, seed)]
@@ -0,0 +1,40 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.core.cache import cache
+from manufacturing.models import ManufacturingOrder, Workshop
+from finance.treasury_models import Treasury
+from crm.models import Customer, Supplier
+from .models import GoldPrice, Carat, HoldingBalance
+from .context_processors import GOLD_PRICES_CACHE_KEY, MFG_STATS_CACHE_KEY
+from .services import GoldPriceService, BalanceService
+
+@receiver(post_save, sender=GoldPrice)
+@receiver(post_delete, sender=GoldPrice)
+@receiver(post_save, sender=Carat)
+@receiver(post_delete, sender=Carat)
+def invalidate_gold_prices_cache(sender, **kwargs):
+    """مسح كاش أسعار الذهب عند تحديث الأسعار أو العيارات"""
+    cache.delete(GOLD_PRICES_CACHE_KEY)
+    GoldPriceService.invalidate()
+    BalanceService.invalidate()
+
+@receiver(post_save, sender=ManufacturingOrder)
+@receiver(post_delete, sender=ManufacturingOrder)
+def invalidate_mfg_stats_cache(sender, **kwargs):
+    """مسح كاش إحصائيات التصنيع عند تعديل أوامر التصنيع"""
+    cache.delete(MFG_STATS_CACHE_KEY)
+
+BALANCE_HOLDERS = (Workshop, Treasury, Customer, Supplier)
+
+def sync_holding_balances(sender, instance, update_fields=None, **kwargs):
+    """مزامنة الأرصدة الموحدة عند حفظ أعمدة الأرصدة القديمة مباشرة"""
+    if update_fields is not None and not any('balance' in f for f in update_fields):
+        return
+    BalanceService.sync_from_columns(instance)
+
+def delete_holding_balances(sender, instance, **kwargs):
+    HoldingBalance.objects.filter(holder_type=instance._meta.model_name, holder_id=instance.pk).delete()
+
+for holder_model in BALANCE_HOLDERS:
+    post_save.connect(sync_holding_balances, sender=holder_model, dispatch_uid=f'sync_holdings_{holder_model._meta.label}')
+    post_delete.connect(delete_holding_balances, sender=holder_model, dispatch_uid=f'delete_holdings_{holder_model._meta.label}')
@@ -1,3 +1,117 @@
-from django.test import TestCase
+from django.test import TestCase, RequestFactory
+from django.core.cache import cache
+from decimal import Decimal
+from core.models import Carat, GoldPrice
+from core.context_processors import gold_prices
 
-# Create your tests here.
+
+class GoldPricesContextProcessorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/')
+        self.c21 = Carat.objects.create(name="21K", purity=Decimal('0.8750'))
+        self.c18 = Carat.objects.create(name="18K", purity=Decimal('0.7500'))
+        GoldPrice.objects.create(carat=self.c21, price_per_gram=Decimal('3000'))
+        GoldPrice.objects.create(carat=self.c21, price_per_gram=Decimal('3100'))
+        GoldPrice.objects.create(carat=self.c18, price_per_gram=Decimal('2600'))
+
+    def test_is_lazy(self):
+        with self.assertNumQueries(0):
+            gold_prices(self.request)
+
+    def test_latest_price_per_carat_is_cached(self):
+        prices = list(gold_prices(self.request)['live_gold_prices'])
+        self.assertEqual([p.price_per_gram for p in prices], [Decimal('2600'), Decimal('3100')])
+        self.assertEqual(gold_prices(self.request)['global_mfg_stats']['count'], 0)
+        with self.assertNumQueries(0):
+            list(gold_prices(self.request)['live_gold_prices'])
+            gold_prices(self.request)['global_mfg_stats']['count']
+
+    def test_saving_price_invalidates_cache(self):
+        list(gold_prices(self.request)['live_gold_prices'])
+        GoldPrice.objects.create(carat=self.c18, price_per_gram=Decimal('2700'))
+        prices = list(gold_prices(self.request)['live_gold_prices'])
+        self.assertEqual(prices[0].price_per_gram, Decimal('2700'))
+
+
+class GoldPriceServiceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.c21 = Carat.objects.create(name="21K", purity=Decimal('0.8750'))
+        self.c18 = Carat.objects.create(name="18K", purity=Decimal('0.7500'), is_active=False)
+        GoldPrice.objects.create(carat=self.c21, price_per_gram=Decimal('3000'))
+        GoldPrice.objects.create(carat=self.c21, price_per_gram=Decimal('3100'))
+        GoldPrice.objects.create(carat=self.c18, price_per_gram=Decimal('2600'))
+
+    def test_price_map_is_cached_and_memoized(self):
+        from core.services import GoldPriceService
+        request = RequestFactory().get('/')
+        self.assertEqual(GoldPriceService.price_map(request), {self.c21.id: Decimal('3100'), self.c18.id: Decimal('2600')})
+        with self.assertNumQueries(0):
+            self.assertEqual(GoldPriceService.price_for(self.c21), Decimal('3100'))
+            self.assertIsNone(GoldPriceService.price_for(999))
+
+    def test_price_save_invalidates_map(self):
+        from core.services import GoldPriceService
+        GoldPriceService.price_map()
+        GoldPrice.objects.create(carat=self.c21, price_per_gram=Decimal('3200'))
+        self.assertEqual(GoldPriceService.price_for(self.c21.id), Decimal('3200'))
+
+
+class HoldingBalanceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        from manufacturing.models import Workshop
+        self.c21 = Carat.objects.create(name="21K", purity=Decimal('0.8750'))
+        self.c21_alt = Carat.objects.create(name="عيار 21", purity=Decimal('0.8750'))
+        self.c14 = Carat.objects.create(name="14K", purity=Decimal('0.5833'))
+        self.ws = Workshop.objects.create(name="ورشة", gold_balance_21=Decimal('10'))
+
+    def _holdings(self):
+        from core.models import HoldingBalance
+        return {(h.carat_id, h.bucket): h.weight for h in HoldingBalance.objects.filter(holder_type='workshop', holder_id=self.ws.pk)}
+
+    def test_direct_column_write_is_synced(self):
+        self.assertEqual(self._holdings(), {(self.c21.id, 'gold'): Decimal('10')})
+
+    def test_apply_holding_mirrors_legacy_columns(self):
+        from core.services import BalanceService
+        BalanceService.apply_holding(self.ws, self.c21_alt, {'gold': Decimal('5'), 'filings': Decimal('1')})
+        BalanceService.apply_holding(self.ws, self.c14, {'gold': Decimal('3')})
+        self.ws.refresh_from_db()
+        self.assertEqual(self.ws.gold_balance_21, Decimal('15'))
+        self.assertEqual(self.ws.filings_balance_21, Decimal('1'))
+        self.assertEqual(self._holdings(), {
+            (self.c21.id, 'gold'): Decimal('10'),
+            (self.c21_alt.id, 'gold'): Decimal('5'),
+            (self.c21_alt.id, 'filings'): Decimal('1'),
+            (self.c14.id, 'gold'): Decimal('3'),
+        })
+        # A later full save of the same values must not double count the second 21K carat
+        self.ws.save()
+        self.assertEqual(self._holdings()[(self.c21.id, 'gold')], Decimal('10'))
+
+    def test_totals_are_grouped(self):
+        from core.services import BalanceService
+        BalanceService.apply_holding(self.ws, self.c14, {'gold': Decimal('3')})
+        with self.assertNumQueries(1):
+            totals = BalanceService.totals_by_carat('gold', 'workshop')
+        self.assertEqual(totals, {self.c21.id: Decimal('10'), self.c14.id: Decimal('3')})
+        self.assertEqual(BalanceService.totals_by_karat('gold', 'workshop')['21'], Decimal('10'))
+        self.assertEqual(BalanceService.rebuild_holdings(), 1)
+
+
+class SequenceServiceTests(TestCase):
+    def test_reserve_blocks_are_consecutive(self):
+        from core.services import SequenceService
+        self.assertEqual(SequenceService.next_code('INV-MOB'), 'INV-MOB-000001')
+        self.assertEqual(list(SequenceService.reserve('INV-MOB', 3)), [2, 3, 4])
+        self.assertEqual(SequenceService.reserve_codes('ORD', 2, width=3), ['ORD-001', 'ORD-002'])
+
+    def test_seed_is_used_only_when_counter_is_created(self):
+        from core.services import SequenceService
+        seeds = []
+        seed = lambda: seeds.append(1) or 41
+        self.assertEqual(SequenceService.next_value('AUTO-261017', seed=seed), 42)
+        self.assertEqual(SequenceService.next_value('AUTO-261017', seed=seed), 43)
+        self.assertEqual(len(seeds), 1)
@@ -6,7 +6,8 @@ from django.utils import timezone
 from sales.models import Invoice
 from inventory.models import Item, Branch
 from manufacturing.models import ManufacturingOrder, Workshop, WorkshopSettlement, CostAllocation
-from core.models import GoldPrice, Notification
+from core.models import GoldPrice, Notification, HoldingBalance
+from core.services import BalanceService
 from finance.treasury_models import Treasury
 import datetime
 
@@ -20,7 +21,7 @@ def home_dashboard(request):
     
     invoices_today = Invoice.objects.filter(created_at__date=today, status='confirmed')
     total_sales_today = invoices_today.aggregate(Sum('grand_total'))['grand_total__sum'] or 0
-    total_profit_today = sum(inv.total_profit for inv in invoices_today)
+    total_profit_today = invoices_today.aggregate(Sum('total_profit'))['total_profit__sum'] or 0
     
     
     # Calculate % increase (vs yesterday)
@@ -40,13 +41,10 @@ def home_dashboard(request):
     raw_material_weight = RawMaterial.objects.aggregate(Sum('current_weight'))['current_weight__sum'] or 0
     
     # Include Treasury Gold in Total System Weight
-    treasury_gold = Treasury.objects.aggregate(
-        g18=Sum('gold_balance_18'),
-        g21=Sum('gold_balance_21'),
-        g24=Sum('gold_balance_24'),
-        casting=Sum('gold_casting_balance')
-    )
-    t_gold_weight = (treasury_gold['g18'] or 0) + (treasury_gold['g21'] or 0) + (treasury_gold['g24'] or 0) + (treasury_gold['casting'] or 0)
+    treasury_gold = list(HoldingBalance.objects.filter(
+        holder_type='treasury', bucket__in=['gold', 'casting']
+    ).values('bucket', 'carat__name').annotate(w=Sum('weight')).order_by())
+    t_gold_weight = sum(row['w'] or 0 for row in treasury_gold)
 
     # Total Weight Display (Includes Treasury Assets)
     total_inventory_weight = finished_weight + raw_material_weight + t_gold_weight
@@ -77,18 +75,12 @@ def home_dashboard(request):
     # 6. CHARTS DATA PREPARATION
     
     # A. Sales Trend (Last 7 Days)
-    dates = []
-    sales_values = []
-    profit_values = []
-    for i in range(6, -1, -1):
-        d = today - datetime.timedelta(days=i)
-        dates.append(d.strftime('%Y-%m-%d')) # Label
-        val_invoices = Invoice.objects.filter(created_at__date=d, status='confirmed')
-        val = val_invoices.aggregate(Sum('grand_total'))['grand_total__sum'] or 0
-        sales_values.append(float(val))
-        
-        profit_val = sum(inv.total_profit for inv in val_invoices)
-        profit_values.append(float(profit_val))
+    # One grouped query (profit computed in SQL)
+    from sales.services import daily_sales_trend
+    trend = daily_sales_trend(days=7, end_date=today)
+    dates = [row['date'].strftime('%Y-%m-%d') for row in trend] # Label
+    sales_values = [float(row['sales']) for row in trend]
+    profit_values = [float(row['profit']) for row in trend]
     
 
     # B. Inventory Breakdown by Carat (Items + Treasury)
@@ -103,21 +95,12 @@ def home_dashboard(request):
         w = float(i['total_weight'])
         dist_map[c_name] = dist_map.get(c_name, 0) + w
         
-    # 2. Add Treasury (Using the `treasury_gold` aggregate calculated earlier)
-    # Ensure keys match your Carat names in DB, typically "عيار 18", "عيار 21" or English. Assuming Arabic based on user language.
-    # Note: If carats are English in DB (e.g. "21K"), these keys might need adjustment.
-    # Given the previous context, we will add generic keys if they don't exist or map to likely names.
-    if treasury_gold['g18'] and treasury_gold['g18'] > 0:
-        dist_map['عيار 18'] = dist_map.get('عيار 18', 0) + float(treasury_gold['g18'])
-        
-    if treasury_gold['g21'] and treasury_gold['g21'] > 0:
-        dist_map['عيار 21'] = dist_map.get('عيار 21', 0) + float(treasury_gold['g21'])
-        
-    if treasury_gold['g24'] and treasury_gold['g24'] > 0:
-        dist_map['عيار 24'] = dist_map.get('عيار 24', 0) + float(treasury_gold['g24'])
-
-    if treasury_gold['casting'] and treasury_gold['casting'] > 0:
-         dist_map['ذهب كسر/سبك'] = dist_map.get('ذهب كسر/سبك', 0) + float(treasury_gold['casting'])
+    # 2. Add Treasury (Using the `treasury_gold` holdings grouped by carat earlier)
+    # Holdings are keyed by the real Carat, so names always match the item rows above.
+    for row in treasury_gold:
+        if row['w'] and row['w'] > 0:
+            c_name = 'ذهب كسر/سبك' if row['bucket'] == 'casting' else row['carat__name']
+            dist_map[c_name] = dist_map.get(c_name, 0) + float(row['w'])
 
     carat_labels = list(dist_map.keys())
     carat_values = list(dist_map.values())
@@ -153,20 +136,24 @@ def home_dashboard(request):
             avg_scrap = total_scrap_pct / count
 
     # Workshops Summaries
-    total_workshop_gold_18 = float(workshops.aggregate(Sum('gold_balance_18'))['gold_balance_18__sum'] or 0)
-    total_workshop_gold_21 = float(workshops.aggregate(Sum('gold_balance_21'))['gold_balance_21__sum'] or 0)
-    total_workshop_gold_24 = float(workshops.aggregate(Sum('gold_balance_24'))['gold_balance_24__sum'] or 0)
+    workshop_gold = BalanceService.totals_by_karat('gold', 'workshop')
+    total_workshop_gold_18 = float(workshop_gold['18'])
+    total_workshop_gold_21 = float(workshop_gold['21'])
+    total_workshop_gold_24 = float(workshop_gold['24'])
     total_workshop_gold_combined = total_workshop_gold_18 + total_workshop_gold_21 + total_workshop_gold_24
     total_workshop_labor = float(workshops.aggregate(Sum('labor_balance'))['labor_balance__sum'] or 0)
 
     # Workshop Gold Intake (Last 7 Days)
+    week_days = [today - datetime.timedelta(days=i) for i in range(6, -1, -1)]
+    intake_map = {
+        (row['workshop_id'], row['date']): row['w']
+        for row in WorkshopSettlement.objects.filter(
+            settlement_type='gold_payment', date__gte=week_days[0], date__lte=today
+        ).values('workshop_id', 'date').annotate(w=Sum('weight')).order_by()
+    }
     workshop_gold_data = []
     for ws in workshops:
-        ws_daily_weights = []
-        for i in range(6, -1, -1):
-            d = today - datetime.timedelta(days=i)
-            w = WorkshopSettlement.objects.filter(workshop=ws, settlement_type='gold_payment', date=d).aggregate(Sum('weight'))['weight__sum'] or 0
-            ws_daily_weights.append(float(w))
+        ws_daily_weights = [float(intake_map.get((ws.id, d)) or 0) for d in week_days]
         workshop_gold_data.append({
             'name': ws.name,
             'data': ws_daily_weights
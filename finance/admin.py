@@ -3,6 +3,7 @@ from .models import Account, JournalEntry, LedgerEntry, FinanceSettings, FiscalY
 # Import treasury admin to register all treasury models
 from . import treasury_admin
 from core.admin_mixins import ExportImportMixin
+from .services import DailyBalanceService
 
 class LedgerEntryInline(admin.TabularInline):
     model = LedgerEntry
@@ -93,6 +94,29 @@ class JournalEntryAdmin(ExportImportMixin, admin.ModelAdmin):
         return obj.ledger_entries.count()
     entry_count.short_description = "عدد البنود"
 
+    # --- مزامنة الأرصدة اليومية عند التعديل اليدوي ---
+    def save_model(self, request, obj, form, change):
+        obj._old_balance_keys = DailyBalanceService.keys_for_journal(obj.pk) if change else set()
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        obj = form.instance
+        keys = getattr(obj, '_old_balance_keys', set()) | DailyBalanceService.keys_for_journal(obj.pk)
+        DailyBalanceService.resync(keys)
+
+    def delete_model(self, request, obj):
+        keys = DailyBalanceService.keys_for_journal(obj.pk)
+        super().delete_model(request, obj)
+        DailyBalanceService.resync(keys)
+
+    def delete_queryset(self, request, queryset):
+        keys = set()
+        for pk in queryset.values_list('pk', flat=True):
+            keys |= DailyBalanceService.keys_for_journal(pk)
+        super().delete_queryset(request, queryset)
+        DailyBalanceService.resync(keys)
+
 @admin.register(FinanceSettings)
 class FinanceSettingsAdmin(ExportImportMixin, admin.ModelAdmin):
     list_display = ('id', 'cash_account', 'sales_revenue_account', 'inventory_gold_account')
@@ -0,0 +1,22 @@
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from finance.services import TreasuryCloseService
+
+class Command(BaseCommand):
+    help = 'Close the daily report of every active treasury (run nightly, e.g. from cron / Task Scheduler)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day to close YYYY-MM-DD (default: today)')
+        parser.add_argument('--chunk-size', type=int, default=TreasuryCloseService.CHUNK_SIZE,
+                            help='Treasuries closed per transaction')
+
+    def handle(self, *args, **options):
+        day = None
+        if options['date']:
+            try:
+                day = datetime.date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError("Invalid --date, expected YYYY-MM-DD")
+
+        count = TreasuryCloseService.close_day(day, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Closed {count} treasury reports."))
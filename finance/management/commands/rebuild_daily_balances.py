@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from finance.services import DailyBalanceService
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-account daily balance rollup from the raw ledger and verify it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only verify the rollup against the ledger, do not rebuild')
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            self.stdout.write("Rebuilding daily account balances...")
+            count = DailyBalanceService.rebuild()
+            self.stdout.write(f"Created {count} daily balance rows.")
+
+        mismatches = DailyBalanceService.verify()
+        if mismatches:
+            for m in mismatches[:20]:
+                self.stdout.write(self.style.WARNING(
+                    f"Account #{m['account_id']} on {m['date']}: ledger={m['ledger']} rollup={m['rollup']}"
+                ))
+            raise CommandError(f"{len(mismatches)} daily balance rows do not match the ledger.")
+
+        self.stdout.write(self.style.SUCCESS("Daily balances match the ledger."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from finance.services import TreasuryLedgerService
+from finance.treasury_models import Treasury
+
+class Command(BaseCommand):
+    help = 'Recompute the balance-after columns of every treasury transaction from running sums'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--treasury', type=int, action='append', help='Only this treasury id (repeatable)')
+
+    def handle(self, *args, **options):
+        treasuries = Treasury.objects.all()
+        if options['treasury']:
+            treasuries = treasuries.filter(pk__in=options['treasury'])
+
+        self.stdout.write("Recomputing treasury running balances...")
+        with transaction.atomic():
+            count = TreasuryLedgerService.rebuild(treasuries.select_for_update())
+        self.stdout.write(self.style.SUCCESS(f"Updated {count} transactions."))
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:24
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_daily_balances(apps, schema_editor):
+    LedgerEntry = apps.get_model('finance', 'LedgerEntry')
+    AccountDailyBalance = apps.get_model('finance', 'AccountDailyBalance')
+    totals = LedgerEntry.objects.values('account_id', 'journal_entry__date').annotate(
+        s_debit=Coalesce(Sum('debit'), Decimal('0')),
+        s_credit=Coalesce(Sum('credit'), Decimal('0')),
+        s_gold_debit=Coalesce(Sum('gold_debit'), Decimal('0')),
+        s_gold_credit=Coalesce(Sum('gold_credit'), Decimal('0')),
+    ).order_by()
+    AccountDailyBalance.objects.bulk_create([
+        AccountDailyBalance(
+            account_id=r['account_id'], date=r['journal_entry__date'],
+            debit=r['s_debit'], credit=r['s_credit'],
+            gold_debit=r['s_gold_debit'], gold_credit=r['s_gold_credit'],
+        )
+        for r in totals
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0031_alter_treasurytransaction_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountDailyBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='التاريخ')),
+                ('debit', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='مدين (نقد)')),
+                ('credit', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='دائن (نقد)')),
+                ('gold_debit', models.DecimalField(decimal_places=3, default=0, max_digits=15, verbose_name='مدين (ذهب)')),
+                ('gold_credit', models.DecimalField(decimal_places=3, default=0, max_digits=15, verbose_name='دائن (ذهب)')),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_balances', to='finance.account', verbose_name='الحساب')),
+            ],
+            options={
+                'verbose_name': 'رصيد يومي لحساب',
+                'verbose_name_plural': 'الأرصدة اليومية للحسابات',
+                'indexes': [models.Index(fields=['date', 'account'], name='finance_adb_date_acc_idx')],
+                'unique_together': {('account', 'date')},
+            },
+        ),
+        migrations.RunPython(backfill_daily_balances, migrations.RunPython.noop),
+    ]
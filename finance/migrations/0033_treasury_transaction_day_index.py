@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:08
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_documentsequence'),
+        ('finance', '0032_accountdailybalance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='treasurytransaction',
+            index=models.Index(fields=['treasury', 'date', 'transaction_type'], name='fin_trx_treasury_date_type_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_documentsequence'),
+        ('finance', '0033_treasury_transaction_day_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='treasurytransaction',
+            name='balance_after_gold_18',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=15, verbose_name='رصيد ذهب 18 بعد الحركة'),
+        ),
+        migrations.AddField(
+            model_name='treasurytransaction',
+            name='balance_after_gold_21',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=15, verbose_name='رصيد ذهب 21 بعد الحركة'),
+        ),
+        migrations.AddField(
+            model_name='treasurytransaction',
+            name='balance_after_gold_24',
+            field=models.DecimalField(decimal_places=3, default=0, max_digits=15, verbose_name='رصيد ذهب 24 بعد الحركة'),
+        ),
+        migrations.AddIndex(
+            model_name='treasurytransaction',
+            index=models.Index(fields=['treasury', 'date', 'created_at', 'id'], name='fin_trx_treasury_running_idx'),
+        ),
+    ]
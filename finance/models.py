@@ -75,6 +75,27 @@ class LedgerEntry(models.Model):
     def __str__(self):
         return f"{self.account.name} | D: {self.debit} C: {self.credit}"
 
+class AccountDailyBalance(models.Model):
+    """مجاميع الحركة اليومية لكل حساب (تُحدث تلقائياً مع كل قيد)"""
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='daily_balances', verbose_name="الحساب")
+    date = models.DateField("التاريخ")
+
+    debit = models.DecimalField("مدين (نقد)", max_digits=15, decimal_places=2, default=0)
+    credit = models.DecimalField("دائن (نقد)", max_digits=15, decimal_places=2, default=0)
+    gold_debit = models.DecimalField("مدين (ذهب)", max_digits=15, decimal_places=3, default=0)
+    gold_credit = models.DecimalField("دائن (ذهب)", max_digits=15, decimal_places=3, default=0)
+
+    class Meta:
+        verbose_name = "رصيد يومي لحساب"
+        verbose_name_plural = "الأرصدة اليومية للحسابات"
+        unique_together = ('account', 'date')
+        indexes = [
+            models.Index(fields=['date', 'account'], name='finance_adb_date_acc_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.account.code} | {self.date}"
+
 class FinanceSettings(models.Model):
     """ Singleton model to store default accounting mappings """
     cash_account = models.ForeignKey(Account, on_delete=models.SET_NULL, null=True, related_name='default_cash', verbose_name="حساب النقدية")
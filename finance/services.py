@@ -1,6 +1,13 @@
 from django.db import transaction
-from .models import JournalEntry, LedgerEntry, FinanceSettings, Account
+from collections import defaultdict
+from django.db.models import Case, DecimalField, Q, Sum, F, Value, When, Window
+from django.db.models.functions import Coalesce
+from .models import JournalEntry, LedgerEntry, FinanceSettings, Account, AccountDailyBalance
+from django.utils import timezone
+from django.core.cache import cache
 from decimal import Decimal
+import datetime
+import time
 
 class FinanceService:
     @staticmethod
@@ -14,58 +21,782 @@ class FinanceService:
         3. Credit Gold Inventory (Gold Cost / Weight)
         4. Credit VAT Payable (VAT Amount)
         """
-        settings = FinanceSettings.objects.get(pk=1)
-        
-        # 1. Create Journal Entry Header
-        journal = JournalEntry.objects.create(
+        settings = FinanceLookup.settings()
+        if settings is None:
+            raise FinanceSettings.DoesNotExist("FinanceSettings is not configured")
+        total_weight = sum(item.sold_weight for item in invoice.items.all())
+
+        # Revenue is the balancing figure (labor + stones - discounts) so the entry always balances
+        revenue_amount = invoice.grand_total - invoice.total_gold_value - invoice.total_tax
+
+        lines = [
+            # Debit Cash (Full Amount)
+            {'account': settings.cash_account, 'debit': invoice.grand_total},
+            # Credit Gold Inventory (Cost of Gold) - we track weight too
+            {'account': settings.inventory_gold_account, 'credit': invoice.total_gold_value, 'gold_credit': total_weight},
+            # Credit Sales Revenue
+            {'account': settings.sales_revenue_account, 'credit': revenue_amount},
+        ]
+        if invoice.total_tax > 0:
+            lines.append({'account': settings.vat_account, 'credit': invoice.total_tax})
+
+        # Sold weight leaves inventory without a gold counter-leg, so only cash must balance
+        return JournalPoster.post(
             reference=f"INV-{invoice.invoice_number}",
-            description=f"Sales Invoice for customer {invoice.customer.name if invoice.customer else 'Guest'}"
+            description=f"Sales Invoice for customer {invoice.customer.name if invoice.customer else 'Guest'}",
+            lines=lines,
+            check_gold=False,
+            update_balances=True,
         )
 
-        # 2. Entry: Cash Debit
-        LedgerEntry.objects.create(
-            journal_entry=journal,
-            account=settings.cash_account,
-            debit=invoice.grand_total,
-            credit=0
+
+class FinanceLookup:
+    """
+    Shared cache for FinanceSettings and the chart of accounts (by code).
+    Stored in Django's cache so every worker sees the same entries; cleared by
+    post_save/post_delete on FinanceSettings and Account (see finance/signals.py).
+
+    Cached objects are read-only snapshots: use them for FKs/ids, never call .save() on them.
+    """
+    SETTINGS_KEY = 'finance:settings'
+    ACCOUNTS_KEY = 'finance:accounts_by_code'
+    TIMEOUT = 60 * 60
+
+    @staticmethod
+    def settings():
+        """FinanceSettings with the default accounts loaded in one query (or None)"""
+        cached = cache.get(FinanceLookup.SETTINGS_KEY)
+        if cached is None:
+            cached = FinanceSettings.objects.select_related(
+                'cash_account', 'sales_revenue_account', 'inventory_gold_account',
+                'cost_of_gold_account', 'vat_account',
+            ).first() or False  # False = cached "not configured"
+            cache.set(FinanceLookup.SETTINGS_KEY, cached, FinanceLookup.TIMEOUT)
+        return cached or None
+
+    @staticmethod
+    def accounts():
+        """{code: Account} for the whole chart of accounts"""
+        cached = cache.get(FinanceLookup.ACCOUNTS_KEY)
+        if cached is None:
+            cached = {acc.code: acc for acc in Account.objects.all()}
+            cache.set(FinanceLookup.ACCOUNTS_KEY, cached, FinanceLookup.TIMEOUT)
+        return cached
+
+    @staticmethod
+    def account(code):
+        """Account by code (or None)"""
+        return FinanceLookup.accounts().get(code)
+
+    @staticmethod
+    def invalidate():
+        cache.delete_many([FinanceLookup.SETTINGS_KEY, FinanceLookup.ACCOUNTS_KEY])
+
+
+class JournalPoster:
+    """
+    Posts a journal entry (header + lines) in a fixed number of queries:
+    one INSERT for the header, one bulk INSERT for all lines, one batched
+    UPDATE for account balances and the daily balance rollup.
+
+    Each line is a dict of LedgerEntry fields:
+    {'account': acc, 'debit': x, 'credit': y, 'gold_debit': g, 'gold_credit': g, 'cost_center': cc}
+    """
+    AMOUNT_FIELDS = ('debit', 'credit', 'gold_debit', 'gold_credit')
+
+    @staticmethod
+    def _normalize(line):
+        line = dict(line)
+        for field in JournalPoster.AMOUNT_FIELDS:
+            line[field] = Decimal(str(line.get(field) or 0))
+        return line
+
+    @staticmethod
+    def validate(lines, check_gold=True):
+        """يتحقق من توازن القيد (نقداً وذهباً) ويرفع ValidationError عند عدم التوازن"""
+        from django.core.exceptions import ValidationError
+        debit = sum(line['debit'] for line in lines)
+        credit = sum(line['credit'] for line in lines)
+        if debit != credit:
+            raise ValidationError(f"القيد غير متوازن نقداً: مدين {debit} / دائن {credit}")
+        if check_gold:
+            gold_debit = sum(line['gold_debit'] for line in lines)
+            gold_credit = sum(line['gold_credit'] for line in lines)
+            if gold_debit != gold_credit:
+                raise ValidationError(f"القيد غير متوازن ذهباً: مدين {gold_debit} / دائن {gold_credit}")
+
+    @staticmethod
+    @transaction.atomic
+    def post(reference, lines, description='', date=None, check_gold=True, update_balances=False):
+        """
+        Creates the journal entry and its lines. Returns the JournalEntry.
+
+        update_balances: also move Account.balance/gold_balance on the account's
+        natural side. Reports treat Account.balance as an opening base on top of
+        the ledger, so automated postings leave it untouched by default.
+        """
+        lines = [JournalPoster._normalize(line) for line in lines]
+        JournalPoster.validate(lines, check_gold=check_gold)
+
+        # Always pass a plain date: the model default (Now) is a DB expression
+        if date is None:
+            date = timezone.localdate()
+        elif isinstance(date, datetime.datetime):
+            date = timezone.localtime(date).date() if timezone.is_aware(date) else date.date()
+        journal = JournalEntry.objects.create(reference=reference, description=description, date=date)
+
+        entries = LedgerEntry.objects.bulk_create([
+            LedgerEntry(journal_entry=journal, **line) for line in lines
+        ])
+
+        if update_balances:
+            JournalPoster.update_account_balances(lines)
+        DailyBalanceService.apply_entries(entries)
+        return journal
+
+    @staticmethod
+    def update_account_balances(lines):
+        """One UPDATE for all affected accounts using CASE expressions over F()"""
+        from django.db.models import Case, When, Value, DecimalField
+        deltas = {}
+        for line in lines:
+            account = line['account']
+            cash = line['debit'] - line['credit']
+            gold = line['gold_debit'] - line['gold_credit']
+            if account.account_type not in ('asset', 'expense'):
+                cash, gold = -cash, -gold
+            d = deltas.setdefault(account.pk, [Decimal('0'), Decimal('0')])
+            d[0] += cash
+            d[1] += gold
+
+        if not deltas:
+            return
+        cash_case = Case(
+            *[When(pk=pk, then=Value(d[0])) for pk, d in deltas.items()],
+            default=Value(Decimal('0')), output_field=DecimalField(max_digits=15, decimal_places=2)
+        )
+        gold_case = Case(
+            *[When(pk=pk, then=Value(d[1])) for pk, d in deltas.items()],
+            default=Value(Decimal('0')), output_field=DecimalField(max_digits=15, decimal_places=3)
+        )
+        Account.objects.filter(pk__in=deltas.keys()).update(
+            balance=F('balance') + cash_case,
+            gold_balance=F('gold_balance') + gold_case,
         )
-        settings.cash_account.balance += invoice.grand_total
-        settings.cash_account.save()
 
-        # 3. Entry: Gold Inventory Credit (Cost of Gold)
-        # Note: In gold ERP, we track weight too
-        total_weight = sum(item.sold_weight for item in invoice.items.all())
-        LedgerEntry.objects.create(
-            journal_entry=journal,
-            account=settings.inventory_gold_account,
-            debit=0,
-            credit=invoice.total_gold_value,
-            gold_credit=total_weight
+
+class DailyBalanceService:
+    """
+    Maintains the AccountDailyBalance rollup (one row per account per day).
+    Reports read opening/period balances from it instead of scanning LedgerEntry.
+    """
+
+    @staticmethod
+    def _journal_date(journal):
+        # JournalEntry.date defaults to a DB expression (Now) and TreasuryTransaction
+        # passes datetimes, so only trust plain date objects and re-read otherwise.
+        if type(journal.date) is datetime.date:
+            return journal.date
+        return JournalEntry.objects.values_list('date', flat=True).get(pk=journal.pk)
+
+    @staticmethod
+    @transaction.atomic
+    def apply_entries(entries):
+        """Adds newly created ledger lines to the daily totals (one UPDATE per account/day)."""
+        totals = {}
+        journal_dates = {}
+        for entry in entries:
+            if entry.journal_entry_id not in journal_dates:
+                journal_dates[entry.journal_entry_id] = DailyBalanceService._journal_date(entry.journal_entry)
+            key = (entry.account_id, journal_dates[entry.journal_entry_id])
+            row = totals.setdefault(key, [Decimal('0')] * 4)
+            row[0] += Decimal(str(entry.debit or 0))
+            row[1] += Decimal(str(entry.credit or 0))
+            row[2] += Decimal(str(entry.gold_debit or 0))
+            row[3] += Decimal(str(entry.gold_credit or 0))
+
+        for (account_id, day), (debit, credit, gold_debit, gold_credit) in totals.items():
+            daily, _ = AccountDailyBalance.objects.get_or_create(account_id=account_id, date=day)
+            AccountDailyBalance.objects.filter(pk=daily.pk).update(
+                debit=F('debit') + debit,
+                credit=F('credit') + credit,
+                gold_debit=F('gold_debit') + gold_debit,
+                gold_credit=F('gold_credit') + gold_credit,
+            )
+        MonthlyAnalyticsService.touch(set(journal_dates.values()))
+
+    @staticmethod
+    def apply_journal(journal):
+        """Posts all lines of a freshly created journal entry into the rollup."""
+        DailyBalanceService.apply_entries(journal.ledger_entries.select_related('journal_entry'))
+
+    @staticmethod
+    def keys_for_journal(journal_id):
+        """(account_id, date) pairs touched by a journal entry - used before edits/deletes."""
+        return set(
+            LedgerEntry.objects.filter(journal_entry_id=journal_id)
+            .values_list('account_id', 'journal_entry__date')
+        )
+
+    @staticmethod
+    @transaction.atomic
+    def resync(keys):
+        """Recomputes the given (account_id, date) rows from the raw ledger (manual edits)."""
+        keys = set(keys)
+        for account_id, day in keys:
+            sums = LedgerEntry.objects.filter(account_id=account_id, journal_entry__date=day).aggregate(
+                debit=Coalesce(Sum('debit'), Decimal('0')),
+                credit=Coalesce(Sum('credit'), Decimal('0')),
+                gold_debit=Coalesce(Sum('gold_debit'), Decimal('0')),
+                gold_credit=Coalesce(Sum('gold_credit'), Decimal('0')),
+            )
+            if not any(sums.values()):
+                AccountDailyBalance.objects.filter(account_id=account_id, date=day).delete()
+            else:
+                AccountDailyBalance.objects.update_or_create(account_id=account_id, date=day, defaults=sums)
+        MonthlyAnalyticsService.touch({day for _, day in keys})
+
+    @staticmethod
+    def _ledger_totals():
+        return LedgerEntry.objects.values('account_id', 'journal_entry__date').annotate(
+            s_debit=Coalesce(Sum('debit'), Decimal('0')),
+            s_credit=Coalesce(Sum('credit'), Decimal('0')),
+            s_gold_debit=Coalesce(Sum('gold_debit'), Decimal('0')),
+            s_gold_credit=Coalesce(Sum('gold_credit'), Decimal('0')),
+        ).order_by()
+
+    @staticmethod
+    @transaction.atomic
+    def rebuild(batch_size=1000):
+        """Drops and recreates the whole rollup from LedgerEntry. Returns the row count."""
+        AccountDailyBalance.objects.all().delete()
+        rows = [
+            AccountDailyBalance(
+                account_id=r['account_id'],
+                date=r['journal_entry__date'],
+                debit=r['s_debit'],
+                credit=r['s_credit'],
+                gold_debit=r['s_gold_debit'],
+                gold_credit=r['s_gold_credit'],
+            )
+            for r in DailyBalanceService._ledger_totals()
+        ]
+        AccountDailyBalance.objects.bulk_create(rows, batch_size=batch_size)
+        return len(rows)
+
+    @staticmethod
+    def verify():
+        """Compares the rollup with the raw ledger. Returns a list of mismatching keys."""
+        fields = ('debit', 'credit', 'gold_debit', 'gold_credit')
+        expected = {
+            (r['account_id'], r['journal_entry__date']): tuple(r[f's_{f}'] for f in fields)
+            for r in DailyBalanceService._ledger_totals()
+        }
+        actual = {
+            (r[0], r[1]): tuple(r[2:])
+            for r in AccountDailyBalance.objects.values_list('account_id', 'date', *fields)
+        }
+        zero = (Decimal('0'),) * len(fields)
+        mismatches = []
+        for key in expected.keys() | actual.keys():
+            if expected.get(key, zero) != actual.get(key, zero):
+                mismatches.append({'account_id': key[0], 'date': key[1],
+                                   'ledger': expected.get(key, zero), 'rollup': actual.get(key, zero)})
+        return mismatches
+
+
+class TreasuryReportService:
+    """
+    مجاميع حركة الخزينة اليومية.
+    Cash and gold in/out are conditional sums (Sum(..., filter=Q(...))) so one query returns
+    every total for a treasury day, or one row per treasury with values('treasury').
+    Served by the fin_trx_treasury_date_type_idx index.
+    """
+    CASH_IN = ('cash_in', 'transfer_in')
+    CASH_OUT = ('cash_out', 'transfer_out')
+    GOLD_IN = ('gold_in', 'transfer_in')
+    GOLD_OUT = ('gold_out', 'transfer_out')
+
+    @staticmethod
+    def _sum(field, types, decimal_places):
+        return Coalesce(
+            Sum(field, filter=Q(transaction_type__in=types)),
+            Value(Decimal('0')),
+            output_field=DecimalField(max_digits=15, decimal_places=decimal_places),
         )
-        settings.inventory_gold_account.balance -= invoice.total_gold_value
-        settings.inventory_gold_account.gold_balance -= total_weight
-        settings.inventory_gold_account.save()
-
-        # 4. Entry: Sales Revenue (Labor Fees + Markup)
-        revenue_amount = invoice.total_labor_value # Simplified: Sales Revenue = Labor Fees
-        LedgerEntry.objects.create(
-            journal_entry=journal,
-            account=settings.sales_revenue_account,
-            debit=0,
-            credit=revenue_amount
+
+    @staticmethod
+    def totals_expressions():
+        """{'cash_in', 'cash_out', 'gold_in', 'gold_out'} aggregate expressions"""
+        S = TreasuryReportService
+        return {
+            'cash_in': S._sum('cash_amount', S.CASH_IN, 2),
+            'cash_out': S._sum('cash_amount', S.CASH_OUT, 2),
+            'gold_in': S._sum('gold_weight', S.GOLD_IN, 3),
+            'gold_out': S._sum('gold_weight', S.GOLD_OUT, 3),
+        }
+
+    @staticmethod
+    def day_totals(treasury, day):
+        from .treasury_models import TreasuryTransaction
+        return TreasuryTransaction.objects.filter(treasury=treasury, date=day).aggregate(
+            **TreasuryReportService.totals_expressions()
         )
-        settings.sales_revenue_account.balance += revenue_amount
-        settings.sales_revenue_account.save()
 
-        # 5. Entry: VAT Credit
-        if invoice.total_tax > 0:
-            LedgerEntry.objects.create(
-                journal_entry=journal,
-                account=settings.vat_account,
-                debit=0,
-                credit=invoice.total_tax
+
+class TreasuryLedgerService:
+    """
+    رصيد الخزينة بعد كل حركة (balance_after_*).
+
+    update_treasury_balance stores the balances after each transaction while the treasury row
+    is locked; a back-dated transaction also shifts the balances of the later ones. rebuild()
+    recomputes every row with running sums (window functions) in date, created_at, id order.
+    Opening / closing balances for a date are then the balances of the last transaction
+    before / on that date (fin_trx_treasury_running_idx).
+    """
+    CASH_INFLOW = ('cash_in', 'transfer_in', 'adjustment', 'finished_goods_in')
+    CASH_OUTFLOW = ('cash_out', 'transfer_out')
+    GOLD_INFLOW = ('gold_in', 'transfer_in', 'adjustment', 'finished_goods_in')
+    MATERIAL_INFLOW = ('gold_in', 'transfer_in', 'adjustment')
+    GOLD_OUTFLOW = ('gold_out', 'transfer_out')
+
+    # key: (TreasuryTransaction column, Treasury column)
+    COLUMNS = {
+        'cash': ('balance_after_cash', 'cash_balance'),
+        'gold_18': ('balance_after_gold_18', 'gold_balance_18'),
+        'gold_21': ('balance_after_gold_21', 'gold_balance_21'),
+        'gold_24': ('balance_after_gold_24', 'gold_balance_24'),
+        'casting': ('balance_after_gold_casting', 'gold_casting_balance'),
+        'stones': ('balance_after_stones', 'stones_balance'),
+    }
+    ORDERING = ('date', 'created_at', 'id')
+
+    @staticmethod
+    def _signed(field, inflow, outflow, **filters):
+        return Case(
+            When(transaction_type__in=inflow, **filters, then=F(field)),
+            When(transaction_type__in=outflow, **filters, then=-F(field)),
+            default=Value(Decimal('0')),
+            output_field=DecimalField(max_digits=15, decimal_places=3),
+        )
+
+    @staticmethod
+    def delta_expressions():
+        """{key: signed delta of one transaction} for every COLUMNS key, plus 'gold' (its own carat)"""
+        from core.services import BalanceService
+        S = TreasuryLedgerService
+        carats = defaultdict(list)
+        for carat_id, suffix in BalanceService.carat_suffix_map().items():
+            carats[suffix].append(carat_id)
+        expressions = {
+            'cash': S._signed('cash_amount', S.CASH_INFLOW, S.CASH_OUTFLOW),
+            'casting': S._signed('gold_casting_weight', S.MATERIAL_INFLOW, S.GOLD_OUTFLOW),
+            'stones': S._signed('stones_weight', S.MATERIAL_INFLOW, S.GOLD_OUTFLOW),
+            'gold': S._signed('gold_weight', S.GOLD_INFLOW, S.GOLD_OUTFLOW, gold_carat__isnull=False),
+        }
+        for suffix in ('18', '21', '24'):
+            expressions[f'gold_{suffix}'] = S._signed(
+                'gold_weight', S.GOLD_INFLOW, S.GOLD_OUTFLOW, gold_carat__in=carats[suffix]
             )
-            settings.vat_account.balance += invoice.total_tax
-            settings.vat_account.save()
+        return expressions
 
-        return journal
+    @staticmethod
+    def _sums(queryset, keys):
+        expressions = TreasuryLedgerService.delta_expressions()
+        decimal = DecimalField(max_digits=15, decimal_places=3)
+        return queryset.aggregate(**{
+            key: Coalesce(Sum(expressions[key]), Value(Decimal('0')), output_field=decimal) for key in keys
+        })
+
+    @staticmethod
+    def write_balances(instance, treasury, changes, gold_after):
+        """
+        Store the balances after `instance`. `treasury` holds the locked, updated balances,
+        `changes` the {key: delta} the transaction applied and `gold_after` the balance of its own carat.
+        """
+        from .treasury_models import TreasuryTransaction
+        S = TreasuryLedgerService
+        after = {column: getattr(treasury, attr) for column, attr in S.COLUMNS.values()}
+        after['balance_after_gold'] = gold_after
+
+        later = TreasuryTransaction.objects.filter(treasury=treasury, date__gt=instance.date)
+        if later.exists():
+            # Back-dated: this row comes before the later ones
+            sums = S._sums(later, S.COLUMNS)
+            for key, (column, _) in S.COLUMNS.items():
+                after[column] -= sums[key]
+            shifts = {
+                S.COLUMNS[key][0]: F(S.COLUMNS[key][0]) + delta
+                for key, delta in changes.items() if delta and key in S.COLUMNS
+            }
+            if shifts:
+                later.update(**shifts)
+            if instance.gold_carat_id:
+                same_carat = later.filter(gold_carat=instance.gold_carat_id)
+                after['balance_after_gold'] -= S._sums(same_carat, ['gold'])['gold']
+                if changes.get('gold'):
+                    same_carat.update(balance_after_gold=F('balance_after_gold') + changes['gold'])
+
+        # .update() so post_save does not run again
+        TreasuryTransaction.objects.filter(pk=instance.pk).update(**after)
+
+    @staticmethod
+    def balances_at(treasury, day, opening=False):
+        """
+        {key: balance} after the last transaction on `day` (closing) or before it (opening),
+        for every COLUMNS key.
+        """
+        return TreasuryLedgerService.balances_for([treasury], day, opening)[treasury.pk]
+
+    @staticmethod
+    def balances_for(treasuries, day, opening=False):
+        """
+        balances_at for many treasuries: {treasury_id: {key: balance}}.
+        The last transaction of every treasury is picked by one subquery, its balances read in one query.
+        """
+        from django.db.models import OuterRef, Subquery
+        from .treasury_models import Treasury, TreasuryTransaction
+        S = TreasuryLedgerService
+        treasuries = {t.pk: t for t in treasuries}
+        columns = {column: key for key, (column, _) in S.COLUMNS.items()}
+        date_filter = {'date__lt': day} if opening else {'date__lte': day}
+        last = TreasuryTransaction.objects.filter(treasury=OuterRef('pk'), **date_filter).order_by(
+            *(f'-{f}' for f in S.ORDERING)
+        ).values('pk')[:1]
+        last_ids = Treasury.objects.filter(pk__in=list(treasuries)).annotate(
+            last_trx=Subquery(last)
+        ).exclude(last_trx__isnull=True).values_list('last_trx', flat=True)
+
+        balances = {
+            row['treasury']: {key: row[column] for column, key in columns.items()}
+            for row in TreasuryTransaction.objects.filter(pk__in=list(last_ids)).values('treasury', *columns)
+        }
+        missing = [pk for pk in treasuries if pk not in balances]
+        if missing:
+            # Nothing yet: the balance the treasury started with
+            transactions = TreasuryTransaction.objects.filter(treasury__in=missing)
+            expressions = S.delta_expressions()
+            decimal = DecimalField(max_digits=15, decimal_places=3)
+            sums = {
+                row['treasury']: row for row in transactions.values('treasury').annotate(**{
+                    key: Coalesce(Sum(expressions[key]), Value(Decimal('0')), output_field=decimal) for key in S.COLUMNS
+                }).order_by()
+            }
+            for pk in missing:
+                row = sums.get(pk, {})
+                balances[pk] = {
+                    key: getattr(treasuries[pk], attr) - row.get(key, 0) for key, (_, attr) in S.COLUMNS.items()
+                }
+        return balances
+
+    @staticmethod
+    def rebuild(treasuries=None, batch_size=1000):
+        """
+        Recompute balance_after_* of every transaction with running sums partitioned by treasury
+        (and by carat for balance_after_gold), anchored on the current treasury balances.
+        Returns the number of rows changed.
+        """
+        from core.models import HoldingBalance
+        from .treasury_models import Treasury, TreasuryTransaction
+        S = TreasuryLedgerService
+        treasuries = Treasury.objects.all() if treasuries is None else treasuries
+        current = {t.pk: t for t in treasuries}
+        transactions = TreasuryTransaction.objects.filter(treasury__in=list(current))
+        expressions = S.delta_expressions()
+        decimal = DecimalField(max_digits=15, decimal_places=3)
+        order_by = [F(f).asc() for f in S.ORDERING]
+
+        totals = {
+            row['treasury']: row for row in transactions.values('treasury').annotate(**{
+                key: Coalesce(Sum(expressions[key]), Value(Decimal('0')), output_field=decimal) for key in S.COLUMNS
+            }).order_by()
+        }
+        gold_totals = {
+            (row['treasury'], row['gold_carat']): row['total']
+            for row in transactions.filter(gold_carat__isnull=False).values('treasury', 'gold_carat').annotate(
+                total=Coalesce(Sum(expressions['gold']), Value(Decimal('0')), output_field=decimal)
+            ).order_by()
+        }
+        gold_current = {
+            (holder_id, carat_id): weight for holder_id, carat_id, weight in HoldingBalance.objects.filter(
+                holder_type='treasury', holder_id__in=list(current), bucket='gold'
+            ).values_list('holder_id', 'carat_id', 'weight')
+        }
+
+        running = transactions.annotate(
+            **{f'run_{key}': Window(Sum(expressions[key]), partition_by=[F('treasury')], order_by=order_by)
+               for key in S.COLUMNS},
+            run_gold=Window(Sum(expressions['gold']), partition_by=[F('treasury'), F('gold_carat')], order_by=order_by),
+        ).only('id', 'treasury', 'gold_carat', *(column for column, _ in S.COLUMNS.values()), 'balance_after_gold')
+
+        changed = []
+        updated = 0
+        fields = [column for column, _ in S.COLUMNS.values()] + ['balance_after_gold']
+        for trx in list(running):
+            treasury, total = current[trx.treasury_id], totals[trx.treasury_id]
+            values = {
+                column: getattr(treasury, attr) - total[key] + (getattr(trx, f'run_{key}') or 0)
+                for key, (column, attr) in S.COLUMNS.items()
+            }
+            if trx.gold_carat_id:
+                key = (trx.treasury_id, trx.gold_carat_id)
+                values['balance_after_gold'] = gold_current.get(key, 0) - gold_totals.get(key, 0) + (trx.run_gold or 0)
+            else:
+                values['balance_after_gold'] = Decimal('0')
+            if any(getattr(trx, f) != v for f, v in values.items()):
+                for f, v in values.items():
+                    setattr(trx, f, v)
+                changed.append(trx)
+            if len(changed) >= batch_size:
+                TreasuryTransaction.objects.bulk_update(changed, fields)
+                updated += len(changed)
+                changed = []
+        if changed:
+            TreasuryTransaction.objects.bulk_update(changed, fields)
+            updated += len(changed)
+        return updated
+
+
+class TreasuryCloseService:
+    """
+    إغلاق يومية الخزائن دفعة واحدة (close_treasuries).
+    Movements of every treasury come from one grouped query, opening / closing balances from
+    TreasuryLedgerService.balances_for, and the DailyTreasuryReport rows are written with
+    bulk_create / bulk_update per chunk. Reports already closed are skipped, so the job can
+    be re-run or resumed after a failure.
+    """
+    CHUNK_SIZE = 200
+    # TreasuryLedgerService key -> opening_* / closing_* suffix of DailyTreasuryReport
+    FIELDS = {
+        'cash': 'cash', 'gold_18': 'gold_18', 'gold_21': 'gold_21', 'gold_24': 'gold_24',
+        'casting': 'gold_casting', 'stones': 'stones',
+    }
+    UPDATE_FIELDS = [
+        'total_cash_in', 'total_cash_out', 'total_gold_in', 'total_gold_out',
+        'opening_cash', 'opening_gold_18', 'opening_gold_21', 'opening_gold_24', 'opening_gold_casting', 'opening_stones',
+        'closing_cash', 'closing_gold_18', 'closing_gold_21', 'closing_gold_24', 'closing_gold_casting', 'closing_stones',
+        'cash_difference', 'gold_difference', 'gold_casting_difference', 'stones_difference',
+        'is_closed', 'closed_by', 'updated_at',
+    ]
+
+    @staticmethod
+    def close_day(day=None, treasuries=None, user=None, chunk_size=None):
+        """Close `day` (default today) for the active treasuries. Returns the number of reports closed."""
+        from .treasury_models import Treasury
+        day = day or timezone.localdate()
+        if treasuries is None:
+            treasuries = Treasury.objects.filter(is_active=True)
+        ids = list(treasuries.order_by('pk').values_list('pk', flat=True))
+        size = chunk_size or TreasuryCloseService.CHUNK_SIZE
+
+        closed = 0
+        for start in range(0, len(ids), size):
+            # Each chunk commits on its own: a failure later on keeps the chunks already closed
+            with transaction.atomic():
+                closed += TreasuryCloseService._close_chunk(ids[start:start + size], day, user)
+        return closed
+
+    @staticmethod
+    def _close_chunk(ids, day, user):
+        from .treasury_models import DailyTreasuryReport, Treasury, TreasuryTransaction
+        reports = {r.treasury_id: r for r in DailyTreasuryReport.objects.select_for_update().filter(
+            treasury_id__in=ids, date=day
+        )}
+        pending = [
+            t for t in Treasury.objects.filter(pk__in=ids)
+            if not (t.pk in reports and reports[t.pk].is_closed)
+        ]
+        if not pending:
+            return 0
+
+        pending_ids = [t.pk for t in pending]
+        totals = {
+            row['treasury']: row for row in TreasuryTransaction.objects.filter(
+                treasury__in=pending_ids, date=day
+            ).values('treasury').annotate(**TreasuryReportService.totals_expressions()).order_by()
+        }
+        opening = TreasuryLedgerService.balances_for(pending, day, opening=True)
+        closing = TreasuryLedgerService.balances_for(pending, day)
+
+        now = timezone.now()
+        to_create, to_update = [], []
+        for treasury in pending:
+            report = reports.get(treasury.pk)
+            if report is None:
+                report = DailyTreasuryReport(treasury=treasury, date=day)
+                to_create.append(report)
+            else:
+                to_update.append(report)
+            day_totals = totals.get(treasury.pk, {})
+            report.total_cash_in = day_totals.get('cash_in', 0)
+            report.total_cash_out = day_totals.get('cash_out', 0)
+            report.total_gold_in = day_totals.get('gold_in', 0)
+            report.total_gold_out = day_totals.get('gold_out', 0)
+            for key, suffix in TreasuryCloseService.FIELDS.items():
+                setattr(report, f'opening_{suffix}', opening[treasury.pk][key])
+                setattr(report, f'closing_{suffix}', closing[treasury.pk][key])
+            report.calculate_differences()
+            report.is_closed = True
+            report.closed_by = user
+            report.updated_at = now
+
+        DailyTreasuryReport.objects.bulk_create(to_create)
+        if to_update:
+            DailyTreasuryReport.objects.bulk_update(to_update, TreasuryCloseService.UPDATE_FIELDS)
+        return len(pending)
+
+
+class MonthlyAnalyticsService:
+    """
+    أقسام التقرير التحليلي الشهري، كل قسم باستعلام مجمع واحد.
+    Sections of a closed period (ending before today) are cached without expiry under
+    (section, start, end); the open period is always recomputed. Ledger postings, stones,
+    invoice lines and stages changed on a past date bump that year's stamp (part of every key),
+    so late changes are picked up.
+    """
+    CACHE_PREFIX = 'finance:analytics'
+    GENERIC_PRODUCT = 'قطعة عامة'
+
+    @staticmethod
+    def period_range(report_type, year, month):
+        """(start, end) of the monthly / quarterly / semi_annual / annual period containing `month`"""
+        if report_type == 'annual':
+            first, months = 1, 12
+        elif report_type == 'quarterly':
+            first, months = ((month - 1) // 3) * 3 + 1, 3
+        elif report_type == 'semi_annual':
+            first, months = (1 if month <= 6 else 7), 6
+        else:
+            first, months = month, 1
+        start = datetime.date(year, first, 1)
+        last = first + months
+        end = datetime.date(year + (last - 1) // 12, (last - 1) % 12 + 1, 1) - datetime.timedelta(days=1)
+        return start, end
+
+    @staticmethod
+    def _stamp_key(year):
+        return f'{MonthlyAnalyticsService.CACHE_PREFIX}:stamp:{year}'
+
+    @staticmethod
+    def touch(days):
+        """Invalidate the cached sections covering `days` (rows dated on them were added or changed)"""
+        today = timezone.localdate()
+        for year in {d.year for d in days if d < today}:
+            cache.set(MonthlyAnalyticsService._stamp_key(year), time.time_ns(), None)
+
+    @staticmethod
+    def _stamp(year):
+        """
+        The year's stamp. Stamps are timestamps, not counters, and a missing (evicted) stamp is
+        replaced by a new one, so a lost stamp never maps back to sections cached before a change.
+        """
+        key = MonthlyAnalyticsService._stamp_key(year)
+        stamp = cache.get(key)
+        if stamp is None:
+            cache.add(key, time.time_ns(), None)
+            stamp = cache.get(key)
+        return stamp
+
+    @staticmethod
+    def cached(section, start, end, compute):
+        """`compute()` for the period, served from cache once the period is closed"""
+        if end >= timezone.localdate():
+            return compute()
+        S = MonthlyAnalyticsService
+        stamps = '.'.join(str(S._stamp(y)) for y in range(start.year, end.year + 1))
+        key = f'{S.CACHE_PREFIX}:{section}:{start.isoformat()}:{end.isoformat()}:{stamps}'
+        result = cache.get(key)
+        if result is None:
+            result = compute()
+            cache.set(key, result, None)
+        return result
+
+    @staticmethod
+    def ledger_metrics(start, end):
+        """{'revenue', 'expenses', 'profit'} from one conditional aggregate over the ledger"""
+        def compute():
+            m = LedgerEntry.objects.filter(journal_entry__date__range=[start, end]).aggregate(
+                rev_debit=Coalesce(Sum('debit', filter=Q(account__account_type='revenue')), Decimal('0')),
+                rev_credit=Coalesce(Sum('credit', filter=Q(account__account_type='revenue')), Decimal('0')),
+                exp_debit=Coalesce(Sum('debit', filter=Q(account__account_type='expense')), Decimal('0')),
+                exp_credit=Coalesce(Sum('credit', filter=Q(account__account_type='expense')), Decimal('0')),
+            )
+            revenue = m['rev_credit'] - m['rev_debit']
+            expenses = m['exp_debit'] - m['exp_credit']
+            return {'revenue': revenue, 'expenses': expenses, 'profit': revenue - expenses}
+        return MonthlyAnalyticsService.cached('ledger', start, end, compute)
+
+    @staticmethod
+    def stage_efficiency(start, end):
+        """[{'stage', 'avg_duration', 'count'}] per stage name for stages finished in the period"""
+        from manufacturing.services import StageAnalyticsService
+
+        def compute():
+            return [{
+                'stage': row['stage'],
+                'avg_duration': str(datetime.timedelta(seconds=int(row['avg_duration'].total_seconds()))),
+                'count': row['count'],
+            } for row in StageAnalyticsService.summary(start, end) if row['avg_duration'] is not None]
+        return MonthlyAnalyticsService.cached('stages', start, end, compute)
+
+    @staticmethod
+    def product_performance(start, end):
+        """
+        [(product name, stats)] sorted by total profit. Products are grouped in SQL by the
+        source order's item name, else the item category, using the persisted line_profit.
+        """
+        from django.db.models import Count
+        from django.db.models.functions import NullIf
+        from sales.models import InvoiceItem
+
+        def compute():
+            name = Coalesce(
+                NullIf('item__source_order__item_name_pattern', Value('')), 'item__category__name',
+                Value(MonthlyAnalyticsService.GENERIC_PRODUCT),
+            )
+            rows = InvoiceItem.objects.filter(invoice__created_at__date__range=[start, end]).values(
+                product=name
+            ).annotate(
+                count=Count('id'),
+                total_profit=Coalesce(Sum('line_profit'), Decimal('0')),
+                total_revenue=Coalesce(Sum('subtotal'), Decimal('0')),
+                total_weight=Coalesce(Sum('sold_weight'), Decimal('0')),
+            ).order_by('-total_profit')
+            return [(row['product'], {
+                'count': row['count'],
+                'total_profit': row['total_profit'],
+                'total_revenue': row['total_revenue'],
+                'avg_profit': row['total_profit'] / row['count'],
+                'avg_weight': row['total_weight'] / row['count'],
+                'avg_revenue': row['total_revenue'] / row['count'],
+            }) for row in rows]
+        return MonthlyAnalyticsService.cached('products', start, end, compute)
+
+    @staticmethod
+    def stone_usage(start, end):
+        """{'rows': [{'stone__name', 'usage_count', 'total_qty'}], 'total_weight', 'tahyif_gold'} for orders started in the period"""
+        from django.db.models import Count
+        from manufacturing.models import OrderStone
+        from manufacturing.services import StageLossCalculator
+
+        def compute():
+            stones = OrderStone.objects.filter(order__start_date__range=[start, end])
+            rows = list(stones.values('stone__name').annotate(
+                usage_count=Count('id'), total_qty=Coalesce(Sum('quantity'), Decimal('0')),
+            ).order_by('-usage_count', 'stone__name'))
+            totals = stones.aggregate(
+                total_weight=Coalesce(Sum('quantity'), Decimal('0')),
+                tahyif_gold=Coalesce(Sum(StageLossCalculator.stone_gold_expression()), Decimal('0'),
+                                     output_field=DecimalField(max_digits=12, decimal_places=3)),
+            )
+            return {'rows': rows, **totals}
+        return MonthlyAnalyticsService.cached('stones', start, end, compute)
+
+    @staticmethod
+    def partner_distribution(net_profit):
+        """[{'partner', 'share'}] of the net profit for the active partners (a handful of rows, not cached)"""
+        from .models import Partner
+        return [
+            {'partner': partner, 'share': (net_profit * partner.percentage) / 100}
+            for partner in Partner.objects.filter(is_active=True)
+        ]
@@ -1,11 +1,48 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
 from django.dispatch import receiver
 from django.db import transaction
 from .treasury_models import (
     TreasuryTransaction, ExpenseVoucher, ReceiptVoucher, TreasuryTransfer,
     TreasuryTool, ToolTransfer, CustodyTool
 )
-from .models import JournalEntry, LedgerEntry, FinanceSettings, Account
+from .models import FinanceSettings, Account
+from .services import JournalPoster, FinanceLookup, MonthlyAnalyticsService, TreasuryLedgerService
+from core.models import HoldingBalance
+from core.services import BalanceService
+
+@receiver(post_save, sender=FinanceSettings)
+@receiver(post_delete, sender=FinanceSettings)
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+def invalidate_finance_lookup(sender, **kwargs):
+    """مسح كاش الإعدادات ودليل الحسابات عند أي تعديل"""
+    FinanceLookup.invalidate()
+
+
+@receiver(post_save, sender='manufacturing.OrderStone')
+@receiver(post_delete, sender='manufacturing.OrderStone')
+def invalidate_analytics_for_stone(sender, instance, **kwargs):
+    """الأحجار تحسب في شهر بدء الأمر"""
+    start_date = getattr(instance.order, 'start_date', None) if instance.order_id else None
+    if start_date:
+        MonthlyAnalyticsService.touch({start_date})
+
+
+@receiver(post_save, sender='sales.InvoiceItem')
+@receiver(post_delete, sender='sales.InvoiceItem')
+def invalidate_analytics_for_invoice_item(sender, instance, **kwargs):
+    created_at = instance.invoice.created_at if instance.invoice_id else None
+    if created_at:
+        MonthlyAnalyticsService.touch({timezone.localtime(created_at).date()})
+
+
+@receiver(post_save, sender='manufacturing.ProductionStage')
+@receiver(post_delete, sender='manufacturing.ProductionStage')
+def invalidate_analytics_for_stage(sender, instance, **kwargs):
+    """المراحل تحسب في شهر انتهائها"""
+    if instance.end_datetime:
+        MonthlyAnalyticsService.touch({timezone.localtime(instance.end_datetime).date()})
 
 @receiver(post_save, sender=TreasuryTransaction)
 def create_journal_entry_for_transaction(sender, instance, created, **kwargs):
@@ -30,7 +67,7 @@ def create_journal_entry_for_transaction(sender, instance, created, **kwargs):
         return
 
     # Get Default Accounts from Settings
-    settings = FinanceSettings.objects.first()
+    settings = FinanceLookup.settings()
     if not settings:
         return
 
@@ -45,11 +82,11 @@ def create_journal_entry_for_transaction(sender, instance, created, **kwargs):
             voucher = ExpenseVoucher.objects.filter(id=instance.reference_id).first()
             if voucher:
                 if voucher.expense_category == 'salaries':
-                    counter_account = Account.objects.filter(code='5301').first()
+                    counter_account = FinanceLookup.account('5301')
                 elif voucher.expense_category in ['electricity', 'water', 'gas', 'rent']:
-                    counter_account = Account.objects.filter(code='5302').first()
+                    counter_account = FinanceLookup.account('5302')
                 else:
-                    counter_account = Account.objects.filter(code='53').first()
+                    counter_account = FinanceLookup.account('53')
         
         # Fallback to COGS if still no account
         if not counter_account:
@@ -70,50 +107,25 @@ def create_journal_entry_for_transaction(sender, instance, created, **kwargs):
     # Prepare Entry Data
     description = f"Auto: {instance.get_transaction_type_display()} - {instance.description}"
     
-    with transaction.atomic():
-        # 1. Create Journal Header
-        journal = JournalEntry.objects.create(
-            reference=f"TRX-{instance.id}",
-            description=description,
-            date=instance.date
-        )
-
-        # 2. Create Ledger Entries (Debits & Credits)
-        if instance.transaction_type in ['cash_in', 'transfer_in']:
-            # Debit Treasury (Increase Asset)
-            LedgerEntry.objects.create(
-                journal_entry=journal,
-                account=treasury.linked_account,
-                cost_center=instance.cost_center,
-                debit=instance.cash_amount,
-                credit=0
-            )
-            # Credit Source (Revenue/Other)
-            LedgerEntry.objects.create(
-                journal_entry=journal,
-                account=counter_account,
-                cost_center=instance.cost_center,
-                debit=0,
-                credit=instance.cash_amount
-            )
+    # Ledger lines (Debits & Credits) - posted in one go by JournalPoster
+    if instance.transaction_type in ['cash_in', 'transfer_in']:
+        # Debit Treasury (Increase Asset) / Credit Source (Revenue/Other)
+        debit_account, credit_account = treasury.linked_account, counter_account
+    elif instance.transaction_type in ['cash_out', 'transfer_out']:
+        # Debit Destination (Expense/Asset) / Credit Treasury (Decrease Asset)
+        debit_account, credit_account = counter_account, treasury.linked_account
+    else:
+        return
 
-        elif instance.transaction_type in ['cash_out', 'transfer_out']:
-            # Debit Destination (Expense/Asset)
-            LedgerEntry.objects.create(
-                journal_entry=journal,
-                account=counter_account,
-                cost_center=instance.cost_center,
-                debit=instance.cash_amount,
-                credit=0
-            )
-            # Credit Treasury (Decrease Asset)
-            LedgerEntry.objects.create(
-                journal_entry=journal,
-                account=treasury.linked_account,
-                cost_center=instance.cost_center,
-                debit=0,
-                credit=instance.cash_amount
-            )
+    JournalPoster.post(
+        reference=f"TRX-{instance.id}",
+        description=description,
+        date=instance.date,
+        lines=[
+            {'account': debit_account, 'cost_center': instance.cost_center, 'debit': instance.cash_amount},
+            {'account': credit_account, 'cost_center': instance.cost_center, 'credit': instance.cash_amount},
+        ],
+    )
 
 @receiver(post_save, sender=TreasuryTransaction)
 def update_treasury_balance(sender, instance, created, **kwargs):
@@ -124,80 +136,71 @@ def update_treasury_balance(sender, instance, created, **kwargs):
         return
 
     treasury = instance.treasury
+    ledger = TreasuryLedgerService
     
     with transaction.atomic():
+        deltas = {}
+        holdings = {}
         # 1. Update Cash Balance
-        if instance.transaction_type in ['cash_in', 'transfer_in', 'adjustment', 'finished_goods_in']:
-            treasury.cash_balance += instance.cash_amount
-        elif instance.transaction_type in ['cash_out', 'transfer_out']:
-            treasury.cash_balance -= instance.cash_amount
-
-        # 2. Update Gold Balance
-        if instance.gold_weight and instance.gold_carat:
-            carat_name = instance.gold_carat.name
-            if '18' in carat_name:
-                if instance.transaction_type in ['gold_in', 'transfer_in', 'adjustment', 'finished_goods_in']:
-                    treasury.gold_balance_18 += instance.gold_weight
-                elif instance.transaction_type in ['gold_out', 'transfer_out']:
-                    treasury.gold_balance_18 -= instance.gold_weight
-            elif '21' in carat_name:
-                if instance.transaction_type in ['gold_in', 'transfer_in', 'adjustment', 'finished_goods_in']:
-                    treasury.gold_balance_21 += instance.gold_weight
-                elif instance.transaction_type in ['gold_out', 'transfer_out']:
-                    treasury.gold_balance_21 -= instance.gold_weight
-            elif '24' in carat_name:
-                if instance.transaction_type in ['gold_in', 'transfer_in', 'adjustment', 'finished_goods_in']:
-                    treasury.gold_balance_24 += instance.gold_weight
-                elif instance.transaction_type in ['gold_out', 'transfer_out']:
-                    treasury.gold_balance_24 -= instance.gold_weight
+        if instance.transaction_type in ledger.CASH_INFLOW:
+            deltas['cash_balance'] = instance.cash_amount
+        elif instance.transaction_type in ledger.CASH_OUTFLOW:
+            deltas['cash_balance'] = -instance.cash_amount
+
+        # 2. Update Gold Balance (per carat - HoldingBalance + legacy column)
+        gold_delta = 0
+        if instance.gold_weight and instance.gold_carat_id:
+            if instance.transaction_type in ledger.GOLD_INFLOW:
+                gold_delta = instance.gold_weight
+            elif instance.transaction_type in ledger.GOLD_OUTFLOW:
+                gold_delta = -instance.gold_weight
+            holdings['gold'] = gold_delta
 
         # 3. Update Casting Gold Balance
         if instance.gold_casting_weight:
-            if instance.transaction_type in ['gold_in', 'transfer_in', 'adjustment']:
-                treasury.gold_casting_balance += instance.gold_casting_weight
-            elif instance.transaction_type in ['gold_out', 'transfer_out']:
-                treasury.gold_casting_balance -= instance.gold_casting_weight
+            if instance.transaction_type in ledger.MATERIAL_INFLOW:
+                holdings['casting'] = instance.gold_casting_weight
+            elif instance.transaction_type in ledger.GOLD_OUTFLOW:
+                holdings['casting'] = -instance.gold_casting_weight
                 
         # 4. Update Stones Balance
         if instance.stones_weight:
-            if instance.transaction_type in ['gold_in', 'transfer_in', 'adjustment']:
-                treasury.stones_balance += instance.stones_weight
-            elif instance.transaction_type in ['gold_out', 'transfer_out']:
-                treasury.stones_balance -= instance.stones_weight
+            if instance.transaction_type in ledger.MATERIAL_INFLOW:
+                deltas['stones_balance'] = instance.stones_weight
+            elif instance.transaction_type in ledger.GOLD_OUTFLOW:
+                deltas['stones_balance'] = -instance.stones_weight
 
-        treasury.save()
+        # Row lock so the "balance after" snapshot below belongs to this transaction only
+        BalanceService.lock(treasury, fields=[
+            'cash_balance', 'gold_balance_18', 'gold_balance_21', 'gold_balance_24',
+            'gold_casting_balance', 'stones_balance',
+        ])
+        BalanceService.apply(treasury, deltas)
+        BalanceService.apply_holding(treasury, instance.gold_carat_id, holdings)
 
         # 3. Sync with Associated Workshop if gold is involved
         # Exclude manufacturing_order to avoid double counting with manufacturing signals
-        if instance.gold_weight and treasury.workshop and instance.gold_carat and instance.reference_type != 'manufacturing_order':
-            ws = treasury.workshop
-            carat_name = instance.gold_carat.name
-            field = None
-            if '18' in carat_name: field = 'gold_balance_18'
-            elif '21' in carat_name: field = 'gold_balance_21'
-            elif '24' in carat_name: field = 'gold_balance_24'
-            
-            if field:
-                if instance.transaction_type in ['gold_in', 'transfer_in', 'adjustment', 'finished_goods_in']:
-                    setattr(ws, field, getattr(ws, field) + instance.gold_weight)
-                elif instance.transaction_type in ['gold_out', 'transfer_out']:
-                    setattr(ws, field, getattr(ws, field) - instance.gold_weight)
-                ws.save(update_fields=[field])
+        if gold_delta and treasury.workshop_id and instance.reference_type != 'manufacturing_order':
+            BalanceService.apply_holding(treasury.workshop, instance.gold_carat_id, {'gold': gold_delta})
 
         # 4. Update the transaction record with the "Balance After"
-        # We use .update() to avoid triggering post_save again
-        current_gold_balance = 0
-        if instance.gold_carat:
-            if '18' in instance.gold_carat.name: current_gold_balance = treasury.gold_balance_18
-            elif '21' in instance.gold_carat.name: current_gold_balance = treasury.gold_balance_21
-            elif '24' in instance.gold_carat.name: current_gold_balance = treasury.gold_balance_24
+        gold_after = 0
+        suffix = None
+        if instance.gold_carat_id:
+            suffix = BalanceService.carat_suffix(instance.gold_carat_id)
+            gold_after = getattr(treasury, f'gold_balance_{suffix}') if suffix else HoldingBalance.objects.filter(
+                holder_type='treasury', holder_id=treasury.pk, carat_id=instance.gold_carat_id, bucket='gold'
+            ).values_list('weight', flat=True).first() or 0
 
-        TreasuryTransaction.objects.filter(pk=instance.pk).update(
-            balance_after_cash=treasury.cash_balance,
-            balance_after_gold=current_gold_balance,
-            balance_after_gold_casting=treasury.gold_casting_balance,
-            balance_after_stones=treasury.stones_balance
-        )
+        changes = {
+            'cash': deltas.get('cash_balance', 0),
+            'casting': holdings.get('casting', 0),
+            'stones': deltas.get('stones_balance', 0),
+            'gold': gold_delta,
+        }
+        if suffix:
+            changes[f'gold_{suffix}'] = gold_delta
+        ledger.write_balances(instance, treasury, changes, gold_after)
 
 
 @receiver(post_save, sender=ExpenseVoucher)
@@ -326,21 +329,15 @@ def process_tool_transfer_completion(sender, instance, created, **kwargs):
 
             # 3. مزامنة رصيد الذهب في الورشة (إذا كان المستلزم ذهبي)
             if hasattr(instance.tool, 'is_gold_tool') and instance.tool.is_gold_tool and instance.weight > 0:
-                carat_name = instance.tool.carat.name if instance.tool.carat else "18"
-                field_map = {'18': 'gold_balance_18', '21': 'gold_balance_21', '24': 'gold_balance_24'}
-                field = next((f for k, f in field_map.items() if k in carat_name), 'gold_balance_18')
+                carat = instance.tool.carat_id or BalanceService.canonical_carats().get('18')
 
                 # الخصم من ورشة الخزينة المصدر
                 if instance.from_treasury.workshop:
-                    current_bal = getattr(instance.from_treasury.workshop, field)
-                    setattr(instance.from_treasury.workshop, field, current_bal - instance.weight)
-                    instance.from_treasury.workshop.save(update_fields=[field])
+                    BalanceService.apply_holding(instance.from_treasury.workshop, carat, {'gold': -instance.weight})
 
                 # الإضافة لورشة الخزينة الوجهة
                 if instance.to_treasury.workshop:
-                    current_bal = getattr(instance.to_treasury.workshop, field)
-                    setattr(instance.to_treasury.workshop, field, current_bal + instance.weight)
-                    instance.to_treasury.workshop.save(update_fields=[field])
+                    BalanceService.apply_holding(instance.to_treasury.workshop, carat, {'gold': instance.weight})
 
 
 @receiver(post_save, sender=CustodyTool)
@@ -360,11 +357,5 @@ def process_custody_tool_issuance(sender, instance, created, **kwargs):
             # مزامنة رصيد الذهب في الورشة (إذا كان المستلزم ذهبي ومرتبط بورشة)
             if hasattr(instance.tool, 'is_gold_tool') and instance.tool.is_gold_tool and instance.weight > 0:
                 if instance.custody.treasury.workshop:
-                    carat_name = instance.tool.carat.name if instance.tool.carat else "18"
-                    field_map = {'18': 'gold_balance_18', '21': 'gold_balance_21', '24': 'gold_balance_24'}
-                    field = next((f for k, f in field_map.items() if k in carat_name), 'gold_balance_18')
-                    
-                    workshop = instance.custody.treasury.workshop
-                    current_bal = getattr(workshop, field)
-                    setattr(workshop, field, current_bal - instance.weight)
-                    workshop.save(update_fields=[field])
+                    carat = instance.tool.carat_id or BalanceService.canonical_carats().get('18')
+                    BalanceService.apply_holding(instance.custody.treasury.workshop, carat, {'gold': -instance.weight})
@@ -0,0 +1,58 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.urls import reverse
+from finance.treasury_models import Treasury, TreasuryTransaction
+from finance.models import Account, FinanceSettings, JournalEntry, LedgerEntry, AccountDailyBalance
+from finance.services import DailyBalanceService
+from decimal import Decimal
+import datetime
+
+class DailyBalanceRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', password='password')
+        self.cash_acc = Account.objects.create(code="101", name="Cash Account", account_type="asset")
+        self.revenue_acc = Account.objects.create(code="401", name="Sales Revenue", account_type="revenue")
+        FinanceSettings.objects.create(cash_account=self.cash_acc, sales_revenue_account=self.revenue_acc)
+        self.treasury = Treasury.objects.create(
+            name="Main Treasury", code="TR-001", linked_account=self.cash_acc, responsible_user=self.user
+        )
+
+    def test_treasury_posting_updates_rollup(self):
+        """Auto-posted journal lines are accumulated into the daily rollup"""
+        for amount in ('100.00', '250.00'):
+            TreasuryTransaction.objects.create(
+                treasury=self.treasury, transaction_type='cash_in',
+                cash_amount=Decimal(amount), description="Sale", created_by=self.user
+            )
+        row = AccountDailyBalance.objects.get(account=self.cash_acc)
+        self.assertEqual(row.debit, Decimal('350.00'))
+        self.assertEqual(AccountDailyBalance.objects.get(account=self.revenue_acc).credit, Decimal('350.00'))
+        self.assertEqual(DailyBalanceService.verify(), [])
+
+    def test_rebuild_matches_ledger(self):
+        """Rebuild recreates the rollup from raw ledger lines written without the service"""
+        je = JournalEntry.objects.create(reference="MAN-1", date=datetime.date(2026, 1, 5))
+        LedgerEntry.objects.create(journal_entry=je, account=self.cash_acc, debit=40, credit=0)
+        LedgerEntry.objects.create(journal_entry=je, account=self.revenue_acc, debit=0, credit=40)
+        self.assertEqual(len(DailyBalanceService.verify()), 2)
+
+        DailyBalanceService.rebuild()
+        self.assertEqual(DailyBalanceService.verify(), [])
+
+    def test_trial_balance_uses_rollup(self):
+        """Opening and period columns are split by date using the rollup"""
+        old = JournalEntry.objects.create(reference="OLD", date=datetime.date(2026, 1, 10))
+        LedgerEntry.objects.create(journal_entry=old, account=self.cash_acc, debit=70, credit=0)
+        LedgerEntry.objects.create(journal_entry=old, account=self.revenue_acc, debit=0, credit=70)
+        new = JournalEntry.objects.create(reference="NEW", date=datetime.date(2026, 2, 3))
+        LedgerEntry.objects.create(journal_entry=new, account=self.cash_acc, debit=30, credit=0)
+        LedgerEntry.objects.create(journal_entry=new, account=self.revenue_acc, debit=0, credit=30)
+        DailyBalanceService.rebuild()
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('finance:trial_balance'), {'start_date': '2026-02-01', 'end_date': '2026-02-28'})
+        self.assertEqual(response.status_code, 200)
+        row = next(r for r in response.context['data'] if r['account'] == self.cash_acc)
+        self.assertEqual(row['op_debit'], Decimal('70'))
+        self.assertEqual(row['p_debit'], Decimal('30'))
+        self.assertTrue(response.context['is_balanced'])
@@ -0,0 +1,80 @@
+from django.test import TestCase
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from finance.models import Account, JournalEntry, LedgerEntry, AccountDailyBalance, FinanceSettings
+from finance.services import JournalPoster, FinanceLookup
+from decimal import Decimal
+import datetime
+
+class JournalPosterTests(TestCase):
+    def setUp(self):
+        self.cash_acc = Account.objects.create(code="101", name="Cash", account_type="asset")
+        self.gold_acc = Account.objects.create(code="102", name="Gold Inventory", account_type="asset")
+        self.revenue_acc = Account.objects.create(code="401", name="Revenue", account_type="revenue")
+
+    def test_post_creates_lines_and_rollup(self):
+        journal = JournalPoster.post(
+            reference="JP-1", date=datetime.date(2026, 3, 1),
+            lines=[
+                {'account': self.cash_acc, 'debit': Decimal('120.50')},
+                {'account': self.revenue_acc, 'credit': Decimal('120.50')},
+            ],
+        )
+        self.assertEqual(journal.ledger_entries.count(), 2)
+        self.assertEqual(AccountDailyBalance.objects.get(account=self.cash_acc).debit, Decimal('120.50'))
+        # Account.balance is an opening base and is not moved unless asked
+        self.cash_acc.refresh_from_db()
+        self.assertEqual(self.cash_acc.balance, Decimal('0'))
+
+    def test_unbalanced_entry_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            JournalPoster.post(reference="JP-2", lines=[
+                {'account': self.cash_acc, 'debit': 100},
+                {'account': self.revenue_acc, 'credit': 90},
+            ])
+        with self.assertRaises(ValidationError):
+            JournalPoster.post(reference="JP-3", lines=[
+                {'account': self.gold_acc, 'debit': 100, 'gold_debit': 2},
+                {'account': self.revenue_acc, 'credit': 100},
+            ])
+        self.assertFalse(JournalEntry.objects.exists())
+        self.assertFalse(LedgerEntry.objects.exists())
+
+    def test_update_balances_uses_natural_side(self):
+        JournalPoster.post(
+            reference="JP-4", check_gold=False, update_balances=True,
+            lines=[
+                {'account': self.cash_acc, 'debit': 300},
+                {'account': self.gold_acc, 'credit': 200, 'gold_credit': Decimal('4.5')},
+                {'account': self.revenue_acc, 'credit': 100},
+            ],
+        )
+        for acc in (self.cash_acc, self.gold_acc, self.revenue_acc):
+            acc.refresh_from_db()
+        self.assertEqual(self.cash_acc.balance, Decimal('300'))
+        self.assertEqual(self.gold_acc.balance, Decimal('-200'))
+        self.assertEqual(self.gold_acc.gold_balance, Decimal('-4.5'))
+        self.assertEqual(self.revenue_acc.balance, Decimal('100'))
+
+
+class FinanceLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cash_acc = Account.objects.create(code="101", name="Cash", account_type="asset")
+
+    def test_settings_and_accounts_are_cached(self):
+        FinanceSettings.objects.create(cash_account=self.cash_acc)
+        FinanceLookup.settings()
+        FinanceLookup.account('101')
+        with self.assertNumQueries(0):
+            self.assertEqual(FinanceLookup.settings().cash_account, self.cash_acc)
+            self.assertEqual(FinanceLookup.account('101'), self.cash_acc)
+            self.assertIsNone(FinanceLookup.account('999'))
+
+    def test_saving_invalidates_cache(self):
+        self.assertIsNone(FinanceLookup.settings())
+        self.assertIsNone(FinanceLookup.account('5303'))
+        FinanceSettings.objects.create(cash_account=self.cash_acc)
+        Account.objects.create(code="5303", name="Commissions", account_type="expense")
+        self.assertIsNotNone(FinanceLookup.settings())
+        self.assertEqual(FinanceLookup.account('5303').name, "Commissions")
@@ -0,0 +1,202 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from core.models import Carat
+from inventory.models import Item
+from manufacturing.models import Workshop
+from finance.treasury_models import Treasury
+from decimal import Decimal
+import datetime
+
+class GoldPositionReportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', password='password')
+        self.client.force_login(self.user)
+        self.c18 = Carat.objects.create(name="عيار 18", purity=Decimal('0.7500'))
+        self.c21 = Carat.objects.create(name="عيار 21", purity=Decimal('0.8750'))
+
+    def test_position_by_purity_with_treasury_and_pure_weight(self):
+        Item.objects.create(name="Ring", carat=self.c21, gross_weight=8, net_gold_weight=8)
+        Workshop.objects.create(name="WS", gold_balance_21=Decimal('2'), filings_balance_21=Decimal('1'))
+        Treasury.objects.create(name="Main", code="TR-1", gold_balance_18=Decimal('4'), responsible_user=self.user)
+
+        response = self.client.get(reverse('finance:gold_position'))
+        rows = {r['carat'].id: r for r in response.context['position_data']}
+        self.assertEqual(rows[self.c21.id]['total'], Decimal('11'))
+        self.assertEqual(rows[self.c18.id]['treasury'], Decimal('4'))
+        self.assertEqual(rows[self.c18.id]['pure_24'], Decimal('3'))
+        self.assertEqual(response.context['total_pure_24'], Decimal('3') + Decimal('11') * Decimal('0.875'))
+
+    def test_query_count_is_constant(self):
+        url = reverse('finance:gold_position')
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        for i in range(5):
+            Carat.objects.create(name=f"Extra {i}", purity=Decimal('0.9167'))
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(url)
+        self.assertEqual(len(before), len(after))
+
+
+class TreasuryHandoverReportTests(TestCase):
+    def setUp(self):
+        from finance.treasury_models import TreasuryTransaction
+        self.user = User.objects.create_superuser(username='admin', password='password')
+        self.client.force_login(self.user)
+        self.c18 = Carat.objects.create(name="عيار 18", purity=Decimal('0.7500'))
+        self.treasury = Treasury.objects.create(name="Main", code="TR-1", responsible_user=self.user)
+        for trx_type, cash, gold in [('cash_in', 500, 0), ('cash_out', 120, 0), ('gold_in', 0, 10), ('gold_out', 0, 4)]:
+            TreasuryTransaction.objects.create(
+                treasury=self.treasury, transaction_type=trx_type, cash_amount=Decimal(cash),
+                gold_weight=Decimal(gold), gold_carat=self.c18, description="حركة", created_by=self.user,
+            )
+
+    def _add_workshop_orders(self, count):
+        from manufacturing.models import ManufacturingOrder
+        for _ in range(count):
+            ws = Workshop.objects.create(name=f"WS {Workshop.objects.count()}")
+            for n in range(2):
+                ManufacturingOrder.objects.create(
+                    order_number=f"MO-{ws.pk}-{n}", workshop=ws, carat=self.c18, input_weight=Decimal('10'),
+                    scrap_weight=Decimal('0.5'), status='draft',
+                )
+
+    def test_totals_and_workshop_section(self):
+        self._add_workshop_orders(2)
+        response = self.client.get(reverse('finance:treasury_handover_report'), {'treasury_id': self.treasury.pk})
+        ctx = response.context
+        self.assertEqual((ctx['cash_in'], ctx['cash_out']), (Decimal('500'), Decimal('120')))
+        self.assertEqual((ctx['gold_in_total'], ctx['gold_out_total']), (Decimal('10'), Decimal('4')))
+        self.assertEqual(ctx['opening_cash'], Decimal('0'))
+        self.assertEqual(len(ctx['scrap_data']), 2)
+        self.assertEqual(ctx['scrap_data'][0]['input_total'], Decimal('20'))
+        self.assertEqual(ctx['scrap_data'][0]['scrap_total'], Decimal('1'))
+        self.assertEqual(len(ctx['scrap_data'][0]['items']), 2)
+
+    def test_query_count_does_not_grow_with_workshops(self):
+        url = reverse('finance:treasury_handover_report')
+        self._add_workshop_orders(2)
+        self.client.get(url, {'treasury_id': self.treasury.pk})  # warm the cached gold prices
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url, {'treasury_id': self.treasury.pk})
+        self._add_workshop_orders(40)
+        with CaptureQueriesContext(connection) as after:
+            self.client.get(url, {'treasury_id': self.treasury.pk})
+        self.assertEqual(len(before), len(after))
+
+
+class MonthlyAnalyticsSectionTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from finance.models import Account
+        cache.clear()
+        self.user = User.objects.create_superuser(username='admin', password='password')
+        self.revenue = Account.objects.create(code="401", name="Revenue", account_type="revenue")
+        self.expense = Account.objects.create(code="501", name="Expense", account_type="expense")
+        self.cash = Account.objects.create(code="101", name="Cash", account_type="asset")
+        self.today = timezone.localdate()
+        self.last_month = (self.today.replace(day=1) - datetime.timedelta(days=1)).replace(day=15)
+
+    def _post(self, day, revenue=Decimal('0'), expense=Decimal('0')):
+        from finance.services import JournalPoster
+        JournalPoster.post("TEST", [
+            {'account': self.cash, 'debit': revenue, 'credit': expense},
+            {'account': self.revenue, 'credit': revenue},
+            {'account': self.expense, 'debit': expense},
+        ], date=day)
+
+    def test_closed_month_is_served_from_cache_until_a_late_posting(self):
+        from finance.services import MonthlyAnalyticsService as analytics
+        self._post(self.last_month, revenue=Decimal('1000'), expense=Decimal('300'))
+        start, end = analytics.period_range('monthly', self.last_month.year, self.last_month.month)
+
+        self.assertEqual(analytics.ledger_metrics(start, end)['profit'], Decimal('700'))
+        with self.assertNumQueries(0):
+            analytics.ledger_metrics(start, end)
+
+        self._post(self.last_month, expense=Decimal('100'))
+        self.assertEqual(analytics.ledger_metrics(start, end)['profit'], Decimal('600'))
+
+    def test_evicted_stamp_does_not_serve_stale_sections(self):
+        from django.core.cache import cache
+        from finance.services import MonthlyAnalyticsService as analytics
+        self._post(self.last_month, revenue=Decimal('1000'))
+        start, end = analytics.period_range('monthly', self.last_month.year, self.last_month.month)
+        self.assertEqual(analytics.ledger_metrics(start, end)['revenue'], Decimal('1000'))
+
+        # Stamp culled, then a late posting: the new stamp must not match the one cached above
+        cache.delete(analytics._stamp_key(self.last_month.year))
+        self._post(self.last_month, revenue=Decimal('500'))
+        self.assertEqual(analytics.ledger_metrics(start, end)['revenue'], Decimal('1500'))
+
+    def test_closed_month_stone_usage_is_recomputed_after_a_late_stone(self):
+        from finance.services import MonthlyAnalyticsService as analytics
+        from manufacturing.models import ManufacturingOrder, OrderStone, Stone
+        c21 = Carat.objects.create(name="21K", purity=Decimal('0.8750'))
+        order = ManufacturingOrder.objects.create(order_number="MO-S", carat=c21, input_weight=Decimal('5'))
+        ManufacturingOrder.objects.filter(pk=order.pk).update(start_date=self.last_month)
+        order.refresh_from_db()
+        stone = Stone.objects.create(name="زركون", unit='carat')
+        OrderStone.objects.create(order=order, stone=stone, quantity_issued=Decimal('5'))
+        start, end = analytics.period_range('monthly', self.last_month.year, self.last_month.month)
+
+        self.assertEqual(analytics.stone_usage(start, end)['total_weight'], Decimal('5'))
+        with self.assertNumQueries(0):
+            analytics.stone_usage(start, end)
+
+        OrderStone.objects.create(order=order, stone=stone, quantity_issued=Decimal('3'))
+        self.assertEqual(analytics.stone_usage(start, end)['total_weight'], Decimal('8'))
+
+    def test_open_month_is_recomputed(self):
+        from finance.services import MonthlyAnalyticsService as analytics
+        start, end = analytics.period_range('monthly', self.today.year, self.today.month)
+        self._post(self.today, revenue=Decimal('500'))
+        self.assertEqual(analytics.ledger_metrics(start, end)['revenue'], Decimal('500'))
+        self._post(self.today, revenue=Decimal('250'))
+        self.assertEqual(analytics.ledger_metrics(start, end)['revenue'], Decimal('750'))
+
+    def test_period_ranges(self):
+        from finance.services import MonthlyAnalyticsService as analytics
+        self.assertEqual(analytics.period_range('monthly', 2024, 2), (datetime.date(2024, 2, 1), datetime.date(2024, 2, 29)))
+        self.assertEqual(analytics.period_range('quarterly', 2024, 11), (datetime.date(2024, 10, 1), datetime.date(2024, 12, 31)))
+        self.assertEqual(analytics.period_range('semi_annual', 2024, 3), (datetime.date(2024, 1, 1), datetime.date(2024, 6, 30)))
+        self.assertEqual(analytics.period_range('annual', 2024, 7), (datetime.date(2024, 1, 1), datetime.date(2024, 12, 31)))
+
+    def test_report_sections_are_aggregated(self):
+        from core.models import Branch
+        from manufacturing.models import ManufacturingOrder, ProductionStage
+        from sales.models import Invoice, InvoiceItem
+        c21 = Carat.objects.create(name="21K", purity=Decimal('0.8750'))
+        self._post(self.today, revenue=Decimal('1000'), expense=Decimal('200'))
+        order = ManufacturingOrder.objects.create(
+            order_number="MO-1", carat=c21, input_weight=Decimal('5'), item_name_pattern="خاتم"
+        )
+        now = timezone.now()
+        for hours in (1, 3):
+            ProductionStage.objects.create(
+                order=order, stage_name='casting', input_weight=Decimal('5'),
+                start_datetime=now - datetime.timedelta(hours=hours), end_datetime=now,
+            )
+        branch = Branch.objects.create(name="Main")
+        for n in range(2):
+            item = Item.objects.create(barcode=f"AN-{n}", name="Ring", carat=c21, gross_weight=4, net_gold_weight=4)
+            invoice = Invoice.objects.create(invoice_number=f"AN-{n}", branch=branch, created_by=self.user)
+            InvoiceItem.objects.create(
+                invoice=invoice, item=item, sold_weight=Decimal('4'), sold_gold_price=Decimal('3000'),
+                sold_labor_fee=Decimal('400'), subtotal=Decimal('12400'),
+            )
+        ManufacturingOrder.objects.filter(pk=order.pk).update(resulting_item=Item.objects.get(barcode="AN-0"))
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('finance:monthly_analytics_report'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['net_profit'], Decimal('800'))
+        self.assertEqual(response.context['efficiency_data'], [
+            {'stage': dict(ProductionStage.STAGE_CHOICES)['casting'], 'avg_duration': '2:00:00', 'count': 2}
+        ])
+        products = dict(response.context['top_products'])
+        self.assertEqual(set(products), {"خاتم", "قطعة عامة"})
+        self.assertEqual(products["خاتم"]['count'], 1)
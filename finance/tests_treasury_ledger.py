@@ -0,0 +1,131 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.utils import timezone
+from core.models import Carat
+from finance.services import TreasuryLedgerService
+from finance.treasury_models import Treasury, TreasuryTransaction
+
+
+class TreasuryRunningBalanceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('keeper')
+        self.c21 = Carat.objects.create(name="21K", purity=Decimal('0.8750'))
+        self.treasury = Treasury.objects.create(name="Main", code="TR-1", responsible_user=self.user)
+        self.today = timezone.localdate()
+
+    def _trx(self, transaction_type, days_ago=0, **amounts):
+        return TreasuryTransaction.objects.create(
+            treasury=self.treasury, transaction_type=transaction_type, date=self.today - timedelta(days=days_ago),
+            description="حركة", created_by=self.user, **amounts
+        )
+
+    def _after(self, trx):
+        trx.refresh_from_db()
+        return trx.balance_after_cash, trx.balance_after_gold_21
+
+    def test_balance_after_is_stored_per_transaction(self):
+        first = self._trx('cash_in', cash_amount=Decimal('100'))
+        second = self._trx('gold_in', gold_weight=Decimal('5'), gold_carat=self.c21)
+        third = self._trx('cash_out', cash_amount=Decimal('30'))
+        self.assertEqual(self._after(first), (Decimal('100'), Decimal('0')))
+        self.assertEqual(self._after(second), (Decimal('100'), Decimal('5')))
+        self.assertEqual(self._after(third), (Decimal('70'), Decimal('5')))
+        second.refresh_from_db()
+        self.assertEqual(second.balance_after_gold, Decimal('5'))
+
+    def test_back_dated_transaction_shifts_later_rows(self):
+        today = self._trx('cash_in', cash_amount=Decimal('100'))
+        earlier = self._trx('cash_in', days_ago=2, cash_amount=Decimal('40'))
+        self.assertEqual(self._after(earlier), (Decimal('40'), Decimal('0')))
+        self.assertEqual(self._after(today), (Decimal('140'), Decimal('0')))
+
+    def test_back_dated_gold_transaction_shifts_later_rows(self):
+        today = self._trx('gold_in', gold_weight=Decimal('5'), gold_carat=self.c21)
+        earlier = self._trx('gold_in', days_ago=2, gold_weight=Decimal('2'), gold_carat=self.c21)
+        self.assertEqual(self._after(earlier), (Decimal('0'), Decimal('2')))
+        self.assertEqual(self._after(today), (Decimal('0'), Decimal('7')))
+        earlier.refresh_from_db()
+        today.refresh_from_db()
+        self.assertEqual((earlier.balance_after_gold, today.balance_after_gold), (Decimal('2'), Decimal('7')))
+
+    def test_opening_and_closing_balances(self):
+        self._trx('cash_in', days_ago=1, cash_amount=Decimal('100'))
+        self._trx('cash_out', cash_amount=Decimal('25'))
+        self._trx('gold_in', gold_weight=Decimal('3'), gold_carat=self.c21)
+        opening = TreasuryLedgerService.balances_at(self.treasury, self.today, opening=True)
+        closing = TreasuryLedgerService.balances_at(self.treasury, self.today)
+        self.assertEqual((opening['cash'], opening['gold_21']), (Decimal('100'), Decimal('0')))
+        self.assertEqual((closing['cash'], closing['gold_21']), (Decimal('75'), Decimal('3')))
+
+        # Before the first transaction: the balance the treasury started with
+        before = TreasuryLedgerService.balances_at(self.treasury, self.today - timedelta(days=5))
+        self.assertEqual(before['cash'], Decimal('0'))
+
+    def test_rebuild_repairs_stale_rows(self):
+        first = self._trx('cash_in', days_ago=1, cash_amount=Decimal('100'))
+        second = self._trx('gold_in', gold_weight=Decimal('4'), gold_carat=self.c21)
+        TreasuryTransaction.objects.update(balance_after_cash=0, balance_after_gold_21=0, balance_after_gold=0)
+
+        self.assertEqual(TreasuryLedgerService.rebuild(), 2)
+        self.assertEqual(self._after(first), (Decimal('100'), Decimal('0')))
+        self.assertEqual(self._after(second), (Decimal('100'), Decimal('4')))
+        self.assertEqual(second.balance_after_gold, Decimal('4'))
+        # Nothing left to fix
+        self.assertEqual(TreasuryLedgerService.rebuild(), 0)
+
+
+class TreasuryCloseTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('keeper')
+        self.c21 = Carat.objects.create(name="21K", purity=Decimal('0.8750'))
+        self.today = timezone.localdate()
+        self.treasuries = [
+            Treasury.objects.create(name=f"Branch {n}", code=f"TR-{n}", responsible_user=self.user) for n in range(6)
+        ]
+        for n, treasury in enumerate(self.treasuries):
+            TreasuryTransaction.objects.create(
+                treasury=treasury, transaction_type='cash_in', cash_amount=Decimal('100'),
+                date=self.today - timedelta(days=1), description="افتتاح", created_by=self.user,
+            )
+            TreasuryTransaction.objects.create(
+                treasury=treasury, transaction_type='gold_in', gold_weight=Decimal(n + 1), gold_carat=self.c21,
+                date=self.today, description="استلام", created_by=self.user,
+            )
+        Treasury.objects.create(name="Closed branch", code="TR-X", is_active=False, responsible_user=self.user)
+
+    def test_closes_all_active_treasuries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from finance.services import TreasuryCloseService
+        from finance.treasury_models import DailyTreasuryReport
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(TreasuryCloseService.close_day(self.today, chunk_size=4), 6)
+        # Per chunk, not per treasury
+        self.assertLess(len(ctx.captured_queries), 30)
+
+        reports = DailyTreasuryReport.objects.filter(date=self.today)
+        self.assertEqual(reports.count(), 6)
+        report = reports.get(treasury=self.treasuries[2])
+        self.assertTrue(report.is_closed)
+        self.assertEqual((report.opening_cash, report.closing_cash), (Decimal('100'), Decimal('100')))
+        self.assertEqual((report.opening_gold_21, report.closing_gold_21), (Decimal('0'), Decimal('3')))
+        self.assertEqual(report.total_gold_in, Decimal('3'))
+
+    def test_rerun_only_closes_pending_reports(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from finance.services import TreasuryCloseService
+        from finance.treasury_models import DailyTreasuryReport
+        DailyTreasuryReport.objects.create(treasury=self.treasuries[0], date=self.today, is_closed=True, notes="يدوي")
+        DailyTreasuryReport.objects.create(treasury=self.treasuries[1], date=self.today)
+
+        call_command('close_treasuries', date=self.today.isoformat(), stdout=StringIO())
+        self.assertEqual(DailyTreasuryReport.objects.filter(date=self.today, is_closed=True).count(), 6)
+        manual = DailyTreasuryReport.objects.get(treasury=self.treasuries[0], date=self.today)
+        self.assertEqual(manual.closing_gold_21, Decimal('0'))
+        reopened = DailyTreasuryReport.objects.get(treasury=self.treasuries[1], date=self.today)
+        self.assertEqual(reopened.closing_gold_21, Decimal('2'))
+
+        self.assertEqual(TreasuryCloseService.close_day(self.today), 0)
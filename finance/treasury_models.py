@@ -116,6 +116,9 @@ class TreasuryTransaction(models.Model):
     # الأرصدة بعد الحركة
     balance_after_cash = models.DecimalField("الرصيد بعد الحركة", max_digits=15, decimal_places=2, default=0)
     balance_after_gold = models.DecimalField("رصيد الذهب بعد الحركة", max_digits=15, decimal_places=3, default=0)
+    balance_after_gold_18 = models.DecimalField("رصيد ذهب 18 بعد الحركة", max_digits=15, decimal_places=3, default=0)
+    balance_after_gold_21 = models.DecimalField("رصيد ذهب 21 بعد الحركة", max_digits=15, decimal_places=3, default=0)
+    balance_after_gold_24 = models.DecimalField("رصيد ذهب 24 بعد الحركة", max_digits=15, decimal_places=3, default=0)
     balance_after_gold_casting = models.DecimalField("رصيد السبك بعد الحركة", max_digits=15, decimal_places=3, default=0)
     balance_after_stones = models.DecimalField("رصيد الأحجار بعد الحركة", max_digits=15, decimal_places=3, default=0)
     
@@ -126,6 +129,12 @@ class TreasuryTransaction(models.Model):
         verbose_name = "حركة خزينة"
         verbose_name_plural = "حركات الخزينة"
         ordering = ['-date', '-created_at']
+        indexes = [
+            # Daily treasury totals (handover report, daily close)
+            models.Index(fields=['treasury', 'date', 'transaction_type'], name='fin_trx_treasury_date_type_idx'),
+            # Running balance order: last transaction on or before a date
+            models.Index(fields=['treasury', 'date', 'created_at', 'id'], name='fin_trx_treasury_running_idx'),
+        ]
     
     def __str__(self):
         return f"{self.get_transaction_type_display()} - {self.date}"
@@ -6,8 +6,9 @@ from django.utils import timezone
 import datetime
 from decimal import Decimal
 
-from .models import Account, JournalEntry, LedgerEntry, FiscalYear, OpeningBalance, Partner
+from .models import Account, JournalEntry, LedgerEntry, FiscalYear, OpeningBalance, Partner, AccountDailyBalance
 from .treasury_models import Treasury, TreasuryTransaction, TreasuryTransfer
+from .services import MonthlyAnalyticsService, TreasuryLedgerService, TreasuryReportService
 from manufacturing.models import Workshop, ManufacturingOrder, WorkshopTransfer, ProductionStage
 
 @staff_member_required
@@ -32,19 +33,19 @@ def trial_balance(request):
     accounts = Account.objects.all().order_by('code')
     active_year = FiscalYear.objects.filter(is_active=True).first()
     
-    # 1. Bulk Aggregate Opening Entries (BEFORE start_date)
-    opening_aggr = LedgerEntry.objects.filter(
-        journal_entry__date__lt=start_date
+    # 1. Opening sums (BEFORE start_date) from the daily rollup - one row per account/day
+    opening_aggr = AccountDailyBalance.objects.filter(
+        date__lt=start_date
     ).values('account_id').annotate(
         op_debit=Coalesce(Sum('debit'), Decimal('0')),
         op_credit=Coalesce(Sum('credit'), Decimal('0'))
     )
     opening_map = {item['account_id']: item for item in opening_aggr}
     
-    # 2. Bulk Aggregate Period Entries (BETWEEN start_date AND end_date)
-    period_aggr = LedgerEntry.objects.filter(
-        journal_entry__date__gte=start_date,
-        journal_entry__date__lte=end_date
+    # 2. Period sums (BETWEEN start_date AND end_date) from the daily rollup
+    period_aggr = AccountDailyBalance.objects.filter(
+        date__gte=start_date,
+        date__lte=end_date
     ).values('account_id').annotate(
         p_debit=Coalesce(Sum('debit'), Decimal('0')),
         p_credit=Coalesce(Sum('credit'), Decimal('0'))
@@ -295,48 +296,58 @@ def income_statement(request):
 @staff_member_required
 def gold_position(request):
     """موقف الذهب (Gold Position) - أرصدة الأوزان"""
-    from manufacturing.models import Workshop
-    from core.models import Carat
+    from core.models import Carat, HoldingBalance
     from inventory.models import Item, RawMaterial
     
     carats = Carat.objects.filter(is_active=True).order_by('-name')
     
-    position_data = []
+    # One grouped query per source (constant cost regardless of carat count)
+    # 1. Inventory Gold (Finished Items) by carat
+    inv_map = dict(Item.objects.filter(status='available').values('carat_id').annotate(
+        w=Sum('net_gold_weight')).order_by().values_list('carat_id', 'w'))
+    
+    # 2. Raw Materials by carat
+    raw_map = dict(RawMaterial.objects.filter(carat__isnull=False).values('carat_id').annotate(
+        w=Sum('current_weight')).order_by().values_list('carat_id', 'w'))
+    
+    # 3. Workshops Custody (Gold + Filings) and Treasury gold - one GROUP BY over the unified holdings
+    # Workshop-linked treasuries mirror the workshop balance, so they are excluded
+    holdings = HoldingBalance.objects.filter(
+        Q(holder_type='workshop', bucket__in=['gold', 'filings']) |
+        Q(holder_type='treasury', bucket='gold')
+    ).exclude(
+        holder_type='treasury', holder_id__in=Treasury.objects.filter(workshop__isnull=False).values('pk')
+    ).values('holder_type', 'bucket', 'carat_id').annotate(w=Sum('weight')).order_by()
+    holding_map = {(r['holder_type'], r['bucket'], r['carat_id']): r['w'] for r in holdings}
     
+    position_data = []
+    total_pure = Decimal('0')
     for carat in carats:
-        # 1. Inventory Gold (Finished Items)
-        inv_weight = Item.objects.filter(carat=carat, status='available').aggregate(Sum('net_gold_weight'))['net_gold_weight__sum'] or Decimal('0')
-        
-        # 2. Raw Materials
-        raw_weight = RawMaterial.objects.filter(carat=carat).aggregate(Sum('current_weight'))['current_weight__sum'] or Decimal('0')
-        
-        # 3. Workshops Custody (Gold + Filings)
-        workshop_weight = Decimal('0')
-        filings_weight = Decimal('0')
-        if carat.name == '18' or '18' in carat.name:
-            workshop_weight = Workshop.objects.aggregate(Sum('gold_balance_18'))['gold_balance_18__sum'] or Decimal('0')
-            filings_weight = Workshop.objects.aggregate(Sum('filings_balance_18'))['filings_balance_18__sum'] or Decimal('0')
-        elif carat.name == '21' or '21' in carat.name:
-            workshop_weight = Workshop.objects.aggregate(Sum('gold_balance_21'))['gold_balance_21__sum'] or Decimal('0')
-            filings_weight = Workshop.objects.aggregate(Sum('filings_balance_21'))['filings_balance_21__sum'] or Decimal('0')
-        elif carat.name == '24' or '24' in carat.name:
-            workshop_weight = Workshop.objects.aggregate(Sum('gold_balance_24'))['gold_balance_24__sum'] or Decimal('0')
-            filings_weight = Workshop.objects.aggregate(Sum('filings_balance_24'))['filings_balance_24__sum'] or Decimal('0')
+        inv_weight = inv_map.get(carat.id) or Decimal('0')
+        raw_weight = raw_map.get(carat.id) or Decimal('0')
+        workshop_weight = holding_map.get(('workshop', 'gold', carat.id)) or Decimal('0')
+        filings_weight = holding_map.get(('workshop', 'filings', carat.id)) or Decimal('0')
+        treasury_weight = holding_map.get(('treasury', 'gold', carat.id)) or Decimal('0')
             
-        total_weight = inv_weight + raw_weight + workshop_weight + filings_weight
+        total_weight = inv_weight + raw_weight + workshop_weight + filings_weight + treasury_weight
         
         if total_weight > 0:
+            pure_weight = total_weight * carat.purity
+            total_pure += pure_weight
             position_data.append({
                 'carat': carat,
                 'inventory': inv_weight,
                 'raw': raw_weight,
                 'workshops': workshop_weight,
                 'filings': filings_weight,
-                'total': total_weight
+                'treasury': treasury_weight,
+                'total': total_weight,
+                'pure_24': pure_weight,
             })
             
     context = {
         'position_data': position_data,
+        'total_pure_24': total_pure,
         'title': 'موقف الذهب الحالي'
     }
     return render(request, 'finance/gold_position.html', context)
@@ -374,26 +385,24 @@ def daily_close(request):
             # Create Report
             report, created = DailyTreasuryReport.objects.get_or_create(treasury=treasury, date=today)
             
-            # Snapshots (Opening if first time)
+            # Snapshots (Opening if first time) from the running balance of the last transaction before today
             if created or report.opening_cash == 0:
-                # Approximate opening as current - movements so far
-                txs_today = TreasuryTransaction.objects.filter(treasury=treasury, date=today)
-                cash_in = txs_today.filter(transaction_type__in=['cash_in', 'transfer_in']).aggregate(Sum('cash_amount'))['cash_amount__sum'] or 0
-                cash_out = txs_today.filter(transaction_type__in=['cash_out', 'transfer_out']).aggregate(Sum('cash_amount'))['cash_amount__sum'] or 0
-                report.opening_cash = treasury.cash_balance - Decimal(cash_in) + Decimal(cash_out)
-                
-                # Similar for Gold 21
-                gold_in = txs_today.filter(transaction_type__in=['gold_in', 'transfer_in']).aggregate(Sum('gold_weight'))['gold_weight__sum'] or 0
-                gold_out = txs_today.filter(transaction_type__in=['gold_out', 'transfer_out']).aggregate(Sum('gold_weight'))['gold_weight__sum'] or 0
-                report.opening_gold_21 = treasury.gold_balance_21 - Decimal(gold_in) + Decimal(gold_out)
+                opening = TreasuryLedgerService.balances_at(treasury, today, opening=True)
+                report.opening_cash = opening['cash']
+                report.opening_gold_18 = opening['gold_18']
+                report.opening_gold_21 = opening['gold_21']
+                report.opening_gold_24 = opening['gold_24']
+                report.opening_gold_casting = opening['casting']
+                report.opening_stones = opening['stones']
 
             # Closing Snapshots
-            report.closing_cash = treasury.cash_balance
-            report.closing_gold_18 = treasury.gold_balance_18
-            report.closing_gold_21 = treasury.gold_balance_21
-            report.closing_gold_24 = treasury.gold_balance_24
-            report.closing_gold_casting = treasury.gold_casting_balance
-            report.closing_stones = treasury.stones_balance
+            closing = TreasuryLedgerService.balances_at(treasury, today)
+            report.closing_cash = closing['cash']
+            report.closing_gold_18 = closing['gold_18']
+            report.closing_gold_21 = closing['gold_21']
+            report.closing_gold_24 = closing['gold_24']
+            report.closing_gold_casting = closing['casting']
+            report.closing_stones = closing['stones']
             
             # Actuals from Form
             report.actual_cash = actual_cash
@@ -618,45 +627,48 @@ def treasury_handover_report(request):
     received_transfers = TreasuryTransfer.objects.filter(to_treasury=treasury, date=report_date)
     sent_transfers = TreasuryTransfer.objects.filter(from_treasury=treasury, date=report_date)
     
-    cash_in = txs.filter(transaction_type__in=['cash_in', 'transfer_in']).aggregate(Sum('cash_amount'))['cash_amount__sum'] or Decimal('0')
-    cash_out = txs.filter(transaction_type__in=['cash_out', 'transfer_out']).aggregate(Sum('cash_amount'))['cash_amount__sum'] or Decimal('0')
-    
-    gold_in_18 = txs.filter(transaction_type__in=['gold_in', 'transfer_in']).aggregate(Sum('gold_weight'))['gold_weight__sum'] or Decimal('0')
-    gold_out_18 = txs.filter(transaction_type__in=['gold_out', 'transfer_out']).aggregate(Sum('gold_weight'))['gold_weight__sum'] or Decimal('0')
+    # All day totals in one conditional-aggregate query
+    totals = TreasuryReportService.day_totals(treasury, report_date)
+    cash_in, cash_out = totals['cash_in'], totals['cash_out']
+    gold_in_18, gold_out_18 = totals['gold_in'], totals['gold_out']
     
     # 2. Production Flow & Scrap (الخسية)
-    # Filter orders that entered today
-    today_orders = ManufacturingOrder.objects.filter(start_date=report_date)
+    # Orders that entered today: one grouped query for the workshop totals, one for the orders
+    today_orders = ManufacturingOrder.objects.filter(start_date=report_date, workshop__isnull=False)
+    ws_totals = today_orders.values('workshop').annotate(
+        input_total=Coalesce(Sum('input_weight'), Value(Decimal('0'))),
+        scrap_total=Coalesce(Sum('scrap_weight'), Value(Decimal('0'))),
+    ).order_by('workshop')
+    
+    orders_by_ws = {}
+    for order in today_orders.select_related('carat', 'workshop').prefetch_related('stages').order_by('id'):
+        orders_by_ws.setdefault(order.workshop_id, []).append(order)
     
     scrap_data = []
-    workshops = Workshop.objects.all()
-    for ws in workshops:
-        ws_orders = today_orders.filter(workshop=ws)
-        if ws_orders.exists():
-            ws_scrap_total = ws_orders.aggregate(Sum('scrap_weight'))['scrap_weight__sum'] or Decimal('0')
-            ws_input_total = ws_orders.aggregate(Sum('input_weight'))['input_weight__sum'] or Decimal('0')
-            
-            items_details = []
-            for order in ws_orders:
-                items_details.append({
-                    'order_number': order.order_number,
-                    'carat': order.carat.name,
-                    'input_weight': order.input_weight,
-                    'stones_weight': order.total_stone_weight, # Added for Tahyaaf display
-                    'scrap_weight': order.scrap_weight,
-                    'net_weight': order.input_weight - order.scrap_weight,
-                    'scrap_percent': (order.scrap_weight / order.input_weight * 100) if order.input_weight > 0 else 0,
-                    'stages': order.stages.all() 
-                })
-                
-            scrap_data.append({
-                'workshop': ws,
-                'input_total': ws_input_total,
-                'scrap_total': ws_scrap_total,
-                'net_total': ws_input_total - ws_scrap_total,
-                'scrap_percent_avg': (ws_scrap_total / ws_input_total * 100) if ws_input_total > 0 else 0,
-                'items': items_details
+    for row in ws_totals:
+        ws_orders = orders_by_ws.get(row['workshop'], [])
+        ws_input_total, ws_scrap_total = row['input_total'], row['scrap_total']
+        items_details = []
+        for order in ws_orders:
+            items_details.append({
+                'order_number': order.order_number,
+                'carat': order.carat.name,
+                'input_weight': order.input_weight,
+                'stones_weight': order.total_stone_weight, # Added for Tahyaaf display
+                'scrap_weight': order.scrap_weight,
+                'net_weight': order.input_weight - order.scrap_weight,
+                'scrap_percent': (order.scrap_weight / order.input_weight * 100) if order.input_weight > 0 else 0,
+                'stages': order.stages.all() 
             })
+            
+        scrap_data.append({
+            'workshop': ws_orders[0].workshop,
+            'input_total': ws_input_total,
+            'scrap_total': ws_scrap_total,
+            'net_total': ws_input_total - ws_scrap_total,
+            'scrap_percent_avg': (ws_scrap_total / ws_input_total * 100) if ws_input_total > 0 else 0,
+            'items': items_details
+        })
 
     # 3. Inter-Workshop Transfers (حركة التنقل بين الأقسام)
     ws_transfers = WorkshopTransfer.objects.filter(date=report_date)
@@ -668,14 +680,9 @@ def treasury_handover_report(request):
         opening_cash = report.opening_cash
         opening_gold_18 = report.opening_gold_18
     else:
-        txs_all = TreasuryTransaction.objects.filter(treasury=treasury, date=report_date)
-        cash_in_all = txs_all.filter(transaction_type__in=['cash_in', 'transfer_in']).aggregate(Sum('cash_amount'))['cash_amount__sum'] or Decimal('0')
-        cash_out_all = txs_all.filter(transaction_type__in=['cash_out', 'transfer_out']).aggregate(Sum('cash_amount'))['cash_amount__sum'] or Decimal('0')
-        opening_cash = treasury.cash_balance - cash_in_all + cash_out_all
-        
-        gold_in_all = txs_all.filter(transaction_type__in=['gold_in', 'transfer_in']).aggregate(Sum('gold_weight'))['gold_weight__sum'] or Decimal('0')
-        gold_out_all = txs_all.filter(transaction_type__in=['gold_out', 'transfer_out']).aggregate(Sum('gold_weight'))['gold_weight__sum'] or Decimal('0')
-        opening_gold_18 = treasury.gold_balance_18 - gold_in_all + gold_out_all
+        opening = TreasuryLedgerService.balances_at(treasury, report_date, opening=True)
+        opening_cash = opening['cash']
+        opening_gold_18 = opening['gold_18']
 
     context = {
         'treasury': treasury,
@@ -727,11 +734,8 @@ def treasury_comparison_report(request):
         if report and report.opening_gold_18:
             return report.opening_gold_18
         
-        # Fallback calculation if report doesn't exist
-        txs_today = TreasuryTransaction.objects.filter(treasury=treasury, date=date)
-        gold_in = txs_today.filter(transaction_type__in=['gold_in', 'transfer_in'], gold_carat__name__contains='18').aggregate(Sum('gold_weight'))['gold_weight__sum'] or Decimal('0')
-        gold_out = txs_today.filter(transaction_type__in=['gold_out', 'transfer_out'], gold_carat__name__contains='18').aggregate(Sum('gold_weight'))['gold_weight__sum'] or Decimal('0')
-        return treasury.gold_balance_18 - gold_in + gold_out
+        # Fallback: running balance after the last transaction before the date
+        return TreasuryLedgerService.balances_at(treasury, date, opening=True)['gold_18']
 
     main_opening = get_opening_gold_18(main_treasury, report_date)
     prod_opening = get_opening_gold_18(prod_treasury, report_date)
@@ -858,186 +862,56 @@ def generate_advanced_ai_insights(
 @staff_member_required
 def monthly_analytics_report(request):
     """تقرير تحليلي شهري شامل (مالي - إنتاج - خطة عمل) - Optimized"""
-    from django.db.models import Avg, Sum, Count, F, DurationField, ExpressionWrapper, Q, Case, When, Value, DecimalField
-    from django.utils import timezone
-    import datetime
-    
+    analytics = MonthlyAnalyticsService
     today = timezone.now().date()
     
     # Range Selection
     report_type = request.GET.get('report_type', 'monthly') # monthly, quarterly, semi_annual, annual
     year = int(request.GET.get('year', today.year))
     month = int(request.GET.get('month', today.month))
+    start_date, end_date = analytics.period_range(report_type, year, month)
     
     if report_type == 'annual':
-        start_date = datetime.date(year, 1, 1)
-        end_date = datetime.date(year, 12, 31)
         title = f"التقرير التحليلي السنوي - {year}"
     elif report_type == 'quarterly':
-        quarter = (month - 1) // 3 + 1
-        start_month = (quarter - 1) * 3 + 1
-        start_date = datetime.date(year, start_month, 1)
-        if quarter == 4:
-            end_date = datetime.date(year, 12, 31)
-        else:
-            end_date = datetime.date(year, start_month + 3, 1) - datetime.timedelta(days=1)
-        title = f"التقرير ربع السنوي (Q{quarter}) - {year}"
+        title = f"التقرير ربع السنوي (Q{(month - 1) // 3 + 1}) - {year}"
     elif report_type == 'semi_annual':
-        if month <= 6:
-            start_date = datetime.date(year, 1, 1)
-            end_date = datetime.date(year, 6, 30)
-            title = f"التقرير نصف السنوي الأول - {year}"
-        else:
-            start_date = datetime.date(year, 7, 1)
-            end_date = datetime.date(year, 12, 31)
-            title = f"التقرير نصف السنوي الثاني - {year}"
+        title = f"التقرير نصف السنوي {'الأول' if month <= 6 else 'الثاني'} - {year}"
     else: # monthly
-        start_date = datetime.date(year, month, 1)
-        if month == 12:
-            end_date = datetime.date(year + 1, 1, 1) - datetime.timedelta(days=1)
-        else:
-            end_date = datetime.date(year, month + 1, 1) - datetime.timedelta(days=1)
         title = f"التقرير التحليلي الشهري - {start_date.strftime('%B %Y')}"
     
-    # 1. Financial Analysis - Aggregated (Fast)
-    metrics = LedgerEntry.objects.filter(
-        journal_entry__date__range=[start_date, end_date]
-    ).aggregate(
-        rev_debit=Coalesce(Sum('debit', filter=Q(account__account_type='revenue')), Decimal('0')),
-        rev_credit=Coalesce(Sum('credit', filter=Q(account__account_type='revenue')), Decimal('0')),
-        exp_debit=Coalesce(Sum('debit', filter=Q(account__account_type='expense')), Decimal('0')),
-        exp_credit=Coalesce(Sum('credit', filter=Q(account__account_type='expense')), Decimal('0')),
-    )
-    total_revenue = metrics['rev_credit'] - metrics['rev_debit']
-    total_expenses = metrics['exp_debit'] - metrics['exp_credit']
-        
-    net_profit = total_revenue - total_expenses
+    # Each section is one aggregate query, cached once the period is closed
+    # 1. Financial Analysis
+    metrics = analytics.ledger_metrics(start_date, end_date)
+    total_revenue = metrics['revenue']
+    total_expenses = metrics['expenses']
+    net_profit = metrics['profit']
     
     # 2. Partner Shares
-    partners = Partner.objects.filter(is_active=True)
-    partner_shares = []
-    # Loop over partners is fine (usually < 10)
-    for partner in partners:
-        share_value = (net_profit * partner.percentage) / 100
-        partner_shares.append({
-            'partner': partner,
-            'share': share_value
-        })
+    partner_shares = analytics.partner_distribution(net_profit)
         
     # 3. Production Efficiency
-    # Optimized: Filter first, then aggregate in Python or annotation
-    stages = ProductionStage.objects.filter(
-        start_datetime__date__range=[start_date, end_date],
-        end_datetime__isnull=False
-    ).select_related('order') # Avoid N+1 if accessed
-
-    # Python-side aggregation for complex duration logic if needed, 
-    # but strictly we can do it faster if we only need per-stage Stats
-    stage_stats = {}
-    for stage in stages:
-        duration = stage.end_datetime - stage.start_datetime
-        name = stage.get_stage_name_display()
-        if name not in stage_stats:
-            stage_stats[name] = {'count': 0, 'total_seconds': 0}
-        stage_stats[name]['count'] += 1
-        stage_stats[name]['total_seconds'] += duration.total_seconds()
-            
-    efficiency_data = []
-    for name, stats in stage_stats.items():
-        avg_seconds = stats['total_seconds'] / stats['count']
-        efficiency_data.append({
-            'stage': name,
-            'avg_duration': str(datetime.timedelta(seconds=int(avg_seconds))),
-            'count': stats['count']
-        })
-        
-    # 4. Product Performance - OPTIMIZED Grouping
-    from sales.models import InvoiceItem
-    
-    # Use values() to group by item name/type at DB level
-    # We need to handle the dynamic item naming pattern logic. 
-    # Since specific naming logic exists (source_order.item_name_pattern), we might need an annotation or fallback.
-    # For speed, we will group by the string representation if possible, or fallback to python loop if logic is too complex for ORM.
-    # Given the previous code manually checked source_order, let's try to optimize:
-    
-    # Fetch all items with select_related to convert to python faster
-    invoice_items = InvoiceItem.objects.filter(
-        invoice__created_at__date__range=[start_date, end_date]
-    ).select_related('item', 'item__source_order').only(
-        'item__item_type', 'item__source_order__item_name_pattern', 
-        'subtotal', 'item__base_cost', 'item__extra_cost', 'item__weight'
-    )
-    
-    product_performance = {}
-    
-    # Improved Python Loop (still loops rows but avoids queries)
-    for inv_item in invoice_items:
-        # Resolve Name
-        item_name = "قطعة عامة"
-        if inv_item.item:
-            if inv_item.item.source_order and inv_item.item.source_order.item_name_pattern:
-                item_name = inv_item.item.source_order.item_name_pattern
-            elif inv_item.item.item_type:
-                 item_name = str(inv_item.item.item_type) # Assuming simple repr
-
-        # Calculate Profit (Replicating property logic to avoid DB hit if property does query)
-        # Property logic in model: self.subtotal - (self.item.base_cost + self.item.extra_cost)
-        cost = (inv_item.item.base_cost or 0) + (inv_item.item.extra_cost or 0)
-        profit = inv_item.subtotal - cost
+    efficiency_data = analytics.stage_efficiency(start_date, end_date)
         
-        if item_name not in product_performance:
-            product_performance[item_name] = {'count': 0, 'total_profit': Decimal('0'), 'total_revenue': Decimal('0'), 'total_weight': Decimal('0')}
-            
-        product_performance[item_name]['count'] += 1
-        product_performance[item_name]['total_profit'] += profit
-        product_performance[item_name]['total_revenue'] += inv_item.subtotal
-        product_performance[item_name]['total_weight'] += (inv_item.item.weight if inv_item.item else 0)
-
-    processed_products = []
-    for name, stats in product_performance.items():
-        count = stats['count']
-        if count > 0:
-            avg_profit = stats['total_profit'] / count
-            avg_weight = stats['total_weight'] / count
-            avg_revenue = stats['total_revenue'] / count
-            processed_products.append((name, {
-                'count': count,
-                'total_profit': stats['total_profit'],
-                'total_revenue': stats['total_revenue'],
-                'avg_profit': avg_profit,
-                'avg_weight': avg_weight,
-                'avg_revenue': avg_revenue
-            }))
+    # 4. Product Performance
+    processed_products = analytics.product_performance(start_date, end_date)
+    sorted_products = processed_products[:5]
 
-    sorted_products = sorted(processed_products, key=lambda x: x[1]['total_profit'], reverse=True)[:5]
-    
-    # 5.5 Fetch Accounts for Advanced Comparison
-    revenue_accounts = Account.objects.filter(account_type='revenue')
-    expense_accounts = Account.objects.filter(account_type='expense')
+    # 5. Stone Usage
+    stones = analytics.stone_usage(start_date, end_date)
+    stone_usage = stones['rows']
+    total_stones_weight = stones['total_weight']
+    total_tahyif_gold = stones['tahyif_gold']
     
     # --- Advanced AI Analytics Engine Integration ---
-    # Previous Period Calculation for Trends
+    # Previous Period for Trends (always closed, so served from cache)
     delta = (end_date - start_date) + datetime.timedelta(days=1)
-    prev_start = start_date - delta
-    prev_end = start_date - datetime.timedelta(days=1)
-    
-    # Bulk Aggregate Previous Period
-    prev_metrics = LedgerEntry.objects.filter(
-        journal_entry__date__range=[prev_start, prev_end]
-    ).aggregate(
-        rev_debit=Coalesce(Sum('debit', filter=Q(account__account_type='revenue')), Decimal('0')),
-        rev_credit=Coalesce(Sum('credit', filter=Q(account__account_type='revenue')), Decimal('0')),
-        exp_debit=Coalesce(Sum('debit', filter=Q(account__account_type='expense')), Decimal('0')),
-        exp_credit=Coalesce(Sum('credit', filter=Q(account__account_type='expense')), Decimal('0')),
-    )
-    prev_revenue = prev_metrics['rev_credit'] - prev_metrics['rev_debit']
-    prev_expenses = prev_metrics['exp_debit'] - prev_metrics['exp_credit']
-    prev_profit = prev_revenue - prev_expenses
+    prev_metrics = analytics.ledger_metrics(start_date - delta, start_date - datetime.timedelta(days=1))
     
     # Generate Advanced Insights
     ai_insights = generate_advanced_ai_insights(
-        current_data={'revenue': total_revenue, 'expenses': total_expenses, 'profit': net_profit},
-        previous_data={'revenue': prev_revenue, 'expenses': prev_expenses, 'profit': prev_profit},
+        current_data=metrics,
+        previous_data=prev_metrics,
         efficiency_data=efficiency_data,
         stone_usage=stone_usage,
         top_products=sorted_products,
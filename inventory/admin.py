@@ -1,8 +1,9 @@
 from django.contrib import admin
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
-from .models import Category, Item, RawMaterial, ItemTransfer, MaterialTransfer
+from .models import Category, InventorySnapshot, Item, ItemMovement, RawMaterial, ItemTransfer, MaterialTransfer, StockTake
 from core.admin_mixins import ExportImportMixin
+from .services import ItemMovementService
 
 @admin.register(Category)
 class CategoryAdmin(ExportImportMixin, admin.ModelAdmin):
@@ -71,15 +72,47 @@ class ItemAdmin(ExportImportMixin, admin.ModelAdmin):
     class Media:
         js = ('admin/js/auto_barcode.js',)
 
+    def movement_history_html(self, obj):
+        """سجل حركة القطعة من ItemMovement (استعلام واحد على فهرس القطعة/التوقيت)"""
+        if not obj or not obj.pk:
+            return ""
+        rows = format_html_join('', """
+                <tr>
+                    <td>{}</td>
+                    <td>{}</td>
+                    <td>{}</td>
+                    <td>{}</td>
+                    <td>{}</td>
+                    <td>{} g</td>
+                </tr>""", (
+            (m.timestamp.strftime('%Y-%m-%d %I:%M %p'), m.get_movement_type_display(), m.from_branch or '-',
+             m.to_branch or '-', m.reference or '-', f"{m.weight:,.3f}")
+            for m in ItemMovementService.history(obj)
+        ))
+        if not rows:
+            return ""
+        return format_html("""
+        <div style="margin-bottom: 15px; background: rgba(0,0,0,0.2); padding: 15px; border-radius: 8px; border: 1px solid rgba(255,255,255,0.1);">
+            <table class="lifecycle-table" style="width: 100%; border-collapse: collapse; font-size: 11px;">
+                <thead>
+                    <tr><th>التاريخ</th><th>الحركة</th><th>من</th><th>إلى</th><th>المستند</th><th>الوزن</th></tr>
+                </thead>
+                <tbody>{}</tbody>
+            </table>
+        </div>
+        """, rows)
+
     def production_lifecycle_report(self, obj):
-        if not obj or not obj.source_order:
-            return "هذه القطعة غير مرتبطة بأمر تصنيع مباشر، أو تم إدخالها كمخزون افتتاحي."
+        history = self.movement_history_html(obj)
+        # Reverse one-to-one: raises when the piece has no order
+        if not obj or not getattr(obj, 'source_order', None):
+            return format_html("{}{}", history, "هذه القطعة غير مرتبطة بأمر تصنيع مباشر، أو تم إدخالها كمخزون افتتاحي.")
             
         order = obj.source_order
         stages = order.stages.all().order_by('timestamp')
         
         if not stages.exists():
-            return "مربوطة بأمر تصنيع ولكن لا توجد مراحل مسجلة."
+            return format_html("{}{}", history, "مربوطة بأمر تصنيع ولكن لا توجد مراحل مسجلة.")
             
         html = """
         <style>
@@ -149,7 +182,7 @@ class ItemAdmin(ExportImportMixin, admin.ModelAdmin):
             </table>
         </div>
         """
-        return mark_safe(html)
+        return mark_safe(history + html)
     
     production_lifecycle_report.short_description = "تقرير التصنيع التفصيلي"
 
@@ -265,3 +298,46 @@ class MaterialTransferAdmin(ExportImportMixin, admin.ModelAdmin):
             color, obj.get_status_display()
         )
     status_badge.short_description = 'الحالة'
+
+@admin.register(StockTake)
+class StockTakeAdmin(admin.ModelAdmin):
+    list_display = ('number', 'branch', 'status', 'started_at', 'expected_count', 'matched_count', 'missing_count', 'wrong_branch_count', 'unexpected_count', 'unknown_count', 'started_by')
+    list_filter = ('status', 'branch')
+    search_fields = ('number', 'notes')
+    readonly_fields = ('number', 'started_by', 'closed_by', 'closed_at', 'expected_count', 'matched_count', 'missing_count', 'wrong_branch_count', 'unexpected_count', 'unknown_count')
+
+    def save_model(self, request, obj, form, change):
+        if not obj.pk:
+            obj.started_by = request.user
+        super().save_model(request, obj, form, change)
+
+@admin.register(ItemMovement)
+class ItemMovementAdmin(admin.ModelAdmin):
+    list_display = ('timestamp', 'item', 'movement_type', 'from_branch', 'to_branch', 'weight', 'reference', 'created_by')
+    list_filter = ('movement_type', 'to_branch')
+    search_fields = ('item__barcode', 'reference')
+    list_select_related = ('item', 'from_branch', 'to_branch', 'created_by')
+    date_hierarchy = 'timestamp'
+
+    # Append-only log
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(InventorySnapshot)
+class InventorySnapshotAdmin(admin.ModelAdmin):
+    list_display = ('date', 'kind', 'branch', 'carat', 'category', 'count', 'weight')
+    list_filter = ('kind', 'branch', 'carat')
+    list_select_related = ('branch', 'carat', 'category')
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
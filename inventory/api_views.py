@@ -1,6 +1,13 @@
+import datetime
+import json
+from decimal import Decimal
+from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
-from django.views.decorators.http import require_GET
-from .models import Category
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET, require_POST
+from core.models import Branch, Carat
+from .models import Category, StockTake
+from .services import InventorySnapshotService, StockTakeService
 
 @require_GET
 def get_next_barcode(request):
@@ -20,3 +27,97 @@ def get_next_barcode(request):
             return JsonResponse({'error': 'Category has no barcode prefix'}, status=400)
     except Category.DoesNotExist:
         return JsonResponse({'error': 'Category not found'}, status=404)
+
+
+def _stock_take_summary(stock_take):
+    return {
+        'id': stock_take.id,
+        'number': stock_take.number,
+        'branch': stock_take.branch.name,
+        'status': stock_take.status,
+        'scanned': stock_take.scans.count(),
+    }
+
+
+@login_required
+@require_POST
+def stock_take_start(request):
+    """Open (or resume) the stock-take session of a branch"""
+    try:
+        branch = Branch.objects.get(id=request.POST.get('branch_id'))
+    except (Branch.DoesNotExist, ValueError):
+        return JsonResponse({'error': 'Branch not found'}, status=404)
+    return JsonResponse(_stock_take_summary(StockTakeService.start(branch, request.user)))
+
+
+@login_required
+@require_POST
+def stock_take_scan(request, pk):
+    """Add a batch of scanned codes: body {"codes": ["VT001", "E200..."]}"""
+    stock_take = get_object_or_404(StockTake, pk=pk)
+    try:
+        codes = json.loads(request.body or b'{}').get('codes')
+    except (ValueError, AttributeError):
+        codes = None
+    if not isinstance(codes, list):
+        return JsonResponse({'error': 'codes must be a list'}, status=400)
+    try:
+        result = StockTakeService.add_scans(stock_take, [str(code) for code in codes])
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(result)
+
+
+@login_required
+@require_GET
+def stock_take_report(request, pk):
+    stock_take = get_object_or_404(StockTake.objects.select_related('branch'), pk=pk)
+    return JsonResponse({**_stock_take_summary(stock_take), **StockTakeService.report(stock_take)})
+
+
+@login_required
+@require_POST
+def stock_take_close(request, pk):
+    stock_take = get_object_or_404(StockTake.objects.select_related('branch'), pk=pk, status='open')
+    report = StockTakeService.close(stock_take, request.user)
+    return JsonResponse({**_stock_take_summary(stock_take), **report})
+
+
+@login_required
+@require_GET
+def stock_as_of(request):
+    """Stock per branch / carat / category at the end of ?date=YYYY-MM-DD (optional ?branch_id=)"""
+    try:
+        as_of = datetime.date.fromisoformat(request.GET.get('date', ''))
+    except ValueError:
+        return JsonResponse({'error': 'date must be YYYY-MM-DD'}, status=400)
+    branch_id = request.GET.get('branch_id') or None
+    if branch_id is not None and not Branch.objects.filter(pk=branch_id).exists():
+        return JsonResponse({'error': 'Branch not found'}, status=404)
+
+    stock = InventorySnapshotService.stock_as_of(as_of, branch=branch_id)
+    rows = stock['items'] + stock['raw_materials']
+    branches = Branch.objects.in_bulk({r['branch_id'] for r in rows} - {None})
+    carats = Carat.objects.in_bulk({r['carat_id'] for r in rows} - {None})
+    categories = Category.objects.in_bulk({r['category_id'] for r in stock['items']} - {None})
+
+    def named(row):
+        branch, carat = branches.get(row['branch_id']), carats.get(row['carat_id'])
+        category = categories.get(row.get('category_id'))
+        return {
+            **row,
+            'branch': branch.name if branch else None,
+            'carat': carat.name if carat else None,
+            'category': category.name if category else None,
+            'weight': float(row['weight']),
+            'gold_value': float(row['gold_value']) if row.get('gold_value') is not None else None,
+        }
+
+    return JsonResponse({
+        'as_of': as_of.isoformat(),
+        'snapshot_date': stock['snapshot_date'].isoformat() if stock['snapshot_date'] else None,
+        'items': [named(r) for r in stock['items']],
+        'raw_materials': [named(r) for r in stock['raw_materials']],
+        'total_count': sum(r['count'] for r in stock['items']),
+        'total_weight': float(sum((r['weight'] for r in stock['items']), Decimal('0'))),
+    })
@@ -0,0 +1,20 @@
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from inventory.services import InventorySnapshotService
+
+class Command(BaseCommand):
+    help = 'Write the end-of-day inventory snapshot (run nightly, e.g. from cron / Task Scheduler)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Snapshot date YYYY-MM-DD (default: today)')
+
+    def handle(self, *args, **options):
+        day = None
+        if options['date']:
+            try:
+                day = datetime.date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError("Invalid --date, expected YYYY-MM-DD")
+
+        count = InventorySnapshotService.take(day)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} snapshot rows."))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:54
+
+from django.db import migrations, models
+from django.db.models.functions import Trim, Upper
+
+
+def backfill_barcode_normalized(apps, schema_editor):
+    Item = apps.get_model('inventory', 'Item')
+    Item.objects.update(barcode_normalized=Upper(Trim('barcode')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_documentsequence'),
+        ('inventory', '0011_alter_item_barcode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='barcode_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='الباركود (موحد)'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['barcode_normalized', 'updated_at'], name='inv_item_barcode_norm_idx'),
+        ),
+        migrations.RunPython(backfill_barcode_normalized, migrations.RunPython.noop),
+    ]
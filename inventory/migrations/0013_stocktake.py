@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_documentsequence'),
+        ('inventory', '0012_item_barcode_normalized'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockTake',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.CharField(blank=True, max_length=50, unique=True, verbose_name='رقم الجرد')),
+                ('status', models.CharField(choices=[('open', 'جاري الجرد'), ('closed', 'مغلق')], db_index=True, default='open', max_length=20, verbose_name='الحالة')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='بداية الجرد')),
+                ('closed_at', models.DateTimeField(blank=True, null=True, verbose_name='نهاية الجرد')),
+                ('expected_count', models.PositiveIntegerField(default=0, verbose_name='العدد الدفتري')),
+                ('matched_count', models.PositiveIntegerField(default=0, verbose_name='مطابق')),
+                ('missing_count', models.PositiveIntegerField(default=0, verbose_name='مفقود')),
+                ('wrong_branch_count', models.PositiveIntegerField(default=0, verbose_name='مسجل بفرع آخر')),
+                ('unexpected_count', models.PositiveIntegerField(default=0, verbose_name='غير متوقع')),
+                ('unknown_count', models.PositiveIntegerField(default=0, verbose_name='أكواد غير معروفة')),
+                ('notes', models.TextField(blank=True, verbose_name='ملاحظات')),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_takes', to='core.branch', verbose_name='الفرع')),
+                ('closed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='closed_stock_takes', to=settings.AUTH_USER_MODEL, verbose_name='أغلق الجرد')),
+                ('started_by', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='started_stock_takes', to=settings.AUTH_USER_MODEL, verbose_name='بدأ الجرد')),
+            ],
+            options={
+                'verbose_name': 'جرد قطع',
+                'verbose_name_plural': 'المخزون - جرد القطع',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockTakeScan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=255, verbose_name='الكود')),
+                ('scanned_at', models.DateTimeField(auto_now_add=True, verbose_name='وقت المسح')),
+                ('item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_take_scans', to='inventory.item', verbose_name='القطعة')),
+                ('stock_take', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='scans', to='inventory.stocktake', verbose_name='الجرد')),
+            ],
+            options={
+                'verbose_name': 'مسح جرد',
+                'verbose_name_plural': 'المخزون - مسح الجرد',
+                'constraints': [models.UniqueConstraint(fields=('stock_take', 'code'), name='inv_stocktake_scan_unique')],
+            },
+        ),
+    ]
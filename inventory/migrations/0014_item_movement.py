@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_completed_transfers_applied(apps, schema_editor):
+    # Pieces of transfers completed before this flag existed were already moved
+    ItemTransfer = apps.get_model('inventory', 'ItemTransfer')
+    ItemTransfer.objects.filter(status='completed').update(applied_at=django.utils.timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_documentsequence'),
+        ('inventory', '0013_stocktake'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='itemtransfer',
+            name='applied_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='تاريخ نقل القطع'),
+        ),
+        migrations.CreateModel(
+            name='ItemMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movement_type', models.CharField(choices=[('transfer', 'تحويل بين الفروع')], max_length=20, verbose_name='نوع الحركة')),
+                ('weight', models.DecimalField(decimal_places=3, default=0, max_digits=10, verbose_name='الوزن')),
+                ('reference', models.CharField(blank=True, max_length=100, verbose_name='المستند')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now, verbose_name='التوقيت')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='بواسطة')),
+                ('from_branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='item_movements_out', to='core.branch', verbose_name='من فرع')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='inventory.item', verbose_name='القطعة')),
+                ('to_branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='item_movements_in', to='core.branch', verbose_name='إلى فرع')),
+            ],
+            options={
+                'verbose_name': 'حركة قطعة',
+                'verbose_name_plural': 'المخزون - حركة القطع',
+                'ordering': ['-timestamp', '-id'],
+            },
+        ),
+        migrations.RunPython(mark_completed_transfers_applied, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_movements(apps, schema_editor):
+    # Pieces that existed before the log: an opening entry, plus the sale for sold pieces
+    Item = apps.get_model('inventory', 'Item')
+    ItemMovement = apps.get_model('inventory', 'ItemMovement')
+    InvoiceItem = apps.get_model('sales', 'InvoiceItem')
+    sold_at = InvoiceItem.objects.filter(item=OuterRef('pk')).order_by('-invoice__created_at')
+    items = Item.objects.filter(movements__isnull=True).annotate(
+        invoice_number=Subquery(sold_at.values('invoice__invoice_number')[:1]),
+        sold_at=Subquery(sold_at.values('invoice__created_at')[:1]),
+    )
+    rows = []
+    for item in items.iterator():
+        rows.append(ItemMovement(
+            item_id=item.pk, movement_type='received', to_branch_id=item.current_branch_id,
+            weight=item.net_gold_weight, reference='OPENING', timestamp=item.created_at,
+        ))
+        if item.status == 'sold':
+            rows.append(ItemMovement(
+                item_id=item.pk, movement_type='sale', from_branch_id=item.current_branch_id,
+                weight=item.net_gold_weight, reference=item.invoice_number or '',
+                timestamp=item.sold_at or item.updated_at,
+            ))
+    ItemMovement.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_documentsequence'),
+        ('inventory', '0014_item_movement'),
+        ('sales', '0013_invoice_cost_profit'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='itemmovement',
+            name='movement_type',
+            field=models.CharField(choices=[('received', 'إدخال للمخزون'), ('manufactured', 'استلام من التصنيع'), ('transfer', 'تحويل بين الفروع'), ('reserved', 'حجز'), ('sale', 'بيع'), ('return', 'مرتجع للمخزون')], max_length=20, verbose_name='نوع الحركة'),
+        ),
+        migrations.AddIndex(
+            model_name='itemmovement',
+            index=models.Index(fields=['item', 'timestamp'], name='inv_movement_item_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemmovement',
+            index=models.Index(fields=['to_branch', 'timestamp'], name='inv_movement_branch_ts_idx'),
+        ),
+        migrations.RunPython(backfill_movements, migrations.RunPython.noop),
+    ]
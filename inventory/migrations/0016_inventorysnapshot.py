@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_documentsequence'),
+        ('inventory', '0015_item_movement_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='تاريخ اللقطة')),
+                ('kind', models.CharField(choices=[('item', 'قطع جاهزة'), ('raw_material', 'مواد خام')], default='item', max_length=20, verbose_name='النوع')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='العدد')),
+                ('weight', models.DecimalField(decimal_places=3, default=0, max_digits=15, verbose_name='الوزن')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('branch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inventory_snapshots', to='core.branch', verbose_name='الفرع')),
+                ('carat', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inventory_snapshots', to='core.carat', verbose_name='العيار')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inventory_snapshots', to='inventory.category', verbose_name='التصنيف')),
+            ],
+            options={
+                'verbose_name': 'لقطة مخزون',
+                'verbose_name_plural': 'المخزون - لقطات المخزون اليومية',
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['date', 'branch'], name='inv_snapshot_date_branch_idx')],
+            },
+        ),
+    ]
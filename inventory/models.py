@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from core.models import Carat, Branch
 
@@ -15,25 +16,38 @@ class Category(models.Model):
         return self.name
     
     def get_next_barcode(self):
-        """توليد الباركود التالي لهذا التصنيف"""
+        """توليد الباركود التالي لهذا التصنيف (من عداد التسلسل - بدون فحص جدول الأصناف)"""
         if not self.barcode_prefix:
             return None
-        # Find the last item with this prefix
+        barcode = self.reserve_barcodes(1)[0]
+        # Skip numbers already typed in by hand (exact lookup on the unique index)
+        while Item.objects.filter(barcode=barcode).exists():
+            barcode = self.reserve_barcodes(1)[0]
+        return barcode
+
+    def reserve_barcodes(self, count):
+        """حجز مجموعة باركودات متتالية للإنشاء بالجملة"""
+        from core.services import SequenceService
         prefix = self.barcode_prefix.upper()
-        last_item = Item.objects.filter(barcode__istartswith=prefix).order_by('-barcode').first()
-        if last_item:
-            # Extract the number part
-            try:
-                num_part = last_item.barcode[len(prefix):]
-                next_num = int(num_part) + 1
-            except (ValueError, IndexError):
-                next_num = 1
-        else:
-            next_num = 1
-        return f"{prefix}{next_num:03d}"
+        numbers = SequenceService.reserve(f"barcode:{prefix}", count, seed=lambda: self._last_barcode_number(prefix))
+        return [f"{prefix}{n:03d}" for n in numbers]
+
+    @staticmethod
+    def _last_barcode_number(prefix):
+        """أعلى رقم مستخدم بهذه البادئة - يُستدعى مرة واحدة فقط عند إنشاء عداد البادئة"""
+        last = 0
+        for barcode in Item.objects.filter(barcode_normalized__startswith=prefix).values_list(
+            'barcode_normalized', flat=True
+        ).iterator():
+            num_part = barcode[len(prefix):]
+            if num_part.isdigit():
+                last = max(last, int(num_part))
+        return last
 
 class Item(models.Model):
     barcode = models.CharField("الباركود", max_length=100, unique=True, db_index=True, blank=True)
+    # Upper-case/trimmed copy of the barcode for case-insensitive scans and prefix lookups on an index
+    barcode_normalized = models.CharField("الباركود (موحد)", max_length=100, blank=True, editable=False)
     name = models.CharField("اسم الصنف", max_length=255)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='items', verbose_name="التصنيف")
     carat = models.ForeignKey(Carat, on_delete=models.PROTECT, related_name='items', verbose_name="العيار")
@@ -104,6 +118,7 @@ class Item(models.Model):
         # Auto-generate barcode if not provided and category has prefix
         if not self.barcode and self.category and self.category.barcode_prefix:
             self.barcode = self.category.get_next_barcode()
+        self.barcode_normalized = Item.normalize_barcode(self.barcode)
         
         if self.gross_weight is not None:
              # Ensure we subtract decimal from decimal
@@ -111,6 +126,10 @@ class Item(models.Model):
              self.net_gold_weight = gross - self.stone_weight_in_gold
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def normalize_barcode(code):
+        return (code or '').strip().upper()
+
     def calculate_total_cost(self, gold_price_per_gram):
         """حساب التكلفة الكلية تشمل مصاريف تشغيل المصنع الموزعة"""
         return (self.net_gold_weight * gold_price_per_gram) + (self.gross_weight * self.labor_fee_per_gram) + self.fixed_labor_fee + self.total_overhead
@@ -119,6 +138,10 @@ class Item(models.Model):
     class Meta:
         verbose_name = "قطعة ذهب"
         verbose_name_plural = "المخزون - القطع"
+        indexes = [
+            # Scanner lookups by normalized barcode (leading column)
+            models.Index(fields=['barcode_normalized', 'updated_at'], name='inv_item_barcode_norm_idx'),
+        ]
 
 class RawMaterial(models.Model):
     name = models.CharField("اسم المادة", max_length=100)
@@ -159,6 +182,8 @@ class ItemTransfer(models.Model):
     
     date = models.DateField("التاريخ", auto_now_add=True)
     notes = models.TextField("ملاحظات", blank=True)
+    # Set once when the pieces are moved, so later saves of a completed transfer do nothing
+    applied_at = models.DateTimeField("تاريخ نقل القطع", null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = "تحويل قطع"
@@ -175,6 +200,39 @@ class ItemTransfer(models.Model):
             self.transfer_number = f"ITRF-{datetime.datetime.now().year}-{num:04d}"
         super().save(*args, **kwargs)
 
+class ItemMovement(models.Model):
+    """سجل حركة القطعة (إضافة فقط) - الفرع بعد الحركة في to_branch"""
+    MOVEMENT_TYPES = [
+        ('received', 'إدخال للمخزون'),
+        ('manufactured', 'استلام من التصنيع'),
+        ('transfer', 'تحويل بين الفروع'),
+        ('reserved', 'حجز'),
+        ('sale', 'بيع'),
+        ('return', 'مرتجع للمخزون'),
+    ]
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='movements', verbose_name="القطعة")
+    movement_type = models.CharField("نوع الحركة", max_length=20, choices=MOVEMENT_TYPES)
+    from_branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True, related_name='item_movements_out', verbose_name="من فرع")
+    to_branch = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True, related_name='item_movements_in', verbose_name="إلى فرع")
+    weight = models.DecimalField("الوزن", max_digits=10, decimal_places=3, default=0)
+    reference = models.CharField("المستند", max_length=100, blank=True)
+    created_by = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True, verbose_name="بواسطة")
+    timestamp = models.DateTimeField("التوقيت", default=timezone.now)
+
+    class Meta:
+        verbose_name = "حركة قطعة"
+        verbose_name_plural = "المخزون - حركة القطع"
+        ordering = ['-timestamp', '-id']
+        indexes = [
+            models.Index(fields=['item', 'timestamp'], name='inv_movement_item_ts_idx'),
+            # to_branch is where the piece is after the movement (null once sold)
+            models.Index(fields=['to_branch', 'timestamp'], name='inv_movement_branch_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_id} - {self.get_movement_type_display()} ({self.reference})"
+
+
 class MaterialTransfer(models.Model):
     """تحويل المواد الخام بين الفروع"""
     transfer_number = models.CharField("رقم التحويل", max_length=50, unique=True)
@@ -210,3 +268,89 @@ class MaterialTransfer(models.Model):
             num = (last.id + 1) if last else 1
             self.transfer_number = f"MTRF-{datetime.datetime.now().year}-{num:04d}"
         super().save(*args, **kwargs)
+
+
+class StockTake(models.Model):
+    """جرد القطع الجاهزة لفرع (باركود / RFID) - جلسة يمكن استكمالها على دفعات"""
+    number = models.CharField("رقم الجرد", max_length=50, unique=True, blank=True)
+    branch = models.ForeignKey(Branch, on_delete=models.PROTECT, related_name='stock_takes', verbose_name="الفرع")
+
+    STATUS_CHOICES = [
+        ('open', 'جاري الجرد'),
+        ('closed', 'مغلق'),
+    ]
+    status = models.CharField("الحالة", max_length=20, choices=STATUS_CHOICES, default='open', db_index=True)
+
+    started_by = models.ForeignKey('auth.User', on_delete=models.PROTECT, related_name='started_stock_takes', verbose_name="بدأ الجرد")
+    closed_by = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='closed_stock_takes', verbose_name="أغلق الجرد")
+    started_at = models.DateTimeField("بداية الجرد", auto_now_add=True)
+    closed_at = models.DateTimeField("نهاية الجرد", null=True, blank=True)
+
+    # Filled when the session is closed
+    expected_count = models.PositiveIntegerField("العدد الدفتري", default=0)
+    matched_count = models.PositiveIntegerField("مطابق", default=0)
+    missing_count = models.PositiveIntegerField("مفقود", default=0)
+    wrong_branch_count = models.PositiveIntegerField("مسجل بفرع آخر", default=0)
+    unexpected_count = models.PositiveIntegerField("غير متوقع", default=0)
+    unknown_count = models.PositiveIntegerField("أكواد غير معروفة", default=0)
+    notes = models.TextField("ملاحظات", blank=True)
+
+    class Meta:
+        verbose_name = "جرد قطع"
+        verbose_name_plural = "المخزون - جرد القطع"
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{self.number} - {self.branch}"
+
+    def save(self, *args, **kwargs):
+        if not self.number:
+            import datetime
+            from core.services import SequenceService
+            self.number = SequenceService.next_code(f"STK-{datetime.datetime.now().year}", width=4)
+        super().save(*args, **kwargs)
+
+
+class StockTakeScan(models.Model):
+    """كود ممسوح داخل جلسة جرد (كل كود يسجل مرة واحدة)"""
+    stock_take = models.ForeignKey(StockTake, on_delete=models.CASCADE, related_name='scans', verbose_name="الجرد")
+    code = models.CharField("الكود", max_length=255)
+    item = models.ForeignKey(Item, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_take_scans', verbose_name="القطعة")
+    scanned_at = models.DateTimeField("وقت المسح", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "مسح جرد"
+        verbose_name_plural = "المخزون - مسح الجرد"
+        constraints = [
+            models.UniqueConstraint(fields=['stock_take', 'code'], name='inv_stocktake_scan_unique'),
+        ]
+
+    def __str__(self):
+        return self.code
+
+
+class InventorySnapshot(models.Model):
+    """لقطة مخزون نهاية اليوم: عدد ووزن مجمع لكل فرع / عيار / تصنيف"""
+    KIND_CHOICES = [
+        ('item', 'قطع جاهزة'),
+        ('raw_material', 'مواد خام'),
+    ]
+    date = models.DateField("تاريخ اللقطة")
+    kind = models.CharField("النوع", max_length=20, choices=KIND_CHOICES, default='item')
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, null=True, blank=True, related_name='inventory_snapshots', verbose_name="الفرع")
+    carat = models.ForeignKey(Carat, on_delete=models.CASCADE, null=True, blank=True, related_name='inventory_snapshots', verbose_name="العيار")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='inventory_snapshots', verbose_name="التصنيف")
+    count = models.PositiveIntegerField("العدد", default=0)
+    weight = models.DecimalField("الوزن", max_digits=15, decimal_places=3, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "لقطة مخزون"
+        verbose_name_plural = "المخزون - لقطات المخزون اليومية"
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date', 'branch'], name='inv_snapshot_date_branch_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.branch or '-'} - {self.carat or '-'}"
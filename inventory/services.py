@@ -0,0 +1,442 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Sum, Count, Exists, Max, Q, F, OuterRef, Subquery, Value, DecimalField
+from django.db.models.functions import Coalesce
+from core.services import GoldPriceService
+from django.utils import timezone
+from .models import (
+    InventorySnapshot, Item, ItemMovement, ItemTransfer, RawMaterial, StockTake, StockTakeScan,
+)
+
+def end_of_day(day):
+    """Aware datetime of the midnight that ends `day`"""
+    return timezone.make_aware(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min))
+
+
+OVERHEAD_FIELDS = (
+    'overhead_electricity', 'overhead_water', 'overhead_gas',
+    'overhead_rent', 'overhead_salaries', 'overhead_other',
+)
+
+
+def inventory_valuation(as_of=None, branch=None, request=None):
+    """
+    تقييم المخزون (القطع الجاهزة) داخل قاعدة البيانات.
+
+    Net gold weight, labor and overhead are summed per carat in one GROUP BY
+    query, then the gold weight is priced with the latest price per carat.
+
+    as_of: value the stock held at the end of that date - pieces created on or
+    before it that are still available or were sold by an invoice after it,
+    priced with the last gold price recorded on or before it. Transfers and
+    manufacturing returns are not replayed.
+    branch: Branch instance or id (current branch of the piece).
+    """
+    items = Item.objects.all()
+    if as_of is None:
+        items = items.filter(status='available')
+        prices = GoldPriceService.price_map(request)
+    else:
+        from sales.models import InvoiceItem
+        # Exists, not a join: a piece on several invoice lines must still be counted once
+        sold_after = InvoiceItem.objects.filter(
+            item=OuterRef('pk'), invoice__status='confirmed', invoice__created_at__date__gt=as_of
+        )
+        items = items.filter(created_at__date__lte=as_of).filter(Q(status='available') | Exists(sold_after))
+        prices = GoldPriceService.price_map_as_of(as_of)
+    if branch is not None:
+        items = items.filter(current_branch=branch)
+
+    zero = Value(Decimal('0'), output_field=DecimalField(max_digits=15, decimal_places=3))
+    overhead = sum((F(f) for f in OVERHEAD_FIELDS[1:]), F(OVERHEAD_FIELDS[0]))
+    rows = items.values('carat_id', 'carat__name', 'carat__purity').annotate(
+        count=Count('id'),
+        weight=Coalesce(Sum('net_gold_weight'), zero),
+        labor=Coalesce(Sum('fixed_labor_fee'), zero),
+        overhead=Coalesce(Sum(overhead, output_field=DecimalField(max_digits=15, decimal_places=2)), zero),
+    ).order_by('carat__name')
+
+    result = {
+        'by_carat': [],
+        'count': 0,
+        'gold_weight': Decimal('0'),
+        'pure_weight': Decimal('0'),
+        'gold_value': Decimal('0'),
+        'labor_value': Decimal('0'),
+        'overhead_value': Decimal('0'),
+    }
+    for row in rows:
+        price = prices.get(row['carat_id'])
+        gold_value = row['weight'] * price if price is not None else Decimal('0')
+        result['by_carat'].append({
+            'carat_id': row['carat_id'],
+            'carat_name': row['carat__name'],
+            'count': row['count'],
+            'weight': row['weight'],
+            'price': price,
+            'gold_value': gold_value,
+            'labor_value': row['labor'],
+            'overhead_value': row['overhead'],
+        })
+        result['count'] += row['count']
+        result['gold_weight'] += row['weight']
+        result['pure_weight'] += row['weight'] * (row['carat__purity'] or 0)
+        result['gold_value'] += gold_value
+        result['labor_value'] += row['labor']
+        result['overhead_value'] += row['overhead']
+
+    result['total_value'] = result['gold_value'] + result['labor_value'] + result['overhead_value']
+    return result
+
+
+class ItemLookup:
+    """
+    تحديد القطع من الباركود أو RFID (شاشات البيع والماسح).
+
+    Scanned codes are normalized (trimmed, upper-case) and matched against the
+    indexed Item.barcode_normalized or the unique rfid_tag, one query per batch.
+    """
+
+    @staticmethod
+    def normalize(code):
+        return Item.normalize_barcode(str(code) if code is not None else '')
+
+    @staticmethod
+    def _matches(item, code):
+        return item.barcode_normalized == code or ItemLookup.normalize(item.rfid_tag) == code
+
+    @staticmethod
+    def resolve_many(codes, queryset=None):
+        """{code: Item or None} for every scanned code, in one query"""
+        queryset = queryset if queryset is not None else Item.objects.select_related('carat')
+        normalized = {code: ItemLookup.normalize(code) for code in codes}
+        wanted = {n for n in normalized.values() if n}
+
+        found = {}
+        if wanted:
+            # rfid_tag is stored as read by the device: match the scanned, upper and lower case forms
+            tags = wanted | {n.lower() for n in wanted} | {str(code).strip() for code in codes if normalized[code]}
+            for item in queryset.filter(Q(barcode_normalized__in=wanted) | Q(rfid_tag__in=tags)):
+                for n in wanted:
+                    if ItemLookup._matches(item, n):
+                        found[n] = item
+
+        return {code: found.get(n) for code, n in normalized.items()}
+
+    @staticmethod
+    def resolve(code, queryset=None):
+        return ItemLookup.resolve_many([code], queryset).get(code)
+
+
+class StockTakeService:
+    """
+    جرد القطع الجاهزة لفرع بالباركود / RFID.
+
+    Scans arrive in batches and are stored once per code (StockTakeScan), so a
+    session can be resumed from any device until it is closed. The report
+    compares id sets: pieces expected in the branch (available, current_branch)
+    against the pieces scanned, giving matched, missing, wrong-branch and
+    unexpected pieces plus codes that match no piece.
+    """
+    CHUNK_SIZE = 500
+
+    @staticmethod
+    def start(branch, user):
+        """Open a session for the branch, or return the one already open"""
+        with transaction.atomic():
+            session = StockTake.objects.select_for_update().filter(branch=branch, status='open').first()
+            return session or StockTake.objects.create(branch=branch, started_by=user)
+
+    @staticmethod
+    def _chunks(values):
+        values = list(values)
+        for i in range(0, len(values), StockTakeService.CHUNK_SIZE):
+            yield values[i:i + StockTakeService.CHUNK_SIZE]
+
+    @staticmethod
+    def resolve_ids(codes):
+        """{normalized code: item id} for codes matching a barcode or RFID tag"""
+        ids = {}
+        for chunk in StockTakeService._chunks(codes):
+            chunk = set(chunk)
+            rows = Item.objects.filter(
+                Q(barcode_normalized__in=chunk) | Q(rfid_tag__in=chunk | {c.lower() for c in chunk})
+            ).values_list('id', 'barcode_normalized', 'rfid_tag')
+            for pk, barcode, rfid in rows:
+                for code in (barcode, ItemLookup.normalize(rfid)):
+                    if code in chunk:
+                        ids[code] = pk
+        return ids
+
+    @staticmethod
+    def add_scans(stock_take, codes):
+        """Record a batch of scanned codes; codes already scanned in the session are ignored"""
+        if stock_take.status != 'open':
+            raise ValueError("جلسة الجرد مغلقة")
+        normalized = {ItemLookup.normalize(code) for code in codes} - {''}
+        ids = StockTakeService.resolve_ids(normalized)
+
+        scans = StockTakeScan.objects.filter(stock_take=stock_take)
+        before = scans.count()
+        StockTakeScan.objects.bulk_create(
+            [StockTakeScan(stock_take=stock_take, code=code, item_id=ids.get(code)) for code in normalized],
+            batch_size=StockTakeService.CHUNK_SIZE, ignore_conflicts=True,
+        )
+        total = scans.count()
+        return {
+            'received': len(codes),
+            'new': total - before,
+            'total': total,
+            'unknown': sorted(normalized - set(ids)),
+        }
+
+    @staticmethod
+    def report(stock_take):
+        """Diff of the scanned pieces against the branch stock, as barcode lists"""
+        expected = dict(Item.objects.filter(
+            status='available', current_branch=stock_take.branch_id
+        ).values_list('id', 'barcode'))
+        scans = StockTakeScan.objects.filter(stock_take=stock_take)
+        scanned = set(scans.filter(item__isnull=False).values_list('item_id', flat=True))
+        unknown = sorted(scans.filter(item__isnull=True).values_list('code', flat=True))
+
+        expected_ids = set(expected)
+        extra = scanned - expected_ids
+        wrong_branch, unexpected = [], []
+        for chunk in StockTakeService._chunks(extra):
+            for barcode, branch_id, status in Item.objects.filter(id__in=chunk).values_list(
+                'barcode', 'current_branch_id', 'status'
+            ):
+                if status == 'available' and branch_id != stock_take.branch_id:
+                    wrong_branch.append(barcode)
+                else:
+                    unexpected.append(barcode)
+
+        missing = sorted(expected[pk] for pk in expected_ids - scanned)
+        return {
+            'expected_count': len(expected_ids),
+            'matched_count': len(expected_ids & scanned),
+            'missing': missing,
+            'wrong_branch': sorted(wrong_branch),
+            'unexpected': sorted(unexpected),
+            'unknown': unknown,
+        }
+
+    @staticmethod
+    def close(stock_take, user=None):
+        """Freeze the report counts on the session and close it"""
+        report = StockTakeService.report(stock_take)
+        stock_take.expected_count = report['expected_count']
+        stock_take.matched_count = report['matched_count']
+        stock_take.missing_count = len(report['missing'])
+        stock_take.wrong_branch_count = len(report['wrong_branch'])
+        stock_take.unexpected_count = len(report['unexpected'])
+        stock_take.unknown_count = len(report['unknown'])
+        stock_take.status = 'closed'
+        stock_take.closed_at = timezone.now()
+        stock_take.closed_by = user
+        stock_take.save()
+        return report
+
+
+class ItemTransferService:
+    """
+    نقل قطع تحويل مكتمل إلى الفرع المستلم.
+    The pieces move with one UPDATE and one movement row per piece is bulk inserted;
+    ItemTransfer.applied_at is claimed with a conditional UPDATE so a transfer is applied once.
+    """
+
+    @staticmethod
+    def apply(transfer, item_ids=None, user=None):
+        """
+        Move the pieces of a completed transfer. `item_ids` moves only pieces added to an
+        already applied transfer. Returns the number of pieces moved.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            if item_ids is None:
+                claimed = ItemTransfer.objects.filter(
+                    pk=transfer.pk, status='completed', applied_at__isnull=True
+                ).update(applied_at=now)
+                if not claimed:
+                    return 0
+                transfer.applied_at = now
+                items = Item.objects.filter(transfers=transfer)
+            else:
+                items = Item.objects.filter(id__in=item_ids)
+
+            rows = list(items.exclude(current_branch=transfer.to_branch_id).values_list(
+                'id', 'current_branch_id', 'net_gold_weight'
+            ))
+            if not rows:
+                return 0
+            Item.objects.filter(id__in=[pk for pk, _, _ in rows]).update(
+                current_branch=transfer.to_branch_id, updated_at=now
+            )
+            ItemMovement.objects.bulk_create([
+                ItemMovement(
+                    item_id=pk, movement_type='transfer', from_branch_id=branch_id or transfer.from_branch_id,
+                    to_branch_id=transfer.to_branch_id, weight=weight, reference=transfer.transfer_number,
+                    created_by=user or transfer.confirmed_by or transfer.initiated_by, timestamp=now,
+                )
+                for pk, branch_id, weight in rows
+            ])
+        return len(rows)
+
+
+class ItemMovementService:
+    """
+    سجل حركة القطع (ItemMovement).
+    Rows are only appended. to_branch is where the piece is after the movement, so the stock of
+    a branch at a date is the pieces whose last movement up to then ended in that branch.
+    """
+
+    @staticmethod
+    def record(items, movement_type, reference='', to_branch=None, user=None, timestamp=None):
+        """
+        One bulk INSERT for `items`. The destination is `to_branch` when given, none for a sale,
+        otherwise the piece's current branch (reservations, returns to the same branch).
+        """
+        timestamp = timestamp or timezone.now()
+        to_branch_id = getattr(to_branch, 'pk', to_branch)
+        entering = movement_type in ('received', 'manufactured')
+        return ItemMovement.objects.bulk_create([
+            ItemMovement(
+                item=item, movement_type=movement_type, reference=reference or '',
+                from_branch_id=None if entering else item.current_branch_id,
+                to_branch_id=None if movement_type == 'sale' else (to_branch_id or item.current_branch_id),
+                weight=item.net_gold_weight, created_by=user, timestamp=timestamp,
+            )
+            for item in items
+        ])
+
+    @staticmethod
+    def history(item):
+        """Movements of a piece, oldest first (inv_movement_item_ts_idx)"""
+        return ItemMovement.objects.filter(item=item).select_related(
+            'from_branch', 'to_branch', 'created_by'
+        ).order_by('timestamp', 'id')
+
+    @staticmethod
+    def branch_stock_as_of(branch, as_of):
+        """Items held by `branch` at the end of the `as_of` date"""
+        end = end_of_day(as_of)
+        last_movement = ItemMovement.objects.filter(
+            item=OuterRef('item'), timestamp__lt=end
+        ).order_by('-timestamp', '-id').values('id')[:1]
+        held = ItemMovement.objects.filter(
+            to_branch=getattr(branch, 'pk', branch), timestamp__lt=end
+        ).annotate(last_id=Subquery(last_movement)).filter(id=F('last_id'))
+        return Item.objects.filter(id__in=held.values('item_id'))
+
+
+class InventorySnapshotService:
+    """
+    لقطات المخزون اليومية ورصيد المخزون في تاريخ سابق.
+
+    take() stores the count and weight of pieces in stock per (branch, carat, category) and the
+    raw material weight per (branch, carat) for a date. stock_as_of() starts from the latest
+    snapshot on or before the date and replays the ItemMovement rows recorded after it, so closes
+    do not have to run at midnight. Raw materials have no movement log and come from the snapshot.
+    """
+    IN_STOCK = ('available', 'reserved', 'mandoob', 'manufacturing')
+
+    @staticmethod
+    def movement_deltas(start, end, branch=None):
+        """
+        {(branch_id, carat_id, category_id): [count, weight]} - net effect of the movements
+        recorded in [start, end) (start None = from the beginning), in two grouped queries.
+        """
+        movements = ItemMovement.objects.filter(timestamp__lt=end)
+        if start is not None:
+            movements = movements.filter(timestamp__gte=start)
+        deltas = defaultdict(lambda: [0, Decimal('0')])
+        for side, sign in (('to_branch_id', 1), ('from_branch_id', -1)):
+            rows = movements.filter(**{f'{side}__isnull': False})
+            if branch is not None:
+                rows = rows.filter(**{side: getattr(branch, 'pk', branch)})
+            for row in rows.values(side, 'item__carat_id', 'item__category_id').annotate(
+                count=Count('id'), weight=Sum('weight')
+            ).order_by():
+                delta = deltas[(row[side], row['item__carat_id'], row['item__category_id'])]
+                delta[0] += sign * row['count']
+                delta[1] += sign * (row['weight'] or 0)
+        return deltas
+
+    @staticmethod
+    def take(day=None):
+        """
+        Snapshot for `day` (default today), replacing any earlier one for that day. Pieces are taken
+        from the current stock with the movements recorded after `day` rolled back, so the job can
+        run late; raw materials are taken as they are now.
+        """
+        day = day or timezone.localdate()
+        groups = defaultdict(lambda: [0, Decimal('0')])
+        for row in Item.objects.filter(status__in=InventorySnapshotService.IN_STOCK).values(
+            'current_branch_id', 'carat_id', 'category_id'
+        ).annotate(count=Count('id'), weight=Sum('net_gold_weight')).order_by():
+            group = groups[(row['current_branch_id'], row['carat_id'], row['category_id'])]
+            group[0] += row['count']
+            group[1] += row['weight'] or 0
+
+        later = InventorySnapshotService.movement_deltas(end_of_day(day), timezone.now() + datetime.timedelta(days=1))
+        for key, (count, weight) in later.items():
+            groups[key][0] -= count
+            groups[key][1] -= weight
+
+        rows = [
+            InventorySnapshot(date=day, kind='item', branch_id=branch_id, carat_id=carat_id,
+                              category_id=category_id, count=count, weight=weight)
+            for (branch_id, carat_id, category_id), (count, weight) in groups.items() if count > 0
+        ]
+        rows += [
+            InventorySnapshot(date=day, kind='raw_material', branch_id=row['branch_id'], carat_id=row['carat_id'],
+                              count=row['count'], weight=row['weight'] or 0)
+            for row in RawMaterial.objects.values('branch_id', 'carat_id').annotate(
+                count=Count('id'), weight=Sum('current_weight')
+            ).order_by()
+        ]
+        with transaction.atomic():
+            InventorySnapshot.objects.filter(date=day).delete()
+            InventorySnapshot.objects.bulk_create(rows)
+        return len(rows)
+
+    @staticmethod
+    def stock_as_of(as_of, branch=None):
+        """
+        Stock at the end of `as_of`: {'as_of', 'snapshot_date', 'items': [...], 'raw_materials': [...]}
+        with one row per (branch_id, carat_id, category_id) and weights valued at that date's prices.
+        """
+        snapshots = InventorySnapshot.objects.filter(date__lte=as_of)
+        if branch is not None:
+            snapshots = snapshots.filter(branch=branch)
+        snapshot_date = snapshots.aggregate(d=Max('date'))['d']
+
+        groups = defaultdict(lambda: [0, Decimal('0')])
+        raw_materials = []
+        for snap in snapshots.filter(date=snapshot_date) if snapshot_date else []:
+            if snap.kind == 'item':
+                groups[(snap.branch_id, snap.carat_id, snap.category_id)] = [snap.count, snap.weight]
+            else:
+                raw_materials.append({'branch_id': snap.branch_id, 'carat_id': snap.carat_id, 'weight': snap.weight})
+
+        start = end_of_day(snapshot_date) if snapshot_date else None
+        for key, (count, weight) in InventorySnapshotService.movement_deltas(start, end_of_day(as_of), branch).items():
+            groups[key][0] += count
+            groups[key][1] += weight
+
+        prices = GoldPriceService.price_map_as_of(as_of)
+        items = []
+        for key in sorted(groups, key=lambda k: tuple(x or 0 for x in k)):
+            (branch_id, carat_id, category_id), (count, weight) = key, groups[key]
+            if count <= 0:
+                continue
+            price = prices.get(carat_id)
+            items.append({
+                'branch_id': branch_id, 'carat_id': carat_id, 'category_id': category_id,
+                'count': count, 'weight': weight,
+                'gold_value': weight * price if price is not None else None,
+            })
+        return {'as_of': as_of, 'snapshot_date': snapshot_date, 'items': items, 'raw_materials': raw_materials}
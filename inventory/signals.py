@@ -1,18 +1,35 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_save
 from django.dispatch import receiver
 from django.db import transaction
-from .models import ItemTransfer, MaterialTransfer, RawMaterial
+from .models import Item, ItemTransfer, MaterialTransfer, RawMaterial
+from core.services import BalanceService
+from .services import ItemMovementService, ItemTransferService
+
+@receiver(post_save, sender=Item)
+def log_item_entry(sender, instance, created, **kwargs):
+    """
+    First movement of a new piece. Creators can set `_movement = (type, reference)`
+    before saving (manufacturing completion); otherwise it is a plain stock entry.
+    """
+    if created:
+        movement_type, reference = getattr(instance, '_movement', ('received', ''))
+        ItemMovementService.record([instance], movement_type, reference=reference)
 
 @receiver(post_save, sender=ItemTransfer)
 def process_item_transfer_completion(sender, instance, created, **kwargs):
     """
-    Update item locations when a transfer is completed.
+    Update item locations when a transfer is completed (once per transfer).
     """
-    if instance.status == 'completed':
-        with transaction.atomic():
-            for item in instance.items.all():
-                item.current_branch = instance.to_branch
-                item.save(update_fields=['current_branch'])
+    if instance.status == 'completed' and instance.applied_at is None:
+        ItemTransferService.apply(instance)
+
+@receiver(m2m_changed, sender=ItemTransfer.items.through)
+def process_items_added_to_completed_transfer(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Pieces attached after completion (the admin saves the M2M after the transfer row).
+    """
+    if action == 'post_add' and not reverse and pk_set and instance.status == 'completed':
+        ItemTransferService.apply(instance, item_ids=pk_set)
 
 @receiver(post_save, sender=MaterialTransfer)
 def process_material_transfer_completion(sender, instance, created, **kwargs):
@@ -23,13 +40,13 @@ def process_material_transfer_completion(sender, instance, created, **kwargs):
         with transaction.atomic():
             source_material = instance.material
             
-            # 1. Deduct from source
+            # 1. Deduct from source (row locked so two transfers can't both pass the check)
+            BalanceService.lock(source_material, fields=['current_weight'])
             if source_material.current_weight < instance.weight:
                 # This should ideally be caught by validation, but being safe here
                 raise ValueError(f"الوزن المتاح في {source_material.name} أقل من الوزن المطلوب تحويله")
             
-            source_material.current_weight -= instance.weight
-            source_material.save(update_fields=['current_weight'])
+            BalanceService.apply(source_material, {'current_weight': -instance.weight})
             
             # 2. Add to destination
             # Check if destination already has this material type/carat
@@ -41,8 +58,7 @@ def process_material_transfer_completion(sender, instance, created, **kwargs):
             ).first()
             
             if dest_material:
-                dest_material.current_weight += instance.weight
-                dest_material.save(update_fields=['current_weight'])
+                BalanceService.apply(dest_material, {'current_weight': instance.weight})
             else:
                 RawMaterial.objects.create(
                     name=source_material.name,
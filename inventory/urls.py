@@ -4,10 +4,15 @@ from .api_views import get_next_barcode
 
 app_name = 'inventory'
 
-from . import views
+from . import views, api_views
 
 urlpatterns = [
     path('dashboard/', views.inventory_dashboard, name='dashboard'),
     path('print-tags/', views.print_tags, name='print_tags'),
+    path('stock-as-of/', api_views.stock_as_of, name='stock_as_of'),
+    path('stock-take/start/', api_views.stock_take_start, name='stock_take_start'),
+    path('stock-take/<int:pk>/scan/', api_views.stock_take_scan, name='stock_take_scan'),
+    path('stock-take/<int:pk>/report/', api_views.stock_take_report, name='stock_take_report'),
+    path('stock-take/<int:pk>/close/', api_views.stock_take_close, name='stock_take_close'),
 ]
 
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manufacturing', '0047_manufacturingorder_item_category'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productionstage',
+            index=models.Index(fields=['stage_name', 'end_datetime'], name='mfg_stage_name_end_idx'),
+        ),
+    ]
@@ -580,6 +580,12 @@ class ProductionStage(models.Model):
     next_workshop = models.ForeignKey(Workshop, on_delete=models.SET_NULL, null=True, blank=True, related_name='next_stages', verbose_name="تحويل إلى الورشة التالية")
     is_transferred = models.BooleanField("تم التحويل تلقائياً", default=False)
 
+    class Meta:
+        indexes = [
+            # Stage analytics: finished stages per stage name over a date range
+            models.Index(fields=['stage_name', 'end_datetime'], name='mfg_stage_name_end_idx'),
+        ]
+
     @property
     def duration(self):
         if self.start_datetime and self.end_datetime:
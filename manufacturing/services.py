@@ -0,0 +1,283 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import (
+    Avg, Case, Count, DecimalField, DurationField, ExpressionWrapper, F, Q, Sum, Value, When,
+)
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+from core.context_processors import MFG_STATS_CACHE_KEY
+from core.services import BalanceService, SequenceService
+from inventory.models import RawMaterial
+from .models import ManufacturingOrder, OrderStone, ProductionStage, Workshop, WorkshopTransfer
+
+
+class StageLossCalculator:
+    """
+    حساب خسية مراحل الإنتاج: الدخول - (الخروج - أحجار المرحلة) - البودر.
+    وزن الأحجار بالذهب (التحييف) يحسب داخل قاعدة البيانات بنفس قواعد
+    OrderStone.weight_in_gold، لكل المراحل في استعلام واحد.
+    """
+    GRAM_UNITS = ['gram', 'g', 'gm', 'جرام']
+    CARAT_UNITS = ['carat', 'ct']
+    CARAT_TO_GRAM = Decimal('0.2')
+
+    @staticmethod
+    def stone_gold_expression(prefix=''):
+        """SQL equivalent of OrderStone.weight_in_gold; `prefix` is the path to OrderStone (e.g. 'orderstone__')"""
+        unit = f'{prefix}stone__unit'
+        qty = F(f'{prefix}quantity')
+        return Case(
+            When(**{f'{unit}__in': StageLossCalculator.GRAM_UNITS}, then=qty),
+            When(Q(**{f'{unit}__in': StageLossCalculator.CARAT_UNITS}) | Q(**{f'{unit}__contains': 'قيراط'}),
+                 then=qty * StageLossCalculator.CARAT_TO_GRAM),
+            default=Value(Decimal('0')),
+            output_field=DecimalField(max_digits=12, decimal_places=3),
+        )
+
+    @staticmethod
+    def annotate(queryset):
+        """Adds `stones_gold` (grams of stones issued in each stage) to a ProductionStage queryset"""
+        return queryset.annotate(stones_gold=Coalesce(
+            Sum(StageLossCalculator.stone_gold_expression('orderstone__')), Value(Decimal('0')),
+            output_field=DecimalField(max_digits=12, decimal_places=3),
+        ))
+
+    @staticmethod
+    def stone_weights(stage_ids):
+        """{stage_id: stones weight in grams} for the given stages in one grouped query"""
+        rows = OrderStone.objects.filter(production_stage_id__in=stage_ids).values('production_stage_id').annotate(
+            w=Sum(StageLossCalculator.stone_gold_expression())
+        ).order_by().values_list('production_stage_id', 'w')
+        return {stage_id: w or Decimal('0') for stage_id, w in rows}
+
+    @staticmethod
+    def compute_loss(stage, stones_gold):
+        return stage.input_weight - (stage.output_weight - stones_gold) - (stage.powder_weight or 0)
+
+    @staticmethod
+    def close_stages(closures, next_workshop=None, user=None, end_datetime=None):
+        """
+        Close many open stages in one transaction.
+        closures: {stage_id: {'output_weight': w, 'powder_weight': p}}
+        - loss uses one grouped stone query for all stages
+        - stages are written with one bulk_update
+        - workshop balances get one apply_holding per (workshop, carat) instead of one save per stage
+        - with `next_workshop`, the completed WorkshopTransfer rows are bulk created and the
+          destination is credited the same way (what the per-stage signals do one by one)
+        Returns the closed stages.
+        """
+        now = end_datetime or timezone.now()
+        if next_workshop and not getattr(user, 'is_authenticated', False):
+            from django.contrib.auth import get_user_model
+            user = get_user_model().objects.filter(is_superuser=True).first()
+        with transaction.atomic():
+            stages = list(ProductionStage.objects.select_for_update(of=('self',)).select_related('order').filter(
+                pk__in=list(closures), end_datetime__isnull=True
+            ))
+            stones = StageLossCalculator.stone_weights([s.pk for s in stages])
+
+            debits = defaultdict(lambda: defaultdict(Decimal))   # (workshop_id, carat_id) -> {bucket: delta}
+            credits = defaultdict(Decimal)                        # (next_workshop_id, carat_id) -> weight
+            transfers = []
+            for stage in stages:
+                data = closures.get(stage.pk) or closures.get(str(stage.pk)) or {}
+                stage.output_weight = Decimal(str(data.get('output_weight') or 0))
+                stage.powder_weight = Decimal(str(data.get('powder_weight') or 0))
+                stage.end_datetime = now
+                if next_workshop:
+                    stage.next_workshop = next_workshop
+
+                if stage.input_weight and stage.output_weight:
+                    stage.loss_weight = StageLossCalculator.compute_loss(stage, stones.get(stage.pk, Decimal('0')))
+                    if stage.workshop_id:
+                        bucket = debits[(stage.workshop_id, stage.order.carat_id)]
+                        bucket['gold'] -= stage.input_weight
+                        if stage.powder_weight > 0:
+                            bucket['filings'] += stage.powder_weight
+                        if stage.loss_weight > 0:
+                            bucket['scrap'] += stage.loss_weight
+
+                from_ws_id = stage.workshop_id or stage.order.workshop_id
+                if next_workshop and from_ws_id and stage.output_weight > 0:
+                    stage.is_transferred = True
+                    credits[(next_workshop.pk, stage.order.carat_id)] += stage.output_weight
+                    transfers.append(WorkshopTransfer(
+                        transfer_number=f"TRF-{stage.order.order_number}-{stage.id}",
+                        order=stage.order, from_workshop_id=from_ws_id, to_workshop=next_workshop,
+                        carat_id=stage.order.carat_id, weight=stage.output_weight, status='completed',
+                        initiated_by=user, confirmed_by=user,
+                        notes=f"Auto-transfer from Stage: {stage.get_stage_name_display()}",
+                    ))
+
+            ProductionStage.objects.bulk_update(stages, [
+                'output_weight', 'powder_weight', 'loss_weight', 'end_datetime', 'next_workshop', 'is_transferred',
+            ])
+            WorkshopTransfer.objects.bulk_create(transfers)
+
+            workshop_ids = {ws_id for ws_id, _ in debits} | {ws_id for ws_id, _ in credits}
+            workshops = Workshop.objects.in_bulk(workshop_ids)
+            for (ws_id, carat_id), holdings in debits.items():
+                BalanceService.apply_holding(workshops[ws_id], carat_id, holdings)
+            for (ws_id, carat_id), weight in credits.items():
+                BalanceService.apply_holding(workshops[ws_id], carat_id, {'gold': weight})
+        return stages
+
+
+class ProductionBatchService:
+    """
+    إنشاء وتشغيل دفعات أوامر التصنيع بالجملة (أوامر magic_workflow).
+    الأوامر والمراحل تنشأ بـ bulk_create، والصرف للورشة والمواد الخام يطبق مرة واحدة لكل دفعة.
+    """
+    ORDER_PREFIX = 'AUTO'
+
+    @staticmethod
+    def next_order_numbers(count, prefix=None, day=None):
+        """Reserve `count` consecutive numbers for the day, e.g. AUTO-261017-00042"""
+        day_prefix = f"{prefix or ProductionBatchService.ORDER_PREFIX}-{(day or timezone.localdate()).strftime('%y%m%d')}"
+        return SequenceService.reserve_codes(
+            day_prefix, count, width=5, seed=lambda: ProductionBatchService._last_order_number(day_prefix)
+        )
+
+    @staticmethod
+    def _last_order_number(day_prefix):
+        """Highest number issued for the day before its sequence row existed"""
+        last = ManufacturingOrder.objects.filter(order_number__startswith=f"{day_prefix}-").order_by(
+            '-order_number'
+        ).values_list('order_number', flat=True).first()
+        tail = last[len(day_prefix) + 1:] if last else ''
+        return int(tail) if tail.isdigit() else 0
+
+    @staticmethod
+    def create_batch(count, carat, input_weight, item_name_pattern='', **fields):
+        """Create `count` draft orders in one INSERT with a reserved block of order numbers"""
+        with transaction.atomic():
+            orders = ManufacturingOrder.objects.bulk_create([
+                ManufacturingOrder(
+                    order_number=number, carat=carat, input_weight=input_weight, status='draft',
+                    item_name_pattern=item_name_pattern, **fields
+                )
+                for number in ProductionBatchService.next_order_numbers(count)
+            ])
+        cache.delete(MFG_STATS_CACHE_KEY)
+        return orders
+
+    @staticmethod
+    def issue_batch(order_ids, workshop, stage_name=None):
+        """
+        Start the draft orders in `workshop`: one UPDATE for the orders, one INSERT for their first
+        stages, then the issuance done by issue_order_materials per order is applied once per batch
+        (workshop gold per carat, raw material deductions per material).
+        Returns the started orders.
+        """
+        with transaction.atomic():
+            orders = list(ManufacturingOrder.objects.select_for_update().filter(id__in=order_ids, status='draft'))
+            if not orders:
+                return []
+
+            now = timezone.now()
+            ManufacturingOrder.objects.filter(pk__in=[o.pk for o in orders]).update(workshop=workshop, status='in_progress')
+            ProductionStage.objects.bulk_create([
+                ProductionStage(
+                    order=order, workshop=workshop, stage_name=stage_name or workshop.default_stage_name or 'casting',
+                    input_weight=order.input_weight, start_datetime=now,
+                )
+                for order in orders
+            ])
+
+            gold = defaultdict(Decimal)
+            materials = defaultdict(Decimal)
+            for order in orders:
+                order.workshop, order.status = workshop, 'in_progress'
+                if order.input_weight > 0:
+                    gold[order.carat_id] += order.input_weight
+                    if order.input_material_id:
+                        materials[order.input_material_id] += order.input_weight
+
+            for carat_id, weight in gold.items():
+                BalanceService.apply_holding(workshop, carat_id, {'gold': weight})
+            for material in RawMaterial.objects.filter(pk__in=materials):
+                BalanceService.apply(material, {'current_weight': -materials[material.pk]}, refresh=False)
+        cache.delete(MFG_STATS_CACHE_KEY)
+        return orders
+
+
+class StageAnalyticsService:
+    """
+    تحليلات مراحل الإنتاج محسوبة داخل قاعدة البيانات.
+    Duration (end - start), input, output, powder and loss are summed per stage name (optionally
+    per workshop) for stages finished in a date range, served by mfg_stage_name_end_idx.
+    """
+    DECIMAL = DecimalField(max_digits=15, decimal_places=3)
+
+    @staticmethod
+    def day_bounds(start, end):
+        """Aware [start 00:00, day after end 00:00) so end_datetime is compared without a date cast"""
+        tz = timezone.get_current_timezone()
+        return (
+            timezone.make_aware(datetime.datetime.combine(start, datetime.time.min), tz),
+            timezone.make_aware(datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min), tz),
+        )
+
+    @staticmethod
+    def finished(start, end):
+        since, until = StageAnalyticsService.day_bounds(start, end)
+        return ProductionStage.objects.filter(end_datetime__gte=since, end_datetime__lt=until)
+
+    @staticmethod
+    def duration_expression():
+        return ExpressionWrapper(F('end_datetime') - F('start_datetime'), output_field=DurationField())
+
+    @staticmethod
+    def totals_expressions():
+        zero = Value(Decimal('0'))
+        S = StageAnalyticsService
+        return {
+            'count': Count('id'),
+            'avg_duration': Avg(S.duration_expression()),
+            'total_duration': Sum(S.duration_expression()),
+            'input': Coalesce(Sum('input_weight'), zero, output_field=S.DECIMAL),
+            'output': Coalesce(Sum('output_weight'), zero, output_field=S.DECIMAL),
+            'powder': Coalesce(Sum('powder_weight'), zero, output_field=S.DECIMAL),
+            'loss': Coalesce(Sum('loss_weight'), zero, output_field=S.DECIMAL),
+        }
+
+    @staticmethod
+    def _with_loss_pct(row):
+        row['loss_pct'] = (row['loss'] / row['input'] * 100).quantize(Decimal('0.01')) if row['input'] else Decimal('0')
+        return row
+
+    @staticmethod
+    def summary(start, end, by_workshop=False):
+        """
+        One row per stage_name (and workshop with `by_workshop`) for stages finished between
+        `start` and `end` (dates): count, avg/total duration, input, output, powder, loss, loss_pct.
+        """
+        keys = ['stage_name', 'workshop_id', 'workshop__name'] if by_workshop else ['stage_name']
+        names = dict(ProductionStage.STAGE_CHOICES)
+        rows = StageAnalyticsService.finished(start, end).values(*keys).annotate(
+            **StageAnalyticsService.totals_expressions()
+        ).order_by(*keys)
+        return [
+            StageAnalyticsService._with_loss_pct({**row, 'stage': names.get(row['stage_name'], row['stage_name'])})
+            for row in rows
+        ]
+
+    @staticmethod
+    def loss_trend(start, end, stage_name=None, workshop=None):
+        """Monthly input / powder / loss (khasia) and loss_pct for finished stages, in one grouped query"""
+        qs = StageAnalyticsService.finished(start, end)
+        if stage_name:
+            qs = qs.filter(stage_name=stage_name)
+        if workshop:
+            qs = qs.filter(workshop=workshop)
+        zero = Value(Decimal('0'))
+        rows = qs.annotate(month=TruncMonth('end_datetime')).values('month').annotate(
+            count=Count('id'),
+            input=Coalesce(Sum('input_weight'), zero, output_field=StageAnalyticsService.DECIMAL),
+            powder=Coalesce(Sum('powder_weight'), zero, output_field=StageAnalyticsService.DECIMAL),
+            loss=Coalesce(Sum('loss_weight'), zero, output_field=StageAnalyticsService.DECIMAL),
+        ).order_by('month')
+        return [StageAnalyticsService._with_loss_pct(row) for row in rows]
@@ -5,6 +5,8 @@ from django.db import transaction
 from django.db.models import Sum
 from .models import ManufacturingOrder, Workshop, WorkshopTransfer, OrderStone, WorkshopSettlement
 from inventory.models import Item, Carat
+from core.services import BalanceService, SequenceService
+from .services import StageLossCalculator
 
 @receiver(pre_save, sender=ManufacturingOrder)
 def calculate_workshop_loss(sender, instance, **kwargs):
@@ -47,20 +49,11 @@ def issue_order_materials(sender, instance, created, **kwargs):
     if is_active and was_draft and instance.input_weight > 0 and instance.workshop:
         with transaction.atomic():
             # 1. Add gold to Workshop balance
-            carat_name = instance.carat.name
-            if '18' in carat_name:
-                instance.workshop.gold_balance_18 += instance.input_weight
-            elif '21' in carat_name:
-                instance.workshop.gold_balance_21 += instance.input_weight
-            elif '24' in carat_name:
-                instance.workshop.gold_balance_24 += instance.input_weight
-            
-            instance.workshop.save()
+            BalanceService.apply_holding(instance.workshop, instance.carat, {'gold': instance.input_weight})
             
             # 2. Deduct from RawMaterial if provided
             if instance.input_material:
-                instance.input_material.current_weight -= instance.input_weight
-                instance.input_material.save()
+                BalanceService.apply(instance.input_material, {'current_weight': -instance.input_weight})
             
             # Prevent re-triggering if same instance is saved again
             instance._original_status = instance.status
@@ -82,19 +75,14 @@ def complete_manufacturing_order(sender, instance, created, **kwargs):
         
         # 1. Update Workshop Balances
         if instance.workshop:
+            holdings = {}
             # Credit the Workshop Labor Balance ONLY for external workshops
             if instance.workshop.workshop_type == 'external' and instance.manufacturing_pay > 0:
-                instance.workshop.labor_balance += instance.manufacturing_pay
+                BalanceService.apply(instance.workshop, {'labor_balance': instance.manufacturing_pay})
             
             # Update Filings (Powder) Balance
             if instance.powder_weight > 0:
-                carat_name = instance.carat.name
-                if '18' in carat_name:
-                    instance.workshop.filings_balance_18 += instance.powder_weight
-                elif '21' in carat_name:
-                    instance.workshop.filings_balance_21 += instance.powder_weight
-                elif '24' in carat_name:
-                    instance.workshop.filings_balance_24 += instance.powder_weight
+                holdings['filings'] = instance.powder_weight
             
             # --- NEW: Deduct used gold (Net Gold + Powder) from Workshop Balance ---
             # NOTE: We do NOT deduct 'scrap_weight' automatically here.
@@ -163,15 +151,8 @@ def complete_manufacturing_order(sender, instance, created, **kwargs):
                             created_by=created_by
                         )
 
-            carat_name = instance.carat.name
-            if '18' in carat_name:
-                instance.workshop.gold_balance_18 -= total_gold_consumed
-            elif '21' in carat_name:
-                instance.workshop.gold_balance_21 -= total_gold_consumed
-            elif '24' in carat_name:
-                instance.workshop.gold_balance_24 -= total_gold_consumed
-
-            instance.workshop.save()
+            holdings['gold'] = -total_gold_consumed
+            BalanceService.apply_holding(instance.workshop, instance.carat, holdings)
             
             # Prevent re-triggering completion logic if same instance is saved again
             instance._original_status = instance.status
@@ -182,20 +163,19 @@ def complete_manufacturing_order(sender, instance, created, **kwargs):
         # 2. Auto-Create Item in Inventory (If needed and doesn't exist)
         if instance.auto_create_item and not instance.resulting_item:
             try:
-                import random
-                from finance.models import FinanceSettings
+                from finance.services import FinanceLookup
                 from finance.treasury_models import TreasuryTransaction
 
                 # Generate a unique barcode if not strictly defined
                 barcode = ""
-                # If NO item category is selected, fallback to random MFG barcode
+                # If NO item category is selected, fallback to the MFG sequence
                 if not instance.item_category:
-                     barcode = f"MFG-{instance.order_number}-{random.randint(1000, 9999)}"
+                     barcode = SequenceService.next_code('MFG')
                 
                 # Calculate Total Labor Cost (Technician Pay + Factory Profit Margin)
                 total_labor_cost = (instance.manufacturing_pay or 0) + (instance.factory_margin or 0)
 
-                new_item = Item.objects.create(
+                new_item = Item(
                     name=instance.item_name_pattern or f"منتج مصنع - {instance.order_number}",
                     barcode=barcode, # If empty and category has prefix, Item.save() will generate it
                     category=instance.item_category, # Pass the category
@@ -210,16 +190,18 @@ def complete_manufacturing_order(sender, instance, created, **kwargs):
                     status='available',
                     current_branch=instance.target_branch
                 )
+                new_item._movement = ('manufactured', instance.order_number)
+                new_item.save()
                 
                 # Link it back
                 instance.resulting_item = new_item
                 instance.save(update_fields=['resulting_item'])
 
                 # 3. Record in Sales Treasury (Value Transfer)
-                settings = FinanceSettings.objects.first()
-                if settings and settings.sales_treasury:
+                settings = FinanceLookup.settings()
+                if settings and settings.sales_treasury_id:
                     TreasuryTransaction.objects.create(
-                        treasury=settings.sales_treasury,
+                        treasury_id=settings.sales_treasury_id,
                         transaction_type='finished_goods_in',
                         cash_amount=total_labor_cost, # Recording the labor value component
                         gold_weight=instance.output_weight,
@@ -264,33 +246,9 @@ def process_workshop_transfer(sender, instance, created, **kwargs):
     # If created, it wasn't completed before (it didn't exist), so we proceed if it is now completed.
     if is_completed and (created or not was_completed):
         with transaction.atomic():
-            dest = instance.to_workshop
-            weight = instance.weight
-            carat_name = instance.carat.name
-            
-            # Determine which field to update based on carat
-            field_map = {
-                '18': 'gold_balance_18',
-                '21': 'gold_balance_21',
-                '24': 'gold_balance_24',
-            }
-            
-            field_to_update = None
-            for key, field in field_map.items():
-                if key in carat_name:
-                    field_to_update = field
-                    break
-            
-            if not field_to_update:
-                raise ValueError(f"العيار {carat_name} غير مدعوم في تحويلات الورش")
-            
             # NOTE: Source deduction is already done by ProductionStage.post_save
-            # Here we only ADD to destination workshop
-            
-            # Add to destination
-            current_dest_bal = getattr(dest, field_to_update)
-            setattr(dest, field_to_update, current_dest_bal + weight)
-            dest.save(update_fields=[field_to_update])
+            # Here we only ADD to destination workshop (any carat - HoldingBalance has no fixed columns)
+            BalanceService.apply_holding(instance.to_workshop, instance.carat, {'gold': instance.weight})
 
 
 @receiver([post_save, post_delete], sender=OrderStone)
@@ -344,10 +302,10 @@ def handle_production_stage_balances(sender, instance, created, **kwargs):
     # 1. Calculate Loss (Khasia) if I/O/P are present
     if instance.input_weight and instance.output_weight:
         # Subtract weight of stones added during THIS specific stage
-        stones_weight_in_stage = sum([os.weight_in_gold for os in instance.orderstone_set.all()])
+        stones_weight_in_stage = StageLossCalculator.stone_weights([instance.pk]).get(instance.pk, Decimal('0'))
         
         # calc_loss = Input - (Output - StonesAdded) - Powder
-        calc_loss = instance.input_weight - (instance.output_weight - stones_weight_in_stage) - (instance.powder_weight or 0)
+        calc_loss = StageLossCalculator.compute_loss(instance, stones_weight_in_stage)
         
         # Update loss field if changed (avoid recursion loop by checking)
         if instance.loss_weight != calc_loss:
@@ -359,7 +317,6 @@ def handle_production_stage_balances(sender, instance, created, **kwargs):
         if instance.workshop and instance.end_datetime:
             with transaction.atomic():
                 ws = instance.workshop
-                carat_name = instance.order.carat.name
                 weight_to_deduct = instance.input_weight # The amount they were responsible for in this stage
                 powder = instance.powder_weight or 0
                 loss = instance.loss_weight or 0 # Real Scrap
@@ -368,27 +325,18 @@ def handle_production_stage_balances(sender, instance, created, **kwargs):
                 # We remove the Input from their "Active Gold Debt" 
                 # and record Powder and Loss in their respective stock accounts.
                 
-                field_prefix = None
-                if '18' in carat_name: field_prefix = '18'
-                elif '21' in carat_name: field_prefix = '21'
-                elif '24' in carat_name: field_prefix = '24'
+                # 1. Deduct from Active Gold Balance
+                holdings = {'gold': -weight_to_deduct}
                 
-                if field_prefix:
-                    # 1. Deduct from Active Gold Balance
-                    current_gold = getattr(ws, f'gold_balance_{field_prefix}')
-                    setattr(ws, f'gold_balance_{field_prefix}', current_gold - weight_to_deduct)
-                    
-                    # 2. Add to Powder Stock
-                    if powder > 0:
-                        current_p = getattr(ws, f'filings_balance_{field_prefix}')
-                        setattr(ws, f'filings_balance_{field_prefix}', current_p + powder)
-                    
-                    # 3. Add to Scrap Stock
-                    if loss > 0:
-                        current_s = getattr(ws, f'scrap_balance_{field_prefix}')
-                        setattr(ws, f'scrap_balance_{field_prefix}', current_s + loss)
-                    
-                    ws.save()
+                # 2. Add to Powder Stock
+                if powder > 0:
+                    holdings['filings'] = powder
+                
+                # 3. Add to Scrap Stock
+                if loss > 0:
+                    holdings['scrap'] = loss
+                
+                BalanceService.apply_holding(ws, instance.order.carat, holdings)
 
     # 3. Auto-Transfer Logic
     if instance.next_workshop and not instance.is_transferred and instance.output_weight > 0:
@@ -448,27 +396,16 @@ def process_workshop_settlement(sender, instance, created, **kwargs):
         with transaction.atomic():
             ws = instance.workshop
             
-            # Determine which balance field to touch based on Carat (if applicable)
-            gold_field = None
-            filings_field = None
-            
-            if instance.carat:
-                if '18' in instance.carat.name:
-                    gold_field = 'gold_balance_18'
-                    filings_field = 'filings_balance_18'
-                elif '21' in instance.carat.name:
-                    gold_field = 'gold_balance_21'
-                    filings_field = 'filings_balance_21'
-                elif '24' in instance.carat.name:
-                    gold_field = 'gold_balance_24'
-                    filings_field = 'filings_balance_24'
+            # Gold buckets need a carat; labor is a plain cash column
+            has_carat = instance.carat_id is not None
+            holdings = {}
+            floor_zero = ()
 
             # --- Logic based on Settlement Type ---
             
             # 1. We PAID Gold to the Workshop (They owe us more)
-            if instance.settlement_type == 'gold_payment' and gold_field:
-                current = getattr(ws, gold_field)
-                setattr(ws, gold_field, current + instance.weight)
+            if instance.settlement_type == 'gold_payment' and has_carat:
+                holdings['gold'] = instance.weight
                 
             # 2. We Custom Paid Labor (Cash) (They owe us / We paid off debt)
             elif instance.settlement_type == 'labor_payment':
@@ -476,31 +413,20 @@ def process_workshop_settlement(sender, instance, created, **kwargs):
                 # OR increasing their cash debt to us if they work on credit.
                 # Standard convention: Workshop Labor Balance is "Credit" (Money we owe them).
                 # So Paying them reduces that balance.
-                ws.labor_balance -= instance.amount
+                BalanceService.apply(ws, {'labor_balance': -instance.amount})
 
             # 3. We RECEIVED Scrap (Clear Gold Debt)
-            elif instance.settlement_type == 'scrap_receive' and gold_field:
-                current = getattr(ws, gold_field)
-                setattr(ws, gold_field, current - instance.weight)
+            elif instance.settlement_type == 'scrap_receive' and has_carat:
+                holdings['gold'] = -instance.weight
 
             # 4. We RECEIVED Powder (Clear Gold Debt / Liability)
-            elif instance.settlement_type == 'powder_receive':
-                scrap_field = None
-                if '18' in instance.carat.name: scrap_field, filings_field = 'scrap_balance_18', 'filings_balance_18'
-                elif '21' in instance.carat.name: scrap_field, filings_field = 'scrap_balance_21', 'filings_balance_21'
-                elif '24' in instance.carat.name: scrap_field, filings_field = 'scrap_balance_24', 'filings_balance_24'
+            elif instance.settlement_type == 'powder_receive' and has_carat:
+                # Deduct from Scrap Balance (accumulated loss)
+                holdings['scrap'] = -instance.weight
                 
-                if scrap_field:
-                    # Deduct from Scrap Balance (accumulated loss)
-                    current_s = getattr(ws, scrap_field)
-                    setattr(ws, scrap_field, current_s - instance.weight)
-                    
-                    # Also deduct from Filings Balance if we were tracking it per order
-                    current_f = getattr(ws, filings_field)
-                    if current_f >= instance.weight:
-                        setattr(ws, filings_field, current_f - instance.weight)
-                    else:
-                        setattr(ws, filings_field, 0)
-
-            ws.save()
+                # Also deduct from Filings Balance if we were tracking it per order (never below zero)
+                holdings['filings'] = -instance.weight
+                floor_zero = ('filings',)
+
+            BalanceService.apply_holding(ws, instance.carat, holdings, floor_zero=floor_zero)
 
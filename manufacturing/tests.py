@@ -1,3 +1,263 @@
+from decimal import Decimal
 from django.test import TestCase
+from django.contrib.auth.models import User
+from core.models import Carat
+from core.services import BalanceService
+from .models import Workshop, WorkshopSettlement, WorkshopTransfer
 
-# Create your tests here.
+
+class WorkshopBalanceTests(TestCase):
+    def setUp(self):
+        self.c21 = Carat.objects.create(name="21K", purity=Decimal('0.8750'))
+        self.user = User.objects.create_user('keeper')
+        self.ws = Workshop.objects.create(name="ورشة 1")
+        self.other = Workshop.objects.create(name="ورشة 2")
+
+    def test_stale_instances_do_not_lose_updates(self):
+        stale = Workshop.objects.get(pk=self.ws.pk)
+        BalanceService.apply(self.ws, {'gold_balance_21': Decimal('10')})
+        BalanceService.apply(stale, {'gold_balance_21': Decimal('5'), 'labor_balance': Decimal('100')})
+        self.ws.refresh_from_db()
+        self.assertEqual(self.ws.gold_balance_21, Decimal('15'))
+        self.assertEqual(self.ws.labor_balance, Decimal('100'))
+        self.assertEqual(stale.gold_balance_21, Decimal('15'))
+
+    def test_settlements_apply_deltas(self):
+        WorkshopSettlement.objects.create(workshop=self.ws, settlement_type='gold_payment', carat=self.c21, weight=Decimal('20'))
+        Workshop.objects.filter(pk=self.ws.pk).update(scrap_balance_21=Decimal('3'), filings_balance_21=Decimal('1'))
+        WorkshopSettlement.objects.create(workshop=self.ws, settlement_type='powder_receive', carat=self.c21, weight=Decimal('2'))
+        self.ws.refresh_from_db()
+        self.assertEqual(self.ws.gold_balance_21, Decimal('20'))
+        self.assertEqual(self.ws.scrap_balance_21, Decimal('1'))
+        self.assertEqual(self.ws.filings_balance_21, Decimal('0'))
+
+    def test_completed_transfer_credits_destination(self):
+        WorkshopTransfer.objects.create(
+            transfer_number="TRF-1", from_workshop=self.ws, to_workshop=self.other,
+            carat=self.c21, weight=Decimal('7.5'), status='completed', initiated_by=self.user,
+        )
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.gold_balance_21, Decimal('7.5'))
+
+    def test_treasury_gold_in_syncs_linked_workshop(self):
+        from finance.treasury_models import Treasury, TreasuryTransaction
+        treasury = Treasury.objects.create(name="خزينة الورشة", code="TR-WS", workshop=self.ws, responsible_user=self.user)
+        trx = TreasuryTransaction.objects.create(
+            treasury=treasury, transaction_type='gold_in', gold_weight=Decimal('12'),
+            gold_carat=self.c21, description="استلام", created_by=self.user,
+        )
+        treasury.refresh_from_db()
+        self.ws.refresh_from_db()
+        trx.refresh_from_db()
+        self.assertEqual(treasury.gold_balance_21, Decimal('12'))
+        self.assertEqual(self.ws.gold_balance_21, Decimal('12'))
+        self.assertEqual(trx.balance_after_gold, Decimal('12'))
+
+
+class StageLossCalculatorTests(TestCase):
+    def setUp(self):
+        from .models import ManufacturingOrder, ProductionStage, Stone, OrderStone
+        self.c21 = Carat.objects.create(name="21K", purity=Decimal('0.8750'))
+        self.user = User.objects.create_superuser('admin', password='x')
+        self.ws = Workshop.objects.create(name="تركيب")
+        self.next_ws = Workshop.objects.create(name="تلميع")
+        ct_stone = Stone.objects.create(name="زركون", unit='carat')
+        g_stone = Stone.objects.create(name="خرز", unit='gram')
+        self.stages = []
+        for n in range(3):
+            order = ManufacturingOrder.objects.create(
+                order_number=f"MO-{n}", workshop=self.ws, carat=self.c21, input_weight=Decimal('10'), status='draft'
+            )
+            stage = ProductionStage.objects.create(order=order, workshop=self.ws, input_weight=Decimal('10'))
+            OrderStone.objects.create(order=order, stone=ct_stone, production_stage=stage, quantity_issued=Decimal('5'))
+            OrderStone.objects.create(order=order, stone=g_stone, production_stage=stage, quantity_issued=Decimal('0.5'))
+            self.stages.append(stage)
+
+    def test_annotated_stone_weight_matches_property(self):
+        from .models import ProductionStage
+        from .services import StageLossCalculator
+        stage = StageLossCalculator.annotate(ProductionStage.objects.filter(pk=self.stages[0].pk)).get()
+        expected = sum(os.weight_in_gold for os in self.stages[0].orderstone_set.all())
+        self.assertEqual(stage.stones_gold, expected)
+        self.assertEqual(StageLossCalculator.stone_weights([stage.pk]), {stage.pk: Decimal('1.5')})
+
+    def test_close_stages_aggregates_balances(self):
+        from .models import ProductionStage
+        from .services import StageLossCalculator
+        closures = {s.pk: {'output_weight': '11', 'powder_weight': '0.2'} for s in self.stages}
+        StageLossCalculator.close_stages(closures, next_workshop=self.next_ws, user=self.user)
+
+        # loss = 10 - (11 - 1.5) - 0.2 = 0.3 per stage
+        self.assertEqual(
+            set(ProductionStage.objects.filter(pk__in=closures).values_list('loss_weight', 'is_transferred')),
+            {(Decimal('0.3'), True)},
+        )
+        self.ws.refresh_from_db()
+        self.next_ws.refresh_from_db()
+        self.assertEqual(self.ws.gold_balance_21, Decimal('-30'))
+        self.assertEqual(self.ws.filings_balance_21, Decimal('0.6'))
+        self.assertEqual(self.ws.scrap_balance_21, Decimal('0.9'))
+        self.assertEqual(self.next_ws.gold_balance_21, Decimal('33'))
+        self.assertEqual(WorkshopTransfer.objects.filter(to_workshop=self.next_ws).count(), 3)
+
+        # Already closed stages are skipped
+        self.assertEqual(StageLossCalculator.close_stages(closures), [])
+
+    def test_magic_workflow_bulk_move(self):
+        import json
+        from django.urls import reverse
+        from .models import ManufacturingOrder, ProductionStage
+        self.client.force_login(self.user)
+        orders = [{'order_id': s.order_id, 'output_weight': '11', 'powder_weight': '0'} for s in self.stages]
+        response = self.client.post(reverse('manufacturing:magic_workflow'), {
+            'action': 'move_orders_bulk', 'next_workshop_id': self.next_ws.pk, 'orders_json': json.dumps(orders),
+        })
+        self.assertEqual(response.json()['moved'], 3)
+        self.assertEqual(ManufacturingOrder.objects.filter(workshop=self.next_ws).count(), 3)
+        self.assertEqual(ProductionStage.objects.filter(
+            workshop=self.next_ws, end_datetime__isnull=True, input_weight=Decimal('11')
+        ).count(), 3)
+
+    def test_magic_workflow_bulk_move_skips_orders_without_open_stage(self):
+        import json
+        from django.core.cache import cache
+        from django.urls import reverse
+        from core.context_processors import MFG_STATS_CACHE_KEY
+        from .models import ManufacturingOrder, ProductionStage
+        self.client.force_login(self.user)
+        idle = ManufacturingOrder.objects.create(order_number="MO-IDLE", workshop=self.ws, carat=self.c21, input_weight=Decimal('10'))
+        cache.set(MFG_STATS_CACHE_KEY, {'stale': True})
+        orders = [{'order_id': o, 'output_weight': '11', 'powder_weight': '0'} for o in (self.stages[0].order_id, idle.pk, 99999)]
+        response = self.client.post(reverse('manufacturing:magic_workflow'), {
+            'action': 'move_orders_bulk', 'next_workshop_id': self.next_ws.pk, 'orders_json': json.dumps(orders),
+        })
+        self.assertEqual(response.json()['moved'], 1)
+        idle.refresh_from_db()
+        self.assertEqual(idle.workshop, self.ws)
+        self.assertFalse(ProductionStage.objects.filter(order=idle).exists())
+        self.assertEqual(ProductionStage.objects.filter(workshop=self.next_ws).count(), 1)
+        self.assertIsNone(cache.get(MFG_STATS_CACHE_KEY))
+
+
+class ProductionBatchServiceTests(TestCase):
+    def setUp(self):
+        from inventory.models import RawMaterial
+        from core.models import Branch
+        self.c21 = Carat.objects.create(name="21K", purity=Decimal('0.8750'))
+        self.ws = Workshop.objects.create(name="سبك")
+        self.material = RawMaterial.objects.create(
+            name="سبيكة", material_type='gold_bar', carat=self.c21, current_weight=Decimal('5000'),
+            branch=Branch.objects.create(name="الرئيسي"),
+        )
+
+    def test_batch_numbers_are_sequential_and_unique(self):
+        from .models import ManufacturingOrder
+        from .services import ProductionBatchService
+        first = ProductionBatchService.create_batch(3, self.c21, Decimal('5'))
+        second = ProductionBatchService.create_batch(2, self.c21, Decimal('5'))
+        numbers = [o.order_number for o in first + second]
+        self.assertEqual(len(set(numbers)), 5)
+        self.assertTrue(numbers[-1].endswith('-00005'))
+        self.assertEqual(ManufacturingOrder.objects.filter(status='draft').count(), 5)
+
+    def test_issue_batch_of_200_uses_constant_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .models import ManufacturingOrder, ProductionStage
+        from .services import ProductionBatchService
+        with CaptureQueriesContext(connection) as ctx:
+            orders = ProductionBatchService.create_batch(200, self.c21, Decimal('5'), input_material=self.material)
+            ProductionBatchService.issue_batch([o.id for o in orders], self.ws)
+        # Bounded by SQLite's insert batch size and savepoints, not by one query per order
+        self.assertLess(len(ctx.captured_queries), 50)
+
+        self.assertEqual(ManufacturingOrder.objects.filter(status='in_progress', workshop=self.ws).count(), 200)
+        self.assertEqual(ProductionStage.objects.filter(workshop=self.ws, input_weight=Decimal('5')).count(), 200)
+        self.ws.refresh_from_db()
+        self.material.refresh_from_db()
+        self.assertEqual(self.ws.gold_balance_21, Decimal('1000'))
+        self.assertEqual(self.material.current_weight, Decimal('4000'))
+
+        # Orders that already left draft are not issued twice
+        self.assertEqual(ProductionBatchService.issue_batch([orders[0].id], self.ws), [])
+
+
+class StageAnalyticsTests(TestCase):
+    def setUp(self):
+        import datetime
+        from django.utils import timezone
+        from .models import ManufacturingOrder, ProductionStage
+        self.c21 = Carat.objects.create(name="21K", purity=Decimal('0.8750'))
+        self.ws = Workshop.objects.create(name="سبك")
+        self.other = Workshop.objects.create(name="تلميع")
+        order = ManufacturingOrder.objects.create(order_number="MO-A", carat=self.c21, input_weight=Decimal('10'))
+        self.now = timezone.now()
+        self.today = timezone.localdate()
+        rows = [
+            # (stage, workshop, hours, input, output, powder, loss, days ago)
+            ('casting', self.ws, 2, '10', '9.5', '0.2', '0.3', 0),
+            ('casting', self.ws, 4, '10', '9.8', '0.1', '0.1', 0),
+            ('polishing', self.other, 1, '9.5', '9.4', '0', '0.1', 0),
+            ('casting', self.other, 3, '20', '19', '0.5', '0.5', 70),
+        ]
+        for stage_name, ws, hours, inp, out, powder, loss, days_ago in rows:
+            end = self.now - datetime.timedelta(days=days_ago)
+            ProductionStage.objects.create(
+                order=order, stage_name=stage_name, workshop=ws, input_weight=Decimal(inp),
+                output_weight=Decimal(out), powder_weight=Decimal(powder), loss_weight=Decimal(loss),
+                start_datetime=end - datetime.timedelta(hours=hours), end_datetime=end,
+            )
+        # Still open: not counted
+        ProductionStage.objects.create(order=order, stage_name='casting', workshop=self.ws, input_weight=Decimal('7'))
+
+    def test_summary_per_stage_and_workshop(self):
+        import datetime
+        from .services import StageAnalyticsService
+        with self.assertNumQueries(1):
+            rows = {r['stage_name']: r for r in StageAnalyticsService.summary(self.today, self.today)}
+        self.assertEqual(set(rows), {'casting', 'polishing'})
+        casting = rows['casting']
+        self.assertEqual(casting['count'], 2)
+        self.assertEqual(casting['avg_duration'], datetime.timedelta(hours=3))
+        self.assertEqual(casting['total_duration'], datetime.timedelta(hours=6))
+        self.assertEqual((casting['input'], casting['loss'], casting['powder']), (Decimal('20'), Decimal('0.4'), Decimal('0.3')))
+        self.assertEqual(casting['loss_pct'], Decimal('2.00'))
+
+        by_workshop = StageAnalyticsService.summary(self.today - datetime.timedelta(days=80), self.today, by_workshop=True)
+        casting_ws = {r['workshop__name']: r['count'] for r in by_workshop if r['stage_name'] == 'casting'}
+        self.assertEqual(casting_ws, {"سبك": 2, "تلميع": 1})
+
+    def test_year_loss_trend_is_one_query(self):
+        import datetime
+        from .services import StageAnalyticsService
+        with self.assertNumQueries(1):
+            trend = StageAnalyticsService.loss_trend(self.today - datetime.timedelta(days=365), self.today, stage_name='casting')
+        self.assertEqual([r['count'] for r in trend], [1, 2])
+        self.assertEqual(trend[-1]['loss'], Decimal('0.4'))
+
+    def test_json_endpoint(self):
+        from django.urls import reverse
+        self.client.force_login(User.objects.create_superuser('admin', password='x'))
+        data = self.client.get(reverse('manufacturing:stage_analytics_api')).json()
+        casting = next(r for r in data['stages'] if r['stage_name'] == 'casting')
+        self.assertEqual(casting['avg_duration'], 3 * 3600)
+        self.assertEqual(casting['loss'], 0.4)
+        self.assertEqual(len(data['workshops']), 2)
+        self.assertEqual(sum(r['count'] for r in data['loss_trend']), 4)
+        self.assertEqual(self.client.get(reverse('manufacturing:stage_analytics_api'), {'start': 'x'}).status_code, 400)
+
+
+class FinishedItemBarcodeTests(TestCase):
+    def test_completed_orders_get_sequential_barcodes(self):
+        from .models import ManufacturingOrder
+        c21 = Carat.objects.create(name="21K", purity=Decimal('0.8750'))
+        orders = []
+        for n in range(2):
+            order = ManufacturingOrder.objects.create(
+                order_number=f"MO-B{n}", carat=c21, input_weight=Decimal('5'), output_weight=Decimal('5'),
+            )
+            order.status = 'completed'
+            order.save()
+            orders.append(order)
+        barcodes = [ManufacturingOrder.objects.get(pk=o.pk).resulting_item.barcode for o in orders]
+        self.assertEqual(barcodes, ['MFG-000001', 'MFG-000002'])
@@ -1,4 +1,5 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.core.cache import cache
 from django.db import transaction
 from decimal import Decimal
 from django.db.models import Count, Avg, Sum, F
@@ -11,6 +12,9 @@ import json
 from .models import ManufacturingOrder, Workshop, Stone, InstallationTool, OrderStone, OrderTool, ProductionStage, WorkshopTransfer, WorkshopSettlement
 from inventory.models import RawMaterial, Carat, Branch
 from finance.treasury_models import Treasury, TreasuryTransaction, TreasuryTransfer
+from core.context_processors import MFG_STATS_CACHE_KEY
+from core.services import BalanceService, SequenceService
+from .services import StageLossCalculator, ProductionBatchService, StageAnalyticsService
 
 def manufacturing_analytics(request):
     """
@@ -84,14 +88,55 @@ from django.contrib.admin.views.decorators import staff_member_required
 from django.db.models import Sum, Avg, Count, F
 from .models import Workshop, ManufacturingOrder, WorkshopSettlement, Stone
 
+@staff_member_required
+def stage_analytics_api(request):
+    """
+    JSON for the analytics pages: per stage (and per stage/workshop) totals for stages finished
+    between ?start= and ?end= (YYYY-MM-DD, default: this month), plus the monthly khasia trend
+    of the 12 months ending at ?end= (optional ?stage_name=, ?workshop_id=).
+    """
+    today = timezone.localdate()
+    try:
+        start = datetime.date.fromisoformat(request.GET['start']) if request.GET.get('start') else today.replace(day=1)
+        end = datetime.date.fromisoformat(request.GET['end']) if request.GET.get('end') else today
+    except ValueError:
+        return JsonResponse({'error': 'start/end must be YYYY-MM-DD'}, status=400)
+
+    def serialize(row):
+        out = {}
+        for key, value in row.items():
+            if isinstance(value, Decimal):
+                value = float(value)
+            elif isinstance(value, datetime.timedelta):
+                value = value.total_seconds()
+            elif isinstance(value, datetime.datetime):
+                value = timezone.localtime(value).date().isoformat()
+            out[key] = value
+        return out
+
+    first_month = end.year * 12 + end.month - 12  # 11 months before end's month
+    trend_start = datetime.date(first_month // 12, first_month % 12 + 1, 1)
+    trend = StageAnalyticsService.loss_trend(
+        trend_start, end, stage_name=request.GET.get('stage_name') or None,
+        workshop=request.GET.get('workshop_id') or None,
+    )
+    return JsonResponse({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'stages': [serialize(r) for r in StageAnalyticsService.summary(start, end)],
+        'workshops': [serialize(r) for r in StageAnalyticsService.summary(start, end, by_workshop=True)],
+        'loss_trend': [serialize(r) for r in trend],
+    })
+
 @staff_member_required
 def manufacturing_dashboard(request):
     # 1. Workshop Summaries (Inventory Gold Balances)
     workshops = Workshop.objects.all()
     # Explicitly cast to float for template compatibility
-    total_workshop_gold_18 = float(workshops.aggregate(Sum('gold_balance_18'))['gold_balance_18__sum'] or 0)
-    total_workshop_gold_21 = float(workshops.aggregate(Sum('gold_balance_21'))['gold_balance_21__sum'] or 0)
-    total_workshop_gold_24 = float(workshops.aggregate(Sum('gold_balance_24'))['gold_balance_24__sum'] or 0)
+    workshop_gold = BalanceService.totals_by_karat('gold', 'workshop')
+    total_workshop_gold_18 = float(workshop_gold['18'])
+    total_workshop_gold_21 = float(workshop_gold['21'])
+    total_workshop_gold_24 = float(workshop_gold['24'])
     total_workshop_gold_combined = total_workshop_gold_18 + total_workshop_gold_21 + total_workshop_gold_24
     total_workshop_labor = float(workshops.aggregate(Sum('labor_balance'))['labor_balance__sum'] or 0)
 
@@ -369,14 +414,10 @@ def magic_workflow(request):
                         carat = Carat.objects.filter(name__icontains=carat_name).first() or Carat.objects.first()
                         workshop_name = 'casting' # Default or parse if needed
                         
-                        created_ids = []
-                        for _ in range(count):
-                            o = ManufacturingOrder.objects.create(
-                                order_number=f"AUTO-{timezone.now().strftime('%M%S%f')[:8]}",
-                                carat=carat, input_weight=avg_weight, status='draft',
-                                item_name_pattern=f"دفعة آلية {carat.name}"
-                            )
-                            created_ids.append(o.id)
+                        orders = ProductionBatchService.create_batch(
+                            count, carat, avg_weight, item_name_pattern=f"دفعة آلية {carat.name}"
+                        )
+                        created_ids = [o.id for o in orders]
                         return JsonResponse({'status': 'success', 'message': f'تم إنشاء {count} أوامر بنجاح (IDs: {created_ids})'})
 
                     # 2. Assign & Issue (تشغيل وصرف)
@@ -390,23 +431,9 @@ def magic_workflow(request):
                         
                         if not workshop: return JsonResponse({'status': 'error', 'message': f'الورشة غير موجودة: {ws_name}'})
                         
-                        processed_count = 0
-                        for oid in ids:
-                            order = ManufacturingOrder.objects.filter(id=oid, status='draft').first()
-                            if order:
-                                order.workshop = workshop
-                                order.status = 'in_progress'
-                                order.save()
-                                
-                                # Create Stage
-                                ProductionStage.objects.create(
-                                    order=order, workshop=workshop, 
-                                    stage_name=workshop.default_stage_name or 'casting',
-                                    input_weight=order.input_weight, start_datetime=timezone.now()
-                                )
-                                # Note: Treasury logic here would be complex to replicate fully without refactoring.
-                                # Assuming automated script handles bulk transfers separately or simplified here.
-                                processed_count += 1
+                        # Orders, first stages and workshop/raw-material issuance are written once per batch
+                        # Note: Treasury logic here would be complex to replicate fully without refactoring.
+                        processed_count = len(ProductionBatchService.issue_batch(ids, workshop))
                         
                         return JsonResponse({'status': 'success', 'message': f'تم تشغيل {processed_count} أوامر لورشة {workshop.name}'})
 
@@ -540,7 +567,6 @@ def magic_workflow(request):
                     # 5. Add Stones if provided (Now linked to stage)
                     stones_json = request.POST.get('stones_json')
                     if stones_json:
-                        import json
                         stones = json.loads(stones_json)
                         for s in stones:
                             OrderStone.objects.create(
@@ -552,18 +578,9 @@ def magic_workflow(request):
                             )
 
                     # 6. CREDIT WORKSHOP BALANCE (Increase what they hold)
-                    # Determine correct balance field
-                    gold_field = None
-                    if '18' in order.carat.name: gold_field = 'gold_balance_18'
-                    elif '21' in order.carat.name: gold_field = 'gold_balance_21'
-                    elif '24' in order.carat.name: gold_field = 'gold_balance_24'
-
-                    if gold_field:
-                        current_balance = getattr(workshop, gold_field)
-                        # Total gold given = Input Weight (Order Start) + Extra Gold Issued
-                        total_gold_in = (input_weight or 0) + (extra_gold_weight or 0)
-                        setattr(workshop, gold_field, current_balance + total_gold_in)
-                        workshop.save()
+                    # Total gold given = Input Weight (Order Start) + Extra Gold Issued
+                    total_gold_in = (input_weight or 0) + (extra_gold_weight or 0)
+                    BalanceService.apply_holding(workshop, order.carat, {'gold': total_gold_in})
                     
                     return JsonResponse({'status': 'success'})
 
@@ -617,6 +634,42 @@ def magic_workflow(request):
                         print(f"DEBUG: ERROR in move_order: {e}")
                         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
+                elif action == 'move_orders_bulk':
+                    # Move many orders to one workshop: stages are closed by StageLossCalculator in bulk
+                    next_workshop = get_object_or_404(Workshop, id=request.POST.get('next_workshop_id'))
+                    moves = {int(m['order_id']): m for m in json.loads(request.POST.get('orders_json') or '[]')}
+                    if not moves:
+                        return JsonResponse({'status': 'error', 'message': 'لم يتم تحديد أوامر'}, status=400)
+
+                    open_stages = {}
+                    for stage_id, oid in ProductionStage.objects.filter(
+                        order_id__in=moves, end_datetime__isnull=True
+                    ).order_by('id').values_list('id', 'order_id'):
+                        open_stages[oid] = stage_id  # keep the latest open stage per order
+
+                    with transaction.atomic():
+                        closed = StageLossCalculator.close_stages(
+                            {stage_id: moves[oid] for oid, stage_id in open_stages.items()},
+                            next_workshop=next_workshop, user=request.user,
+                        )
+                        # Only orders whose open stage was closed here (and whose gold was transferred) move
+                        orders = ManufacturingOrder.objects.filter(id__in={s.order_id for s in closed})
+                        order_ids = list(orders.values_list('id', flat=True))
+
+                        now = timezone.now()
+                        ProductionStage.objects.bulk_create([
+                            ProductionStage(
+                                order_id=oid, workshop=next_workshop,
+                                stage_name=next_workshop.default_stage_name or 'crafting',
+                                input_weight=Decimal(str(moves[oid].get('output_weight') or 0)), start_datetime=now,
+                            )
+                            for oid in order_ids
+                        ])
+                        orders.update(workshop=next_workshop)
+                    # .update() skips the post_save receiver that clears the dashboard stats
+                    cache.delete(MFG_STATS_CACHE_KEY)
+                    return JsonResponse({'status': 'success', 'moved': len(order_ids)})
+
                 elif action == 'complete_order':
                     output_weight = Decimal(str(request.POST.get('output_weight') or 0))
                     powder_weight = Decimal(str(request.POST.get('powder_weight') or 0))
@@ -646,15 +699,8 @@ def magic_workflow(request):
                         for os in order.orderstone_set.all():
                             stone_weight_total += os.weight_in_gold # This property returns weight in GRAMS (normalized)
                             
-                        # 2. Generate Barcode
-                        # Format: MFG-[OrderID]-[Random/Time]
-                        import random
-                        timestamp_code = timezone.now().strftime('%y%m%d')
-                        barcode = f"PROD-{timestamp_code}-{order.id}"
-                        
-                        # Ensure uniqueness (simple check)
-                        if Item.objects.filter(barcode=barcode).exists():
-                             barcode = f"PROD-{timestamp_code}-{order.id}-{random.randint(100,999)}"
+                        # 2. Generate Barcode (MFG-000042, unique from the sequence)
+                        barcode = SequenceService.next_code('MFG')
 
                         # 3. Determine Branch (Main Branch or Target)
                         target_branch = order.target_branch
@@ -706,6 +752,7 @@ def magic_workflow(request):
                             overhead_salaries=order.overhead_salaries,
                             overhead_other=order.overhead_other,
                         )
+                        new_item._movement = ('manufactured', order.order_number)
                         new_item.save()
                         
                         # Link back
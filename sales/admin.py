@@ -3,6 +3,7 @@ from django.utils.html import format_html
 from django.db.models import Sum
 from .models import Invoice, InvoiceItem, OldGoldReturn, SalesRepresentative, SalesRepTransaction
 from core.admin_mixins import ExportImportMixin
+from inventory.services import ItemMovementService
 from import_export import resources
 
 class InvoiceItemInline(admin.TabularInline):
@@ -178,10 +179,13 @@ class InvoiceAdmin(ExportImportMixin, admin.ModelAdmin):
         count = 0
         for invoice in queryset.filter(status='pending'):
             # Return items to inventory
+            items = []
             for inv_item in invoice.items.all():
                 item = inv_item.item
                 item.status = 'available'
                 item.save()
+                items.append(item)
+            ItemMovementService.record(items, 'return', reference=invoice.invoice_number, user=request.user)
             
             invoice.status = 'rejected'
             invoice.save()
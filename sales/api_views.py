@@ -3,6 +3,8 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from .models import Invoice, SalesRepresentative
 from inventory.models import Item
+from inventory.services import ItemLookup, ItemMovementService
+from core.services import GoldPriceService
 from .serializers import ItemSerializer, InvoiceSerializer, SalesRepSerializer
 from decimal import Decimal
 
@@ -12,7 +14,7 @@ class ItemCatalogView(generics.ListAPIView):
     Returns a list of AVAILABLE items for sale.
     Support filtering by barcode or carat.
     """
-    queryset = Item.objects.filter(status='available')
+    queryset = Item.objects.filter(status='available').select_related('carat')
     serializer_class = ItemSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [filters.SearchFilter]
@@ -95,21 +97,20 @@ class CustomerOrderView(APIView):
 
         # 3. Calculate Price Snapshot (Server Side Security)
         # We don't trust client price. calculate now.
-        from core.models import GoldPrice
-        latest_price = GoldPrice.objects.filter(carat=item.carat).order_by('-updated_at').first()
-        if not latest_price:
+        from core.services import GoldPriceService
+        price_per_gram = GoldPriceService.price_for(item.carat_id, request)
+        if price_per_gram is None:
              return Response({"error": "Gold price not set for this carat"}, status=400)
 
-        price_per_gram = latest_price.price_per_gram
         gold_val = item.net_gold_weight * price_per_gram
         labor_val = (item.gross_weight * item.labor_fee_per_gram) + item.fixed_labor_fee + item.retail_margin
         subtotal = gold_val + labor_val
 
         # 4. Create Invoice (Pending)
-        import random
-        # Create Invoice
+        # 7 digits - never overlaps the older 6-digit random numbers
+        from core.services import SequenceService
         invoice = Invoice.objects.create(
-            invoice_number=f"ORD-APP-{random.randint(100000, 999999)}",
+            invoice_number=SequenceService.next_code('ORD-APP', width=7),
             customer=customer,
             branch=item.current_branch, # Link to item's branch
             status='pending', # PENDING APPROVAL
@@ -177,12 +178,11 @@ class QuickSellView(APIView):
                     pass # Treat as Cash if invalid ID? Or error? Let's treat as Cash/None.
             
             # 3. Calculate Price
-            from core.models import GoldPrice
-            latest_price = GoldPrice.objects.filter(carat=item.carat).order_by('-updated_at').first()
-            if not latest_price:
+            from core.services import GoldPriceService
+            price_per_gram = GoldPriceService.price_for(item.carat_id, request)
+            if price_per_gram is None:
                  return Response({"error": f"Gold price not set for {item.carat.name}"}, status=400)
 
-            price_per_gram = latest_price.price_per_gram
             gold_val = item.net_gold_weight * price_per_gram
             
             # Labor: If estimated price > gold val, diff is labor. Else custom logic (100 minimal).
@@ -208,9 +208,9 @@ class QuickSellView(APIView):
                 return Response({"error": "Cannot create invoice: Item has no branch and user has no assigned branch."}, status=400)
             
             # 4. Create Invoice
-            import random
-            # Invoice Number: "INV-YYYY-XXXX"
-            inv_num = f"INV-{random.randint(100000, 999999)}"
+            # Invoice Number: "INV-0000123" (7 digits - never overlaps the older 6-digit random numbers)
+            from core.services import SequenceService
+            inv_num = SequenceService.next_code('INV', width=7)
             
             invoice = Invoice.objects.create(
                 invoice_number=inv_num,
@@ -241,6 +241,7 @@ class QuickSellView(APIView):
             # Mark Item Sold
             item.status = 'sold'
             item.save()
+            ItemMovementService.record([item], 'sale', reference=inv_num, user=request.user)
             
             return Response({"message": "Sale recorded", "invoice_number": inv_num}, status=201)
 
@@ -316,33 +317,55 @@ class ItemStonesDetailView(APIView):
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
+def _scanned_item_payload(item, prices):
+    price = prices.get(item.carat_id)
+    return {
+        'id': item.id,
+        'name': item.name,
+        'barcode': item.barcode,
+        'rfid_tag': item.rfid_tag,
+        'carat': item.carat.name,
+        'net_gold_weight': float(item.net_gold_weight),
+        'status': item.status,
+        'status_display': item.get_status_display(),
+        'image_url': item.image.url if item.image else None,
+        'estimated_price': float(item.net_gold_weight * price) if price is not None else 0,
+    }
+
+
 class ItemDetailByBarcodeView(APIView):
-    """API to fetch item details by barcode (Scanner)"""
+    """API to fetch item details by barcode or RFID tag (Scanner)"""
     permission_classes = [IsAuthenticated]
 
     def get(self, request, barcode):
-        try:
-            item = Item.objects.select_related('carat').get(barcode=barcode)
-            
-            # Simple estimation logic
-            estimated_price = 0
-            if item.carat.prices.exists():
-                estimated_price = float(item.net_gold_weight * item.carat.prices.latest('updated_at').price_per_gram)
-
-            data = {
-                'id': item.id,
-                'name': item.name,
-                'barcode': item.barcode,
-                'carat': item.carat.name,
-                'net_gold_weight': float(item.net_gold_weight),
-                'status': item.status,
-                'status_display': item.get_status_display(),
-                'image_url': item.image.url if item.image else None,
-                'estimated_price': estimated_price
-            }
-            return Response(data, status=status.HTTP_200_OK)
-        except Item.DoesNotExist:
+        item = ItemLookup.resolve(barcode)
+        if item is None:
             return Response({'error': 'Item not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_scanned_item_payload(item, GoldPriceService.price_map(request)), status=status.HTTP_200_OK)
+
+
+class ItemBatchLookupView(APIView):
+    """
+    Resolve many scanned barcodes / RFID tags at once.
+    POST {"codes": ["VT001", "E200..."]} -> {"results": {code: item or null}, "not_found": [...]}
+    """
+    permission_classes = [IsAuthenticated]
+    MAX_CODES = 500
+
+    def post(self, request):
+        codes = request.data.get('codes')
+        if not isinstance(codes, list) or not codes:
+            return Response({'error': 'codes must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(codes) > self.MAX_CODES:
+            return Response({'error': f'At most {self.MAX_CODES} codes per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+        codes = [str(code) for code in codes]
+        prices = GoldPriceService.price_map(request)
+        items = ItemLookup.resolve_many(codes)
+        return Response({
+            'results': {code: _scanned_item_payload(item, prices) if item else None for code, item in items.items()},
+            'not_found': [code for code, item in items.items() if item is None],
+        }, status=status.HTTP_200_OK)
 
 class CreateReservationView(APIView):
     """API to reserve an item"""
@@ -0,0 +1,39 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Sum, OuterRef, Subquery, DecimalField, ExpressionWrapper
+from django.db.models.functions import Coalesce
+from finance.services import MonthlyAnalyticsService
+from inventory.models import Item
+from sales.models import Invoice, InvoiceItem
+
+class Command(BaseCommand):
+    help = 'Populate InvoiceItem.line_cost/line_profit and Invoice.total_cost/total_profit for existing rows'
+
+    def handle(self, *args, **kwargs):
+        money = DecimalField(max_digits=12, decimal_places=2)
+        self.stdout.write("Backfilling invoice cost & profit...")
+
+        with transaction.atomic():
+            # 1. Line cost = item net gold weight x sold gold price + factory cost + stone fee
+            item_weight = Subquery(Item.objects.filter(pk=OuterRef('item_id')).values('net_gold_weight')[:1])
+            lines = InvoiceItem.objects.update(line_cost=ExpressionWrapper(
+                item_weight * F('sold_gold_price') + F('sold_factory_cost') + F('sold_stone_fee'),
+                output_field=money
+            ))
+            # 2. Line profit = subtotal - line cost
+            InvoiceItem.objects.update(line_profit=F('subtotal') - F('line_cost'))
+
+            # 3. Invoice totals
+            def line_sum(field):
+                return Coalesce(Subquery(
+                    InvoiceItem.objects.filter(invoice=OuterRef('pk')).values('invoice')
+                    .annotate(s=Sum(field)).values('s'),
+                    output_field=money
+                ), Decimal('0'))
+            invoices = Invoice.objects.update(total_cost=line_sum('line_cost'), total_profit=line_sum('line_profit'))
+
+        # Cached product performance of closed months read line_profit
+        MonthlyAnalyticsService.touch(Invoice.objects.dates('created_at', 'year'))
+
+        self.stdout.write(self.style.SUCCESS(f"Updated {lines} invoice lines and {invoices} invoices."))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0012_invoice_total_gold_weight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='total_cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='إجمالي التكلفة'),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='total_profit',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='صافي الربح'),
+        ),
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='line_cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='تكلفة السطر'),
+        ),
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='line_profit',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='ربح السطر'),
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.utils.translation import gettext_lazy as _
 from inventory.models import Item, Branch, Carat
 from crm.models import Customer
 from django.conf import settings
+from decimal import Decimal
 
 class Reservation(models.Model):
     item = models.OneToOneField(Item, on_delete=models.CASCADE, related_name='reservation', verbose_name="القطعة")
@@ -32,6 +33,10 @@ class Invoice(models.Model):
     total_tax = models.DecimalField("ضريبة القيمة المضافة", max_digits=12, decimal_places=2, default=0)
     grand_total = models.DecimalField("الإجمالي النهائي", max_digits=12, decimal_places=2, default=0)
     
+    # Persisted cost/profit (sum of line_cost / line_profit, refreshed by calculate_totals)
+    total_cost = models.DecimalField("إجمالي التكلفة", max_digits=12, decimal_places=2, default=0)
+    total_profit = models.DecimalField("صافي الربح", max_digits=12, decimal_places=2, default=0)
+    
     # Gold Exchange
     is_exchange = models.BooleanField(_("Is Exchange?"), default=False)
     exchange_gold_weight = models.DecimalField(_("Exchange Gold Weight"), max_digits=10, decimal_places=3, default=0)
@@ -72,11 +77,6 @@ class Invoice(models.Model):
              self.calculate_totals(save=False)
         super().save(*args, **kwargs)
 
-    @property
-    def total_profit(self):
-        """إجمالي ربح الفاتورة"""
-        return sum(item.profit for item in self.items.all())
-    
     @property
     def total_combined_labor(self):
         """إجمالي الأجور (مصنعية + أحجار)"""
@@ -94,17 +94,23 @@ class Invoice(models.Model):
         total_labor = Decimal('0')
         total_stones = Decimal('0')
         total_weight = Decimal('0')
+        total_cost = Decimal('0')
+        total_profit = Decimal('0')
         
         for item in items:
             total_gold += (item.sold_weight * item.sold_gold_price)
             total_labor += item.sold_labor_fee
             total_stones += item.sold_stone_fee
             total_weight += item.sold_weight
+            total_cost += item.line_cost
+            total_profit += item.line_profit
             
         self.total_gold_value = total_gold
         self.total_labor_value = total_labor
         self.total_stones_value = total_stones
         self.total_gold_weight = total_weight
+        self.total_cost = total_cost
+        self.total_profit = total_profit
         
         # Aggregate Exchange (Old Gold Return)
         if self.is_exchange:
@@ -128,7 +134,8 @@ class Invoice(models.Model):
         if save:
             self.save(update_fields=[
                 'total_gold_value', 'total_labor_value', 'total_stones_value', 'total_gold_weight',
-                'total_tax', 'grand_total', 'exchange_gold_weight', 'exchange_value_deducted'
+                'total_tax', 'grand_total', 'exchange_gold_weight', 'exchange_value_deducted',
+                'total_cost', 'total_profit'
             ])
         
         return self.grand_total
@@ -152,19 +159,27 @@ class InvoiceItem(models.Model):
     sold_factory_cost = models.DecimalField("تكلفة المصنع (أجور + مصاريف)", max_digits=10, decimal_places=2, default=0, help_text="إجمالي التكلفة الصناعية المخزنة في القطعة وقت البيع")
     
     subtotal = models.DecimalField("إجمالي السطر", max_digits=12, decimal_places=2)
+    
+    # Persisted at save time from the sale snapshot (reports aggregate these in SQL)
+    line_cost = models.DecimalField("تكلفة السطر", max_digits=12, decimal_places=2, default=0)
+    line_profit = models.DecimalField("ربح السطر", max_digits=12, decimal_places=2, default=0)
 
-    @property
-    def total_cost(self):
+    def compute_line_cost(self):
         """إجمالي تكلفة السطر = (ذهب × سعر الشراء/البيع المرجعي) + تكلفة المصنع"""
         # Note: In gold retail, cost is often (Net Gold Weight * current price) + manufacturing
         # Here we use the price recorded at sale for the gold component
         gold_cost = (self.item.net_gold_weight * self.sold_gold_price)
-        return gold_cost + self.sold_factory_cost + self.sold_stone_fee
+        return (gold_cost + self.sold_factory_cost + self.sold_stone_fee).quantize(Decimal('0.01'))
+
+    @property
+    def total_cost(self):
+        """إجمالي تكلفة السطر (مخزنة)"""
+        return self.line_cost
 
     @property
     def profit(self):
-        """الربح = الإجمالي - التكلفة"""
-        return self.subtotal - self.total_cost
+        """الربح = الإجمالي - التكلفة (مخزن)"""
+        return self.line_profit
     
     def save(self, *args, **kwargs):
         # Capture the manufacturing cost snapshot (Labor + Overheads) at the moment of sale
@@ -179,6 +194,11 @@ class InvoiceItem(models.Model):
         # Ensure subtotal is calculated before save
         self.subtotal = (self.sold_weight * self.sold_gold_price) + self.sold_labor_fee + self.sold_stone_fee
         
+        # Persist cost/profit snapshot
+        if self.item:
+            self.line_cost = self.compute_line_cost()
+            self.line_profit = (self.subtotal - self.line_cost).quantize(Decimal('0.01'))
+        
         super().save(*args, **kwargs)
         
         # Trigger invoice recalculation
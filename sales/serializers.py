@@ -39,11 +39,10 @@ class ItemSerializer(serializers.ModelSerializer):
         return None
 
     def get_estimated_price(self, obj):
-        # Fetch latest price for this carat
-        from core.models import GoldPrice
-        latest_price = GoldPrice.objects.filter(carat=obj.carat).order_by('-updated_at').first()
-        if latest_price:
-            price_per_gram = latest_price.price_per_gram
+        # Latest price for this carat (cached map, memoized per request)
+        from core.services import GoldPriceService
+        price_per_gram = GoldPriceService.price_for(obj.carat_id, self.context.get('request'))
+        if price_per_gram is not None:
             # Value = (Gold Weight * Price) + (Total Labor)
             gold_val = obj.net_gold_weight * price_per_gram
             labor_val = (obj.gross_weight * obj.labor_fee_per_gram) + obj.fixed_labor_fee + obj.retail_margin
@@ -82,9 +81,10 @@ class InvoiceSerializer(serializers.ModelSerializer):
         returned_gold_data = validated_data.pop('returned_gold', [])
         
         # Auto-generate Invoice Number & ZATCA UUID
-        import random
+        # (6 digits - never overlaps the older 5-digit random numbers)
         import uuid
-        validated_data['invoice_number'] = f"INV-MOB-{random.randint(10000, 99999)}"
+        from core.services import SequenceService
+        validated_data['invoice_number'] = SequenceService.next_code('INV-MOB', width=6)
         validated_data['zatca_uuid'] = uuid.uuid4()
         
         # Auto-confirm mobile sales
@@ -0,0 +1,44 @@
+import datetime
+from decimal import Decimal
+from django.db.models import Sum, Count
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .models import Invoice
+
+
+def daily_sales_trend(days=7, end_date=None, branch=None):
+    """
+    مبيعات وأرباح الفواتير المؤكدة يوماً بيوم لآخر `days` يوم حتى end_date (اليوم افتراضياً).
+
+    One query: invoices grouped by TruncDate(created_at), summing the stored
+    grand_total / total_profit columns. Days without sales are returned as
+    zeros. Returns [{'date', 'sales', 'profit', 'count'}].
+    """
+    end_date = end_date or timezone.localdate()
+    start_date = end_date - datetime.timedelta(days=days - 1)
+
+    invoices = Invoice.objects.filter(
+        status='confirmed', created_at__date__gte=start_date, created_at__date__lte=end_date
+    )
+    if branch is not None:
+        invoices = invoices.filter(branch=branch)
+
+    zero = Decimal('0')
+    rows = invoices.annotate(day=TruncDate('created_at')).values('day').annotate(
+        sales=Coalesce(Sum('grand_total'), zero),
+        profit=Coalesce(Sum('total_profit'), zero),
+        count=Count('id'),
+    ).order_by('day')
+    by_day = {row['day']: row for row in rows}
+
+    trend = []
+    for i in range(days):
+        d = start_date + datetime.timedelta(days=i)
+        row = by_day.get(d, {})
+        trend.append({
+            'date': d,
+            'sales': row.get('sales', zero),
+            'profit': row.get('profit', zero),
+            'count': row.get('count', 0),
+        })
+    return trend
@@ -1,7 +1,10 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from .models import Invoice, SalesRepresentative, SalesRepTransaction, OldGoldReturn
-from finance.models import JournalEntry, LedgerEntry, FinanceSettings, Account
+from .models import Invoice, Reservation, SalesRepresentative, SalesRepTransaction, OldGoldReturn
+from inventory.models import Item, ItemMovement
+from inventory.services import ItemMovementService
+from finance.models import JournalEntry
+from finance.services import JournalPoster, FinanceLookup
 from crm.models import CustomerTransaction
 from django.db import transaction
 from decimal import Decimal
@@ -28,7 +31,7 @@ def create_invoice_journal_entry(sender, instance, created, **kwargs):
         return
 
     # Get Default Accounts from Settings
-    settings = FinanceSettings.objects.first()
+    settings = FinanceLookup.settings()
     if not settings:
         return
 
@@ -44,97 +47,60 @@ def create_invoice_journal_entry(sender, instance, created, **kwargs):
     if not cash_account or not settings.sales_revenue_account or not settings.vat_account:
         return
 
-    with transaction.atomic():
-        # 1. Create Journal Header
-        journal = JournalEntry.objects.create(
-            reference=instance.invoice_number,
-            description=f"قيد مبيعات تلقائي - فاتورة {instance.invoice_number}",
-            date=instance.created_at.date()
-        )
-        
-        # Calculate Splits
-        exchange_value = instance.exchange_value_deducted if instance.is_exchange else Decimal('0')
-        net_cash = instance.grand_total - exchange_value
-
-        # 2. Debit: Cash/Bank (Net Amount to Collect)
-        if net_cash > 0:
-            LedgerEntry.objects.create(
-                journal_entry=journal,
-                account=cash_account,
-                debit=net_cash,
-                credit=0,
-                gold_debit=0,
-                gold_credit=0
-            )
-
-        # 3. Debit: Old Gold Inventory (Exchange Value)
-        if exchange_value > 0:
-            # Try to get a specific account for Old Gold, or fallback to Inventory
-            old_gold_account = getattr(settings, 'old_gold_account', settings.inventory_gold_account) 
-            # If no inventory account in settings, we can't record this leg correctly, 
-            # but we will default to cash_account to balance the books temporarily (or raise error in strict mode)
-            target_acc = old_gold_account if old_gold_account else cash_account
-            
-            LedgerEntry.objects.create(
-                journal_entry=journal,
-                account=target_acc,
-                debit=exchange_value,
-                credit=0,
-                gold_debit=instance.exchange_gold_weight, # Track gold weight too
-                gold_credit=0
-            )
-
-        # 4. Credit: VAT
-        if instance.total_tax > 0:
-            LedgerEntry.objects.create(
-                journal_entry=journal,
-                account=settings.vat_account,
-                debit=0,
-                credit=instance.total_tax,
-                gold_debit=0,
-                gold_credit=0
-            )
-
-        # 5. Credit: Sales Revenue (Remaining Amount excluding Tax)
-        # Revenue is typically Net of Tax. 
-        # Grand Total = Revenue + Tax.
-        # So Revenue = Grand Total - Tax.
-        revenue_amount = instance.grand_total - instance.total_tax
-        
-        LedgerEntry.objects.create(
-            journal_entry=journal,
-            account=settings.sales_revenue_account,
-            debit=0,
-            credit=revenue_amount,
-            gold_debit=0,
-            gold_credit=0
-        )
-
-        # 6. Debit: COGS & Credit: Inventory
-        if settings.cost_of_gold_account and settings.inventory_gold_account:
-            total_cogs = sum(item.total_cost for item in instance.items.all())
-            total_weight = sum(item.sold_weight for item in instance.items.all())
-
-            if total_cogs > 0:
-                # Debit: COGS
-                LedgerEntry.objects.create(
-                    journal_entry=journal,
-                    account=settings.cost_of_gold_account,
-                    debit=total_cogs,
-                    credit=0,
-                    gold_debit=0,
-                    gold_credit=0
-                )
-                
-                # Credit: Inventory
-                LedgerEntry.objects.create(
-                    journal_entry=journal,
-                    account=settings.inventory_gold_account,
-                    debit=0,
-                    credit=total_cogs,
-                    gold_debit=0,
-                    gold_credit=total_weight
-                )
+    # Calculate Splits
+    exchange_value = instance.exchange_value_deducted if instance.is_exchange else Decimal('0')
+    net_cash = instance.grand_total - exchange_value
+    lines = []
+
+    # 1. Debit: Cash/Bank (Net Amount to Collect)
+    if net_cash > 0:
+        lines.append({'account': cash_account, 'debit': net_cash})
+    elif net_cash < 0:
+        # Old gold worth more than the invoice: the difference is paid back to the customer
+        lines.append({'account': cash_account, 'credit': -net_cash})
+
+    # 2. Debit: Old Gold Inventory (Exchange Value)
+    if exchange_value > 0:
+        # Try to get a specific account for Old Gold, or fallback to Inventory
+        old_gold_account = getattr(settings, 'old_gold_account', settings.inventory_gold_account) 
+        # If no inventory account in settings, we can't record this leg correctly, 
+        # but we will default to cash_account to balance the books temporarily (or raise error in strict mode)
+        target_acc = old_gold_account if old_gold_account else cash_account
+        lines.append({
+            'account': target_acc,
+            'debit': exchange_value,
+            'gold_debit': instance.exchange_gold_weight, # Track gold weight too
+        })
+
+    # 3. Credit: VAT
+    if instance.total_tax > 0:
+        lines.append({'account': settings.vat_account, 'credit': instance.total_tax})
+
+    # 4. Credit: Sales Revenue (Remaining Amount excluding Tax)
+    # Revenue is typically Net of Tax. 
+    # Grand Total = Revenue + Tax.
+    # So Revenue = Grand Total - Tax.
+    revenue_amount = instance.grand_total - instance.total_tax
+    lines.append({'account': settings.sales_revenue_account, 'credit': revenue_amount})
+
+    # 5. Debit: COGS & Credit: Inventory
+    if settings.cost_of_gold_account and settings.inventory_gold_account:
+        items = list(instance.items.all())
+        total_cogs = sum(item.total_cost for item in items)
+        total_weight = sum(item.sold_weight for item in items)
+
+        if total_cogs > 0:
+            lines.append({'account': settings.cost_of_gold_account, 'debit': total_cogs})
+            lines.append({'account': settings.inventory_gold_account, 'credit': total_cogs, 'gold_credit': total_weight})
+
+    # Sold and returned gold weights differ, so only the cash side has to balance
+    JournalPoster.post(
+        reference=instance.invoice_number,
+        description=f"قيد مبيعات تلقائي - فاتورة {instance.invoice_number}",
+        date=instance.created_at.date(),
+        lines=lines,
+        check_gold=False,
+    )
 
 
 @receiver(post_save, sender=Invoice)
@@ -180,33 +146,18 @@ def calculate_sales_rep_commission(sender, instance, created, **kwargs):
         # 3. FINANCIAL IMPACT: Record Accrued Commission in General Ledger
         # Debit: Commission Expense (5303)
         # Credit: Accrued Liabilities / Commissions Payable (2102)
-        try:
-            expense_acc = Account.objects.get(code='5303')
-            payable_acc = Account.objects.get(code='2102')
-            
-            journal = JournalEntry.objects.create(
+        expense_acc = FinanceLookup.account('5303')
+        payable_acc = FinanceLookup.account('2102')
+        if expense_acc and payable_acc:  # Should log missing accounts in production
+            JournalPoster.post(
                 reference=f"COMM-{instance.invoice_number}",
                 description=f"استحقاق عمولة مندوب - {sales_rep.name} - فاتورة {instance.invoice_number}",
-                date=instance.created_at.date()
-            )
-            
-            # Debit: Expense
-            LedgerEntry.objects.create(
-                journal_entry=journal,
-                account=expense_acc,
-                debit=commission_amount,
-                credit=0
+                date=instance.created_at.date(),
+                lines=[
+                    {'account': expense_acc, 'debit': commission_amount},   # Debit: Expense
+                    {'account': payable_acc, 'credit': commission_amount},  # Credit: Payable
+                ],
             )
-            
-            # Credit: Payable
-            LedgerEntry.objects.create(
-                journal_entry=journal,
-                account=payable_acc,
-                debit=0,
-                credit=commission_amount
-            )
-        except Account.DoesNotExist:
-            pass # Should log this in production
 
 
 @receiver(post_save, sender=Invoice)
@@ -263,3 +214,22 @@ def record_customer_ledger_on_confirmation(sender, instance, created, **kwargs):
                     description=f"سداد نقدي/بطاقة - فاتورة {instance.invoice_number}"
                 )
 
+
+@receiver(post_save, sender=Invoice)
+def log_sold_items_on_confirmation(sender, instance, created, **kwargs):
+    """
+    Sale movement for every piece of a confirmed invoice (once per invoice).
+    """
+    if instance.status != 'confirmed':
+        return
+    if ItemMovement.objects.filter(reference=instance.invoice_number, movement_type='sale').exists():
+        return
+    items = Item.objects.filter(invoiceitem__invoice=instance)
+    ItemMovementService.record(items, 'sale', reference=instance.invoice_number,
+                               user=instance.confirmed_by or instance.created_by)
+
+
+@receiver(post_save, sender=Reservation)
+def log_item_reservation(sender, instance, created, **kwargs):
+    if created:
+        ItemMovementService.record([instance.item], 'reserved', reference=f"RES-{instance.pk}", user=instance.sales_rep)
@@ -1,3 +1,96 @@
 from django.test import TestCase
+from django.contrib.auth.models import User
+from decimal import Decimal
+import datetime
+from django.utils import timezone
+from core.models import Carat, Branch
+from inventory.models import Item
+from sales.models import Invoice, InvoiceItem
+from sales.services import daily_sales_trend
 
-# Create your tests here.
+
+class InvoiceFixtureMixin:
+    def setUp(self):
+        self.user = User.objects.create_user(username='seller', password='password')
+        self.branch = Branch.objects.create(name="Main")
+        self.carat = Carat.objects.create(name="21K", purity=Decimal('0.8750'))
+
+    def _sell(self, number, weight, price, labor, factory_cost, status='confirmed'):
+        item = Item.objects.create(
+            barcode=f"B-{number}", name="Ring", carat=self.carat,
+            gross_weight=weight, net_gold_weight=weight, fixed_labor_fee=factory_cost
+        )
+        invoice = Invoice.objects.create(invoice_number=number, branch=self.branch, created_by=self.user, status='draft')
+        InvoiceItem.objects.create(
+            invoice=invoice, item=item, sold_weight=weight, sold_gold_price=price,
+            sold_labor_fee=labor, subtotal=0
+        )
+        Invoice.objects.filter(pk=invoice.pk).update(status=status)
+        return Invoice.objects.get(pk=invoice.pk)
+
+
+class SalesTrendTests(InvoiceFixtureMixin, TestCase):
+
+    def test_trend_matches_python_profit(self):
+        inv1 = self._sell("S-1", Decimal('10'), Decimal('3000'), Decimal('500'), Decimal('200'))
+        inv2 = self._sell("S-2", Decimal('5'), Decimal('3000'), Decimal('300'), Decimal('50'))
+        self._sell("S-3", Decimal('5'), Decimal('3000'), Decimal('300'), Decimal('50'), status='draft')
+
+        with self.assertNumQueries(1):
+            trend = daily_sales_trend(days=7)
+        self.assertEqual(len(trend), 7)
+        self.assertEqual(trend[0]['date'], timezone.localdate() - datetime.timedelta(days=6))
+        today = trend[-1]
+        self.assertEqual(today['count'], 2)
+        self.assertEqual(today['sales'], inv1.grand_total + inv2.grand_total)
+        self.assertEqual(today['profit'], inv1.total_profit + inv2.total_profit)
+        self.assertEqual(trend[0]['sales'], Decimal('0'))
+
+    def test_cost_and_profit_are_persisted(self):
+        invoice = self._sell("S-4", Decimal('10'), Decimal('3000'), Decimal('500'), Decimal('200'))
+        line = invoice.items.get()
+        self.assertEqual(line.line_cost, Decimal('30200.00'))
+        self.assertEqual(line.line_profit, Decimal('300.00'))
+        self.assertEqual(invoice.total_cost, Decimal('30200.00'))
+        self.assertEqual(invoice.total_profit, Decimal('300.00'))
+
+    def test_backfill_command(self):
+        from django.core.management import call_command
+        from io import StringIO
+        invoice = self._sell("S-5", Decimal('5'), Decimal('3000'), Decimal('300'), Decimal('50'))
+        InvoiceItem.objects.update(line_cost=0, line_profit=0)
+        Invoice.objects.update(total_cost=0, total_profit=0)
+
+        call_command('backfill_invoice_costs', stdout=StringIO())
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.total_cost, Decimal('15050.00'))
+        self.assertEqual(invoice.total_profit, Decimal('250.00'))
+        self.assertEqual(invoice.items.get().line_profit, Decimal('250.00'))
+
+
+class ProfitabilityReportTests(InvoiceFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self._sell("P-1", Decimal('10'), Decimal('3000'), Decimal('500'), Decimal('200'))
+        self._sell("P-2", Decimal('5'), Decimal('3000'), Decimal('300'), Decimal('50'))
+
+    def test_rankings_are_aggregated(self):
+        from django.urls import reverse
+        response = self.client.get(reverse('sales:profitability_report'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_profit'], Decimal('550'))
+        names = [name for name, stats in response.context['ranked_items']]
+        self.assertEqual(names, ["Ring (B-P-1)", "Ring (B-P-2)"])
+        self.assertEqual(response.context['ranked_categories'][0][1]['profit'], Decimal('550'))
+
+    def test_csv_export_streams_full_ranking(self):
+        from django.urls import reverse
+        response = self.client.get(reverse('sales:profitability_report'), {'export': 'csv'})
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(content[0], 'Rank,Item,Barcode,Qty,Sales,Profit')
+        self.assertEqual(len(content), 3)
+        self.assertTrue(content[1].startswith('1,Ring,B-P-1,1,'))
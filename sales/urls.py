@@ -27,5 +27,6 @@ urlpatterns = [
     # Reservation Feature
     path('reservation/', views.reservation_view, name='reservation_page'),
     path('api/item-by-barcode/<str:barcode>/', api_views.ItemDetailByBarcodeView.as_view(), name='api-item-barcode'),
+    path('api/items/lookup/', api_views.ItemBatchLookupView.as_view(), name='api-item-lookup'),
     path('api/reserve/', api_views.CreateReservationView.as_view(), name='api-reserve'),
 ]
@@ -65,8 +65,11 @@ def profitability_report(request):
     """
     from .models import InvoiceItem, Invoice
     from inventory.models import Category
-    from django.db.models import Sum, F, ExpressionWrapper, DecimalField
+    from django.db.models import Sum, Count
+    from django.db.models.functions import Coalesce
+    from django.core.paginator import Paginator
     from django.utils import timezone
+    from decimal import Decimal
     import datetime
 
     # 1. Advanced Filtering
@@ -100,44 +103,49 @@ def profitability_report(request):
     if sales_rep_id:
         invoices = invoices.filter(sales_rep_id=sales_rep_id)
         
-    invoice_items = InvoiceItem.objects.filter(invoice__in=invoices).select_related('item', 'item__category')
+    invoice_items = InvoiceItem.objects.filter(invoice__in=invoices)
     
     # Apply Item Filters
     if category_id:
         invoice_items = invoice_items.filter(item__category_id=category_id)
 
-    # Re-evaluate invoices based on filtered items if category is selected
-    if category_id:
-        invoices = invoices.filter(items__item__category_id=category_id).distinct()
-
-    # 2. Key Metrics
-    total_sales = sum(item.subtotal for item in invoice_items)
-    total_profit = sum(item.profit for item in invoice_items)
+    # 2. Key Metrics (aggregated in the database from the stored line profit)
+    totals = invoice_items.aggregate(
+        sales=Coalesce(Sum('subtotal'), Decimal('0')),
+        profit=Coalesce(Sum('line_profit'), Decimal('0')),
+    )
+    total_sales = totals['sales']
+    total_profit = totals['profit']
     total_cost = float(total_sales) - float(total_profit)
     margin_pct = (float(total_profit) / float(total_sales) * 100) if total_sales > 0 else 0
 
-    # 3. Item Ranking
-    item_stats = {}
-    for item in invoice_items:
-        key = f"{item.item.name} ({item.item.barcode})"
-        if key not in item_stats:
-            item_stats[key] = {'sales': 0, 'profit': 0, 'qty': 0}
-        item_stats[key]['sales'] += float(item.subtotal)
-        item_stats[key]['profit'] += float(item.profit)
-        item_stats[key]['qty'] += 1
-
-    ranked_items = sorted(item_stats.items(), key=lambda x: x[1]['profit'], reverse=True)
+    # 3. Item Ranking (grouped + ordered in SQL)
+    item_ranking = invoice_items.values('item_id', 'item__name', 'item__barcode').annotate(
+        qty=Count('id'),
+        sales=Sum('subtotal'),
+        profit=Sum('line_profit'),
+    ).order_by('-profit', 'item_id')
+
+    if request.GET.get('export') == 'csv':
+        return _stream_item_ranking_csv(item_ranking, start_date, end_date)
+
+    items_page = Paginator(item_ranking, 20).get_page(request.GET.get('page'))
+    filter_query = request.GET.copy()  # keep filters on pagination / export links
+    filter_query.pop('page', None)
+    filter_query.pop('export', None)
+    ranked_items = [
+        (f"{row['item__name']} ({row['item__barcode']})", {'sales': row['sales'], 'profit': row['profit'], 'qty': row['qty']})
+        for row in items_page
+    ]
 
     # 4. Category Ranking
-    category_stats = {}
-    for item in invoice_items:
-        cat_name = item.item.category.name if item.item.category else "Other"
-        if cat_name not in category_stats:
-            category_stats[cat_name] = {'sales': 0, 'profit': 0}
-        category_stats[cat_name]['sales'] += float(item.subtotal)
-        category_stats[cat_name]['profit'] += float(item.profit)
-
-    ranked_categories = sorted(category_stats.items(), key=lambda x: x[1]['profit'], reverse=True)
+    ranked_categories = [
+        (row['item__category__name'] or "Other", {'sales': row['sales'], 'profit': row['profit']})
+        for row in invoice_items.values('item__category__name').annotate(
+            sales=Sum('subtotal'),
+            profit=Sum('line_profit'),
+        ).order_by('-profit')
+    ]
 
     # 5. Metadata for Filter Dropdowns
     from inventory.models import Branch as InvBranch
@@ -148,7 +156,9 @@ def profitability_report(request):
         'total_profit': total_profit,
         'total_cost': total_cost,
         'margin_pct': margin_pct,
-        'ranked_items': ranked_items[:20],
+        'ranked_items': ranked_items,
+        'items_page': items_page,
+        'filter_query': filter_query.urlencode(),
         'ranked_categories': ranked_categories,
         'start_date': start_date,
         'end_date': end_date,
@@ -163,3 +173,27 @@ def profitability_report(request):
 
 
     return render(request, 'sales/profitability_report.html', context)
+
+
+class _Echo:
+    """File-like object that just returns what is written (for streaming CSV)."""
+    def write(self, value):
+        return value
+
+
+def _stream_item_ranking_csv(item_ranking, start_date, end_date):
+    """تصدير ترتيب الأصناف كاملاً كملف CSV بشكل متدفق دون تحميل كل الصفوف في الذاكرة"""
+    import csv
+    from django.http import StreamingHttpResponse
+
+    writer = csv.writer(_Echo())
+
+    def rows():
+        yield '\ufeff'  # BOM so Excel opens Arabic text correctly
+        yield writer.writerow(['Rank', 'Item', 'Barcode', 'Qty', 'Sales', 'Profit'])
+        for rank, row in enumerate(item_ranking.iterator(chunk_size=2000), start=1):
+            yield writer.writerow([rank, row['item__name'], row['item__barcode'], row['qty'], row['sales'], row['profit']])
+
+    response = StreamingHttpResponse(rows(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="profitability_{start_date}_{end_date}.csv"'
+    return response